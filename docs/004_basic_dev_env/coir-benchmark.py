@@ -1,51 +1,168 @@
+import os
+import json
 import logging
 import asyncio
+import hashlib
+import random
 import httpx
 import numpy as np
 from coir.evaluation import COIR
 from coir.data_loader import get_tasks
 
 PROXY_URL = "http://127.0.0.1:1335/v1/embeddings"
+MODELS_URL = "http://127.0.0.1:1335/v1/models"
 MODEL_ID = "jina-code-embeddings"
+CORPUS_CONCURRENCY = 8 # Corpus batches in flight; the proxy splits and pipelines each one to TEI
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Embeddings already fetched are reused across runs; set to "" to always go through the proxy.
+# ~/.cache is the volume run-coir-benchmark.sh already mounts, so the store survives containers.
+EMBEDDING_STORE_DIR = os.environ.get("COIR_EMBEDDING_STORE", os.path.expanduser(f"~/.cache/coir-embedding-store/{MODEL_ID}"))
+# Embedded on every run and compared with the one saved in meta.json, so a store filled by a different
+# model, prefix or quantization behind the same MODEL_ID is never mixed into the results
+FINGERPRINT_PROBE = "def fingerprint(store):\n    return store.probe()"
+FINGERPRINT_MIN_COSINE = 0.999
+
+class EmbeddingStore:
+    # Append-only and content-addressed: row i of vectors.f32 belongs to key i of keys.bin. Vectors are
+    # flushed before their keys, so an interrupted run leaves at most a few orphan rows, trimmed on open.
+    KEY_SIZE = 16
+
+    def __init__(self, path, fingerprint):
+        os.makedirs(path, exist_ok=True)
+        self.keys_path = os.path.join(path, "keys.bin")
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.fingerprint = fingerprint
+        self.dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if not self.same_fingerprint(meta.get("fingerprint"), fingerprint):
+                raise RuntimeError(
+                    f"Embedding store {path} was filled by a different model or proxy setup than the one "
+                    f"serving now. Delete it or set COIR_EMBEDDING_STORE to another directory."
+                )
+            self.dim = meta["dim"]
+
+        raw_keys = b""
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                raw_keys = f.read()
+        count = len(raw_keys) // self.KEY_SIZE
+        if self.dim is None:
+            count = 0
+        elif os.path.exists(self.vectors_path):
+            count = min(count, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        else:
+            count = 0
+
+        self.rows = {raw_keys[i * self.KEY_SIZE : (i + 1) * self.KEY_SIZE]: i for i in range(count)}
+        self.count = count
+        self._keys_file = open(self.keys_path, "ab")
+        self._vectors_file = open(self.vectors_path, "ab")
+        self._keys_file.truncate(count * self.KEY_SIZE)
+        self._vectors_file.truncate(count * 4 * (self.dim or 0))
+        self._mapped = None
+        if count:
+            print(f"📦 Embedding store {path}: {count} vectors (dim {self.dim})")
+
+    @staticmethod
+    def same_fingerprint(stored, current):
+        # Exact float equality is too strict: batching and GPU kernels move the last bits between runs
+        if not stored or stored["models"] != current["models"] or len(stored["probe"]) != len(current["probe"]):
+            return False
+        a = np.asarray(stored["probe"], dtype=np.float64)
+        b = np.asarray(current["probe"], dtype=np.float64)
+        return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b))) >= FINGERPRINT_MIN_COSINE
+
+    @staticmethod
+    def key(kind, text):
+        # kind matters: the proxy embeds queries and passages with different prefixes
+        return hashlib.blake2b(f"{MODEL_ID}\0{kind}\0{text}".encode(), digest_size=16).digest()
+
+    def lookup(self, keys):
+        return np.fromiter((self.rows.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+
+    def get(self, rows):
+        if self._mapped is None or self._mapped.shape[0] < self.count:
+            self._mapped = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        return np.asarray(self._mapped[rows])
+
+    def put(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.meta_path, "w") as f:
+                json.dump({"dim": self.dim, "dtype": "float32", "model": MODEL_ID, "fingerprint": self.fingerprint}, f)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding store holds dim {self.dim}, got {vectors.shape[1]}")
+
+        self._vectors_file.write(vectors.tobytes())
+        self._vectors_file.flush()
+        self._keys_file.write(b"".join(keys))
+        self._keys_file.flush()
+        for i, key in enumerate(keys):
+            self.rows[key] = self.count + i
+        self.count += len(keys)
 
 class ProxyModel:
-    def __init__(self, model_name="local-proxy"):
+    def __init__(self, model_name="local-proxy", store_path=EMBEDDING_STORE_DIR):
         self.model_name = model_name
         self.limits = httpx.Limits(max_keepalive_connections=50, max_connections=1000)
         self.timeout = httpx.Timeout(360.0, connect=10.0) 
+        self.store = EmbeddingStore(store_path, asyncio.run(self._fingerprint())) if store_path else None
+
+    async def _fingerprint(self):
+        # What the proxy says it serves, plus what it actually returns for a fixed input
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            response = await client.get(MODELS_URL)
+            response.raise_for_status()
+            data = await self._post_with_retries(client, {"input": FINGERPRINT_PROBE, "model": MODEL_ID}, "Fingerprint probe")
+        return {"models": sorted(model["id"] for model in response.json()["data"]), "probe": data[0]["embedding"]}
+
+    async def _post_with_retries(self, client, payload, label, retries=5):
+        # Full jitter, so a burst of failed batches doesn't come back in lockstep
+        for attempt in range(retries):
+            try:
+                response = await client.post(PROXY_URL, json=payload)
+                response.raise_for_status()
+                return response.json()["data"]
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in RETRYABLE_STATUS:
+                    raise
+                error = e
+            except httpx.TransportError as e:
+                error = e
+            if attempt < retries - 1:
+                wait_time = random.uniform(0, min(30.0, 1.0 * (2 ** attempt)))
+                if attempt > 1:
+                    print(f"\n{label}: {error!r}. Retry {attempt + 1} in {wait_time:.1f}s...")
+                await asyncio.sleep(wait_time)
+        raise error
 
     async def _send_single_async(self, client, text, index, semaphore, delay=0.0):
         if delay > 0:
             await asyncio.sleep(delay)
 
         async with semaphore: 
-            retries = 5
-            for attempt in range(retries):
-                try:
-                    response = await client.post(
-                        PROXY_URL,
-                        json={"input": text, "model": MODEL_ID},
-                    )
-                    response.raise_for_status()
-                    data = response.json()["data"][0]["embedding"]
-                    return index, data
-                
-                except httpx.HTTPStatusError as e:
-                    if e.response.status_code in [500, 502, 503, 504]:
-                        wait_time = 1.0 * (2 ** attempt)
-                        if attempt > 1: 
-                            print(f"\n500 Error on query {index}. Retry {attempt}...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        print(f"\nFatal Error on query {index}: {e}")
-                        return index, np.zeros(768)
-                except Exception as e:
-                    return index, np.zeros(768)
-            
-            return index, np.zeros(768)
+            try:
+                data = await self._post_with_retries(client, {"input": text, "model": MODEL_ID}, f"Query {index}")
+                return index, data[0]["embedding"]
+            except Exception as e:
+                print(f"\nFatal Error on query {index}: {e!r}")
+                return index, None
 
     def encode_queries(self, queries, batch_size=100, **kwargs):
+        all_queries = queries
+        keys = [EmbeddingStore.key("query", q) for q in all_queries] if self.store else None
+        rows = self.store.lookup(keys) if self.store else np.full(len(all_queries), -1)
+        missing = np.flatnonzero(rows < 0)
+        queries = [all_queries[i] for i in missing]
+        if len(missing) < len(all_queries):
+            print(f"   {len(all_queries) - len(missing)} queries already in the embedding store")
+        if not queries:
+            return self.store.get(rows)
+
         print(f"Encoding {len(queries)} queries (Ramping up to {batch_size} concurrent)...")
         
         async def run_all():
@@ -69,6 +186,8 @@ class ProxyModel:
                 for i, coro in enumerate(asyncio.as_completed(tasks)):
                     res = await coro
                     results.append(res)
+                    if self.store and res[1] is not None:
+                        self.store.put([keys[missing[res[0]]]], [res[1]])
                     if i % 50 == 0 or i == len(queries) - 1:
                         print(f"   Query {i+1}/{len(queries)}...", end="\r")
 
@@ -76,55 +195,92 @@ class ProxyModel:
 
         raw_results = asyncio.run(run_all())
         raw_results.sort(key=lambda x: x[0])
-        return np.array([x[1] for x in raw_results])
+        failed = [index for index, embedding in raw_results if embedding is None]
+        if failed:
+            raise RuntimeError(f"{len(failed)}/{len(queries)} queries failed to encode (first: {failed[:10]})")
+        fresh = np.asarray([x[1] for x in raw_results], dtype=np.float32)
+        if len(queries) == len(all_queries):
+            return fresh
+        embeddings = np.empty((len(all_queries), fresh.shape[1]), dtype=np.float32)
+        embeddings[missing] = fresh
+        found = np.flatnonzero(rows >= 0)
+        embeddings[found] = self.store.get(rows[found])
+        return embeddings
 
     def encode_corpus(self, corpus, batch_size=32, **kwargs):
-            if isinstance(corpus[0], dict):
-                texts = [doc.get("text", "") + " " + doc.get("title", "") for doc in corpus]
-            else:
-                texts = corpus
-
-            embeddings = []
-            print(f"📚 Encoding {len(texts)} docs (Batch Size: {batch_size})...")
-
-            with httpx.Client(timeout=self.timeout, limits=self.limits) as client:
-                for i in range(0, len(texts), batch_size):
-                    batch = texts[i : i + batch_size]
-                    retries = 3
-                    success = False
-                    
-                    for attempt in range(retries):
-                        try:
-                            response = client.post(
-                                PROXY_URL,
-                                json={"input": list(batch), "model": MODEL_ID}
-                            )
-                            response.raise_for_status()
-                            data = response.json()["data"]
-                            embeddings.extend([item["embedding"] for item in data])
-                            success = True
-                            break
-                        
-                        except httpx.HTTPStatusError as e:
-                            if e.response.status_code in [500, 502, 503, 504]:
-                                wait_time = 2.0 * (2 ** attempt)
-                                print(f"\nBatch {i} hit Server Error. Retrying in {wait_time}s...", end="")
-                                import time; time.sleep(wait_time)
-                            else:
-                                print(f"\nFatal Error in batch {i}: {e}")
-                                break
-                        except Exception as e:
-                            print(f"\nNetwork glitch in batch {i}: {e}. Retrying...")
-                            import time; time.sleep(1)
-
-                    if not success:
-                        print(f"\nSKIPPING BATCH {i} (All retries failed).")
-                        embeddings.extend([np.zeros(768).tolist() for _ in batch])
-                    
-                    print(f"   Doc {len(embeddings)}/{len(texts)}...", end="\r")
+        if isinstance(corpus[0], dict):
+            texts = [doc.get("text", "") + " " + doc.get("title", "") for doc in corpus]
+        else:
+            texts = corpus
+
+        # Only docs missing from the store go to the proxy; each finished batch is stored right away,
+        # so an interrupted run picks up where it stopped
+        keys = [EmbeddingStore.key("passage", t) for t in texts] if self.store else None
+        rows = self.store.lookup(keys) if self.store else np.full(len(texts), -1)
+        missing = np.flatnonzero(rows < 0)
+        if len(missing) < len(texts):
+            print(f"   {len(texts) - len(missing)} docs already in the embedding store")
+        if len(missing) == 0:
+            return self.store.get(rows)
+
+        def store_batch(start, vectors):
+            self.store.put([keys[i] for i in missing[start : start + len(vectors)]], vectors)
+
+        print(f"📚 Encoding {len(missing)} docs (Batch Size: {batch_size}, {CORPUS_CONCURRENCY} in flight)...")
+        fresh = asyncio.run(self._encode_corpus_async(
+            [texts[i] for i in missing], batch_size, CORPUS_CONCURRENCY, store_batch if self.store else None
+        ))
+        print("\nFinished encoding corpus.")
+        if len(missing) == len(texts):
+            return fresh
+
+        embeddings = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+        embeddings[missing] = fresh
+        found = np.flatnonzero(rows >= 0)
+        embeddings[found] = self.store.get(rows[found])
+        return embeddings
+
+    async def _encode_corpus_async(self, texts, batch_size, concurrency, on_batch=None):
+        # Batches finish out of order; each one is written into its own rows of a single float32 array,
+        # allocated once the first response tells us the dimension
+        sem = asyncio.Semaphore(concurrency)
+        embeddings = None
+        failed = []
+        done = 0
+
+        async with httpx.AsyncClient(limits=self.limits, timeout=self.timeout) as client:
+            async def encode_batch(start):
+                nonlocal embeddings, done
+                batch = list(texts[start : start + batch_size])
+                async with sem:
+                    try:
+                        data = await self._post_with_retries(client, {"input": batch, "model": MODEL_ID}, f"Batch {start}")
+                    except Exception as e:
+                        failed.append((start, len(batch), repr(e)))
+                        print(f"\nBatch {start} failed after retries: {e!r}")
+                        return
+
+                data.sort(key=lambda item: item["index"])
+                vectors = np.asarray([item["embedding"] for item in data], dtype=np.float32)
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+                if vectors.shape != (len(batch), embeddings.shape[1]):
+                    failed.append((start, len(batch), f"got shape {vectors.shape}"))
+                    return
+                embeddings[start : start + len(batch)] = vectors
+                if on_batch is not None:
+                    on_batch(start, vectors)
+                done += len(batch)
+                print(f"   Doc {done}/{len(texts)}...", end="\r")
+
+            await asyncio.gather(*(encode_batch(start) for start in range(0, len(texts), batch_size)))
 
-            print("\nFinished encoding corpus.")
-            return np.array(embeddings)
+        if failed:
+            failed.sort()
+            docs = sum(size for _, size, _ in failed)
+            details = "; ".join(f"docs {start}-{start + size - 1}: {error}" for start, size, error in failed[:5])
+            raise RuntimeError(f"{len(failed)} corpus batches ({docs} docs) failed to encode. {details}")
+        return embeddings
 
 if __name__ == "__main__":
     print("Starting CoIR Eval via Proxy (Final Robust Config)...")
@@ -11,6 +11,7 @@ echo $HF_HUB_CACHE
 REQUIRED_MODELS=(
   "model/NVFP4/Qwen3-Coder-30B-A3B-Instruct-FP4"
   "model/jinaai/jina-code-embeddings-0.5b"
+  "model/cross-encoder/ms-marco-MiniLM-L-6-v2"
 )
 
 function ensure_required_models() {
@@ -51,4 +52,8 @@ function get_snapshot_dir() {
 
 for model in "${REQUIRED_MODELS[@]}"; do
   get_snapshot_dir "$model"
+  # The CPU reranker fallback runs with HF_HUB_OFFLINE=1, so compose pins it to the cached snapshot
+  if [ "$model" = "model/cross-encoder/ms-marco-MiniLM-L-6-v2" ]; then
+    echo "RERANK_CPU_MODEL_REVISION=$(basename "$SNAPSHOT_DIR")" >> .env
+  fi
 done
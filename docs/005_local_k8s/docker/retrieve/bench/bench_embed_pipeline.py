@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+
+os.environ.setdefault("TEI_BASE_URL", "http://tei")
+os.environ.setdefault("VECTOR_DB_BASE_URL", "http://qdrant")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import manager
+from fakes import create_fake_tei
+
+
+async def run(batches: int, in_flight: int, latency_ms: float, per_item_us: float, fail_rate: float, dim: int) -> dict:
+    tei = create_fake_tei(latency_ms=latency_ms, per_item_us=per_item_us, dim=dim, fail_rate=fail_rate)
+    manager.http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=tei), base_url=manager.TEI_BASE_URL)
+    manager.embedding_cache.max_size = 0
+    manager.embed_in_flight = asyncio.Semaphore(in_flight)
+    manager.embed_bytes_budget = manager.ByteBudget(manager.EMBED_MAX_INFLIGHT_BYTES)
+
+    texts = [f"def handler_{i}(request):\n    return process(request, {i})\n" * 4 for i in range(batches * manager.EMBED_BATCH_SIZE)]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://manager", timeout=300) as client:
+        start = time.perf_counter()
+        resp = await client.post("/v1/embeddings", json={"input": texts})
+        elapsed = time.perf_counter() - start
+    await manager.http_client.aclose()
+
+    return {
+        "batches": batches,
+        "in_flight": in_flight,
+        "status": resp.status_code,
+        "seconds": elapsed,
+        "items_per_s": len(texts) / elapsed,
+        "tei_calls": tei.state.calls,
+        "tei_failures": tei.state.failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs pipelined /embed batches against a stub TEI")
+    parser.add_argument("--batches", default="1,4,16,32")
+    parser.add_argument("--in-flight", default="1,2,4,8")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Per-call latency the stub pays concurrently")
+    parser.add_argument("--per-item-us", type=float, default=200.0, help="Per-input cost the stub pays serially")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of stub calls that answer 503")
+    parser.add_argument("--dim", type=int, default=128, help="Small by default so JSON cost doesn't hide the round-trips")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    rows = []
+    for batches in (int(b) for b in args.batches.split(",")):
+        baseline = None
+        for in_flight in (int(n) for n in args.in_flight.split(",")):
+            row = asyncio.run(run(batches, in_flight, args.latency_ms, args.per_item_us, args.fail_rate, args.dim))
+            baseline = baseline or row["seconds"]
+            row["speedup"] = baseline / row["seconds"]
+            rows.append(row)
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+        return
+    print(f"{'batches':>8} {'in-flight':>9} {'status':>6} {'seconds':>8} {'items/s':>9} {'speedup':>8} {'calls':>6} {'fails':>6}")
+    for r in rows:
+        print(f"{r['batches']:>8} {r['in_flight']:>9} {r['status']:>6} {r['seconds']:>8.3f} {r['items_per_s']:>9.0f} {r['speedup']:>7.2f}x {r['tei_calls']:>6} {r['tei_failures']:>6}")
+
+
+if __name__ == "__main__":
+    main()
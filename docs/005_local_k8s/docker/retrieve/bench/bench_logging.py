@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+import json
+import asyncio
+import logging
+import argparse
+import threading
+
+os.environ.setdefault("TEI_BASE_URL", "http://127.0.0.1:1336")
+os.environ.setdefault("VECTOR_DB_BASE_URL", "http://127.0.0.1:6333")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import manager
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class SlowSink:
+    # A pipe drained at a fixed rate, like stdout behind a busy container log driver. Once the pipe
+    # buffer fills, every write blocks until the reader catches up.
+    def __init__(self, bytes_per_s: float):
+        self.read_fd, self.write_fd = os.pipe()
+        self.stream = os.fdopen(self.write_fd, "w", buffering=1)
+        self.chunk = 4096
+        self.pause = self.chunk / bytes_per_s
+        self.received = 0
+        self.reader = threading.Thread(target=self._drain, daemon=True)
+        self.reader.start()
+
+    def _drain(self):
+        while True:
+            data = os.read(self.read_fd, self.chunk)
+            if not data:
+                return
+            self.received += len(data)
+            time.sleep(self.pause)
+
+    def close(self):
+        self.stream.close()
+        self.reader.join()
+        os.close(self.read_fd)
+
+
+async def search_request(i: int, sampler: manager.LogSampler, upstream: float) -> None:
+    # The info lines one proxied search emits, with the same keys manager.py samples them under.
+    # The sleeps stand in for the Qdrant and rerank round-trips.
+    sampler.info("search", "Search: %s", "bench")
+    sampler.info("search_request", "Request received. Limit %s, Score Threshold: %s", 10, None)
+    await asyncio.sleep(upstream)
+    sampler.info("correlated", "Correlated query: %s...", f"find the handler that parses request {i}"[:50])
+    sampler.info("rerank", "Reranking %s candidates across %s queries (%s cached)", 20, 1, 0)
+    await asyncio.sleep(upstream)
+    sampler.info("rerank_depth", "Rerank depth: requested %s, reranked %s, returned %s", 20, 20, 10)
+    sampler.info("proxy_status", "[%s] -> Status: %s", f"{i:06d}", 200)
+
+
+async def monitor(interval: float, lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def run_load(requests: int, concurrency: int, upstream: float, sampler: manager.LogSampler) -> tuple[float, list[float]]:
+    lags = []
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(monitor(0.001, lags, stop))
+    issued = 0
+
+    async def worker():
+        nonlocal issued
+        while issued < requests:
+            issued += 1
+            await search_request(issued, sampler, upstream)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await watcher
+    return elapsed, lags
+
+
+def run(mode: str, sample_every: int, args) -> dict:
+    sink = SlowSink(args.drain_kb_per_s * 1024)
+    handler, listener = manager.create_log_handler(sink.stream, mode == "queue", args.queue_size)
+    root = logging.getLogger()
+    root.handlers = [handler]
+    if listener is not None:
+        listener.start()
+
+    elapsed, lags = asyncio.run(run_load(args.requests, args.concurrency, args.upstream_ms / 1000, manager.LogSampler(sample_every)))
+    # Queued lines still have to reach the sink; report that separately from the time the loop saw
+    drain_started = time.perf_counter()
+    if listener is not None:
+        listener.stop()
+    root.handlers = []
+    sink.close()
+    return {
+        "mode": mode,
+        "sample_every": sample_every,
+        "requests_per_s": args.requests / elapsed,
+        "stall_ms": sum(lags) * 1000,
+        "lag_p99_ms": percentile(lags, 99) * 1000,
+        "lag_max_ms": max(lags) * 1000,
+        "drain_s": time.perf_counter() - drain_started,
+        "log_kb": sink.received / 1024,
+        "dropped": getattr(handler, "dropped", 0),
+    }
+
+
+def disabled_cost(iterations: int) -> dict:
+    # What a filtered-out debug line costs with each style. f-strings render before the level check.
+    query_text = "find the handler that parses the request body and validates the schema " * 2
+    hits, misses = 1234, 56
+    logger = logging.getLogger("bench.disabled")
+    logger.setLevel(logging.INFO)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        logger.debug(f"Cached query: {query_text[:50]}... (hits: {hits}, misses: {misses})")
+    fstring = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(iterations):
+        logger.debug("Cached query: %s... (hits: %s, misses: %s)", query_text[:50], hits, misses)
+    lazy = time.perf_counter() - started
+    return {"fstring_ns": fstring / iterations * 1e9, "lazy_ns": lazy / iterations * 1e9}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-loop stall from search-path logging, sync vs queued handler")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--upstream-ms", type=float, default=2.0, help="Simulated await per upstream call, two per request")
+    parser.add_argument("--sample-every", default="1,10", help="LOG_SAMPLE_EVERY values to try")
+    parser.add_argument("--drain-kb-per-s", type=float, default=512, help="How fast the fake stdout consumer reads")
+    parser.add_argument("--queue-size", type=int, default=manager.LOG_QUEUE_SIZE, help="LOG_QUEUE_SIZE for the queued handler")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    rows = [run(mode, int(n), args) for n in args.sample_every.split(",") for mode in ("sync", "queue")]
+    disabled = disabled_cost(200000)
+
+    if args.json:
+        print(json.dumps({"runs": rows, "disabled_debug": disabled}))
+        return
+    print(f"{'mode':>6} {'sample':>6} {'req/s':>8} {'stall ms':>9} {'lag p99':>8} {'lag max':>8} {'drain s':>8} {'log KB':>8} {'dropped':>8}")
+    for r in rows:
+        print(f"{r['mode']:>6} {r['sample_every']:>6} {r['requests_per_s']:>8.0f} {r['stall_ms']:>9.1f} {r['lag_p99_ms']:>8.2f} {r['lag_max_ms']:>8.2f} {r['drain_s']:>8.2f} {r['log_kb']:>8.0f} {r['dropped']:>8}")
+    print(f"disabled debug line: f-string {disabled['fstring_ns']:.0f} ns, lazy {disabled['lazy_ns']:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import logging
+import argparse
+import subprocess
+import tracemalloc
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+QDRANT_PORT = free_port()
+PROXY_PORT = free_port()
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+os.environ["VECTOR_DB_BASE_URL"] = f"http://127.0.0.1:{QDRANT_PORT}"
+os.environ.setdefault("TEI_BASE_URL", "http://127.0.0.1:1336")
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import httpx
+import uvicorn
+import manager
+
+
+async def wait_ready(url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} never came up")
+
+
+async def measure_rps(client: httpx.AsyncClient, path: str, concurrency: int, seconds: float) -> float:
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            resp = await client.get(path)
+            resp.raise_for_status()
+            done += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return done / (time.perf_counter() - start)
+
+
+async def measure_download(client: httpx.AsyncClient, size_mb: int) -> dict:
+    tracemalloc.start()
+    received = 0
+    start = time.perf_counter()
+    async with client.stream("GET", f"/collections/bench/snapshots/{size_mb}mb.snapshot") as resp:
+        async for chunk in resp.aiter_raw():
+            received += len(chunk)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"size_mb": size_mb, "received_mb": received / 2**20, "peak_traced_mb": peak / 2**20, "mb_per_s": received / 2**20 / elapsed}
+
+
+async def run(args) -> dict:
+    qdrant = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "fakes.py"), "qdrant", "--port", str(QDRANT_PORT), "--latency-ms", "0"])
+    server = None
+    serving = None
+    try:
+        manager.http_client = httpx.AsyncClient(
+            timeout=120.0,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+        )
+        server = uvicorn.Server(uvicorn.Config(manager.app, host="127.0.0.1", port=PROXY_PORT, lifespan="off", log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        await wait_ready(f"http://127.0.0.1:{QDRANT_PORT}/collections/none")
+        await wait_ready(f"http://127.0.0.1:{PROXY_PORT}/collections/none")
+
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PROXY_PORT}", timeout=120.0) as client:
+            await client.put("/collections/bench", json={"vectors": {"size": 4, "distance": "Cosine"}})
+            again = await client.put("/collections/bench", json={"vectors": {"size": 4, "distance": "Cosine"}})
+
+            rps = {c: await measure_rps(client, "/collections/bench", c, args.seconds) for c in args.concurrency}
+            downloads = [await measure_download(client, size) for size in args.sizes]
+
+        return {"recreate_status": again.status_code, "rps": rps, "downloads": downloads}
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await serving
+        if manager.http_client is not None:
+            await manager.http_client.aclose()
+        qdrant.terminate()
+        qdrant.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="catch_all_proxy throughput and memory ceiling against a local fake Qdrant")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--sizes", default="16,64,256", help="Snapshot sizes in MB streamed through the proxy")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.sizes = [int(s) for s in args.sizes.split(",")]
+
+    logging.getLogger("SmartProxy").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f"PUT existing collection -> {result['recreate_status']}")
+    for concurrency, rps in result["rps"].items():
+        print(f"GET /collections/bench  concurrency {concurrency:>3}: {rps:>8.0f} req/s")
+    for d in result["downloads"]:
+        print(f"snapshot {d['size_mb']:>4} MB: received {d['received_mb']:>6.0f} MB, peak traced {d['peak_traced_mb']:>6.2f} MB, {d['mb_per_s']:>6.0f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+os.environ.setdefault("TEI_BASE_URL", "http://127.0.0.1:1336")
+os.environ.setdefault("VECTOR_DB_BASE_URL", "http://127.0.0.1:6333")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from manager import QueryCache, RedisCorrelationStore, SharedMemoryCorrelationStore
+from fakes import FakeRedis
+
+
+def make_vectors(count: int, dim: int) -> list[list[float]]:
+    rng = random.Random(0)
+    base = [rng.uniform(-1, 1) for _ in range(dim)]
+    # Vectors share the first 32 dims on purpose: the old prefix hash collided on all of these
+    return [base[:32] + [rng.uniform(-1, 1) for _ in range(dim - 32)] for _ in range(count)]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_store(backend: str, size: int, ttl: float):
+    if backend == "shm":
+        return SharedMemoryCorrelationStore(f"bench-correlation-{os.getpid()}", size, ttl)
+    if backend == "redis-fake":
+        return RedisCorrelationStore(FakeRedis(), ttl)
+    return None
+
+
+async def close_store(cache: QueryCache) -> None:
+    await cache.backend.close()
+    if isinstance(cache.backend, SharedMemoryCorrelationStore):
+        cache.backend.unlink()
+
+
+async def run(backend: str, size: int, dim: int, lookups: int) -> dict:
+    cache = QueryCache(max_size=size, ttl_seconds=3600, store=make_store(backend, size, 3600))
+    vectors = make_vectors(size, dim)
+
+    start = time.perf_counter()
+    for i, vec in enumerate(vectors):
+        await cache.store(vec, f"query {i}")
+    store_s = time.perf_counter() - start
+
+    rng = random.Random(1)
+    latencies = []
+    wrong = 0
+    for _ in range(lookups):
+        i = rng.randrange(size)
+        t0 = time.perf_counter()
+        text = await cache.get(vectors[i])
+        latencies.append(time.perf_counter() - t0)
+        wrong += text != f"query {i}"
+
+    # Churn past capacity with a short TTL to exercise expiry + LRU eviction together
+    await close_store(cache)
+    churn = QueryCache(max_size=size, ttl_seconds=0.05, store=make_store(backend, size, 0.05))
+    t0 = time.perf_counter()
+    for i in range(size * 2):
+        await churn.store(vectors[i % size], f"query {i}")
+    churn_s = time.perf_counter() - t0
+    await close_store(churn)
+
+    return {
+        "entries": size,
+        "store_us": store_s / size * 1e6,
+        "get_p50_us": percentile(latencies, 50) * 1e6,
+        "get_p99_us": percentile(latencies, 99) * 1e6,
+        "churn_store_us": churn_s / (size * 2) * 1e6,
+        "wrong": wrong,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QueryCache micro-benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--dim", type=int, default=896)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--backend", choices=["memory", "shm", "redis-fake"], default="memory")
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'store us':>9} {'get p50':>9} {'get p99':>9} {'churn us':>9} {'wrong':>6}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        r = asyncio.run(run(args.backend, size, args.dim, args.lookups))
+        print(f"{r['entries']:>8} {r['store_us']:>9.2f} {r['get_p50_us']:>9.2f} {r['get_p99_us']:>9.2f} {r['churn_store_us']:>9.2f} {r['wrong']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import argparse
+
+os.environ.setdefault("TEI_BASE_URL", "http://127.0.0.1:1336")
+os.environ.setdefault("VECTOR_DB_BASE_URL", "http://127.0.0.1:6333")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import manager
+from fastapi.concurrency import run_in_threadpool
+from fakes import FakeReranker, SequentialFakeReranker
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_job(rng: random.Random, candidates: int) -> tuple[str, list[str]]:
+    words = ["parse", "config", "token", "cache", "vector", "search", "index", "async", "batch", "client"]
+    query = " ".join(rng.choices(words, k=4))
+    docs = [f"def {rng.choice(words)}_{i}():\n    return " + " ".join(rng.choices(words, k=40)) for i in range(candidates)]
+    return query, docs
+
+
+async def run(mode: str, backend: str, concurrency: int, requests: int, window_ms: float, candidates: int) -> dict:
+    # "sequential" has no fused rerank_batch, like the production CUDA backend
+    manager.model = FakeReranker() if backend == "fused" else SequentialFakeReranker()
+    batcher = manager.RerankBatcher(manager.run_rerank_batch_sync, window_ms=window_ms, max_queue=10000, fused=manager.model_fuses_batches)
+    batcher.start()
+    rng = random.Random(0)
+    jobs = [make_job(rng, candidates) for _ in range(requests)]
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(query, docs):
+        async with sem:
+            t0 = time.perf_counter()
+            if mode == "batched":
+                await batcher.submit(query, docs)
+            else:
+                await run_in_threadpool(manager.run_rerank_sync, query, docs)
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q, d) for q, d in jobs))
+    elapsed = time.perf_counter() - start
+    stats = await batcher.stats()
+    await batcher.stop()
+    return {
+        "mode": mode,
+        "backend": backend,
+        "concurrency": concurrency,
+        "window_ms": window_ms if mode == "batched" else None,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "model_calls": manager.model.calls,
+        "avg_batch_size": stats["avg_batch_size"] if mode == "batched" else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rerank micro-batching latency vs throughput")
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--windows", default="1,2,5,10")
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--candidates", type=int, default=40)
+    parser.add_argument("--backends", default="fused,sequential", help="fused = one call per batch, sequential = one call per job")
+    parser.add_argument("--json", action="store_true", help="One JSON object per line instead of a table")
+    args = parser.parse_args()
+
+    rows = []
+    for backend in args.backends.split(","):
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            rows.append(asyncio.run(run("unbatched", backend, concurrency, args.requests, 0, args.candidates)))
+            for window in (float(w) for w in args.windows.split(",")):
+                rows.append(asyncio.run(run("batched", backend, concurrency, args.requests, window, args.candidates)))
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+        return
+    print(f"{'mode':>10} {'backend':>10} {'conc':>5} {'window':>7} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'calls':>6} {'batch':>6}")
+    for r in rows:
+        window = "-" if r["window_ms"] is None else f"{r['window_ms']:g}"
+        print(f"{r['mode']:>10} {r['backend']:>10} {r['concurrency']:>5} {window:>7} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['model_calls']:>6} {r['avg_batch_size']:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
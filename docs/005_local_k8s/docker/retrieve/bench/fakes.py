@@ -0,0 +1,288 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+_WORD = re.compile(r"\w+")
+
+
+class FakeReranker:
+    # CPU stand-in for jina-reranker-v3. Cost model: a fixed per-call overhead (kernel launches,
+    # host<->device copies) plus a per-token cost, so batching several jobs into one call pays off
+    # the same way it does on the GPU. Calls hold a lock like they would a single device.
+    fused_batch = True
+
+    def __init__(self, overhead_ms: float = 8.0, per_token_us: float = 1.0):
+        self.overhead = overhead_ms / 1000
+        self.per_token = per_token_us / 1e6
+        self.calls = 0
+        self._device = threading.Lock()
+
+    @staticmethod
+    def _score(query: str, document: str) -> float:
+        q = set(_WORD.findall(query.lower()))
+        d = set(_WORD.findall(document.lower()))
+        return len(q & d) / (len(q) + 1)
+
+    def _tokens(self, query: str, documents: list[str]) -> int:
+        return (len(query) + sum(len(d) for d in documents)) // 4
+
+    def _score_job(self, query: str, documents: list[str]) -> list[dict]:
+        results = [{"index": i, "relevance_score": self._score(query, d), "document": d} for i, d in enumerate(documents)]
+        results.sort(key=lambda r: r["relevance_score"], reverse=True)
+        return results
+
+    def rerank(self, query: str, documents: list[str]) -> list[dict]:
+        with self._device:
+            self.calls += 1
+            time.sleep(self.overhead + self._tokens(query, documents) * self.per_token)
+        return self._score_job(query, documents)
+
+    def rerank_batch(self, jobs: list[tuple[str, list[str]]]) -> list[list[dict]]:
+        with self._device:
+            self.calls += 1
+            time.sleep(self.overhead + sum(self._tokens(q, d) for q, d in jobs) * self.per_token)
+        return [self._score_job(q, d) for q, d in jobs]
+
+
+class SequentialFakeReranker(FakeReranker):
+    # Like CudaRerankerBackend: no fused entrypoint, every job pays the per-call overhead on its own
+    fused_batch = False
+
+    def rerank_batch(self, jobs: list[tuple[str, list[str]]]) -> list[list[dict]]:
+        return [self.rerank(q, d) for q, d in jobs]
+
+
+def create_fake_reranker() -> FakeReranker:
+    # RERANK_BACKEND=fakes:create_fake_reranker, with bench/ on sys.path
+    return FakeReranker(
+        overhead_ms=float(os.environ.get("FAKE_RERANK_OVERHEAD_MS", 8)),
+        per_token_us=float(os.environ.get("FAKE_RERANK_PER_TOKEN_US", 1))
+    )
+
+
+class FakeRedis:
+    # The slice of the redis.asyncio client the correlation store uses, with the same bytes replies
+    def __init__(self):
+        self.data: dict[str, tuple[bytes, float | None]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    async def set(self, key: str, value: str, ex: int | None = None) -> bool:
+        self.data[key] = (value.encode(), time.monotonic() + ex if ex else None)
+        return True
+
+    async def aclose(self) -> None:
+        pass
+
+
+def create_fake_redis_store():
+    # CORRELATION_BACKEND=fakes:create_fake_redis_store, with bench/ on sys.path
+    import manager
+    return manager.RedisCorrelationStore(FakeRedis(), manager.CORRELATION_TTL)
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    # Deterministic per text, so cache and correlation behave like they do against the real model
+    return [(b - 127.5) / 127.5 for b in hashlib.shake_128(text.encode()).digest(dim)]
+
+
+def create_fake_tei(latency_ms: float = 20.0, per_item_us: float = 200.0, dim: int = 896, fail_rate: float = 0.0) -> FastAPI:
+    # latency_ms is paid concurrently (network, queueing), per_item_us serially like the GPU forward pass
+    app = FastAPI()
+    device = asyncio.Lock()
+    app.state.calls = 0
+    app.state.failures = 0
+
+    @app.post("/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        inputs = body["inputs"]
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        app.state.calls += 1
+        await asyncio.sleep(latency_ms / 1000)
+        if fail_rate > 0 and random.random() < fail_rate:
+            app.state.failures += 1
+            raise HTTPException(status_code=503, detail="Model is overloaded")
+        async with device:
+            await asyncio.sleep(len(inputs) * per_item_us / 1e6)
+        # Pre-serialized: FastAPI's jsonable_encoder would walk every float and swamp the timings
+        return Response(content=json.dumps([fake_embedding(t, dim) for t in inputs]), media_type="application/json")
+
+    @app.get("/health")
+    async def health():
+        return {}
+
+    return app
+
+
+def _json(content, status_code: int = 200) -> Response:
+    return Response(content=json.dumps(content), status_code=status_code, media_type="application/json")
+
+
+def _ok(result, started: float) -> Response:
+    return _json({"result": result, "status": "ok", "time": time.perf_counter() - started})
+
+
+def create_fake_qdrant(latency_ms: float = 0.0) -> FastAPI:
+    # Just enough of the Qdrant REST API for the proxy: collections, upsert, retrieve, brute-force search
+    # and query (single and batch), scroll and snapshot downloads. Snapshot size comes from the name,
+    # e.g. 64mb.snapshot.
+    app = FastAPI()
+    collections: dict[str, dict] = {}
+    app.state.collections = collections
+
+    def get_collection(name: str) -> dict:
+        if name not in collections:
+            raise HTTPException(status_code=404, detail=f"Collection `{name}` doesn't exist!")
+        return collections[name]
+
+    @app.put("/collections/{name}")
+    async def create_collection(name: str):
+        started = time.perf_counter()
+        if name in collections:
+            return _json({"status": {"error": f"Collection `{name}` already exists!"}}, status_code=409)
+        collections[name] = {}
+        return _ok(True, started)
+
+    @app.get("/collections/{name}")
+    async def collection_info(name: str):
+        started = time.perf_counter()
+        points = get_collection(name)
+        return _ok({"status": "green", "points_count": len(points)}, started)
+
+    @app.delete("/collections/{name}")
+    async def delete_collection(name: str):
+        started = time.perf_counter()
+        return _ok(collections.pop(name, None) is not None, started)
+
+    @app.put("/collections/{name}/points")
+    async def upsert(name: str, request: Request):
+        started = time.perf_counter()
+        points = get_collection(name)
+        body = await request.json()
+        for point in body.get("points", []):
+            vector = point.get("vector")
+            if isinstance(vector, dict):
+                vector = next(iter(vector.values()))
+            points[point["id"]] = (vector, point.get("payload") or {})
+        return _ok({"operation_id": 0, "status": "completed"}, started)
+
+    @app.post("/collections/{name}/points")
+    async def retrieve(name: str, request: Request):
+        started = time.perf_counter()
+        points = get_collection(name)
+        body = await request.json()
+        found = [{"id": i, "payload": points[i][1] if body.get("with_payload") else None} for i in body["ids"] if i in points]
+        return _ok(found, started)
+
+    def run_search(points: dict, vector, body: dict) -> list[dict]:
+        if isinstance(vector, dict):
+            vector = vector.get("vector", vector.get("nearest"))
+        threshold = body.get("score_threshold")
+        scored = []
+        for point_id, (stored, payload) in points.items():
+            score = sum(a * b for a, b in zip(vector, stored))
+            if threshold is None or score >= threshold:
+                scored.append((score, point_id, payload))
+        scored.sort(key=lambda s: s[0], reverse=True)
+        with_payload = body.get("with_payload", False)
+        return [
+            {"id": point_id, "version": 0, "score": score, "payload": payload if with_payload else None}
+            for score, point_id, payload in scored[: body.get("limit", 10)]
+        ]
+
+    @app.post("/collections/{name}/points/search")
+    async def search(name: str, request: Request):
+        started = time.perf_counter()
+        points = get_collection(name)
+        body = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+        return _ok(run_search(points, body.get("vector"), body), started)
+
+    @app.post("/collections/{name}/points/search/batch")
+    async def search_batch(name: str, request: Request):
+        started = time.perf_counter()
+        points = get_collection(name)
+        body = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+        return _ok([run_search(points, search.get("vector"), search) for search in body["searches"]], started)
+
+    @app.post("/collections/{name}/points/query")
+    async def query(name: str, request: Request):
+        started = time.perf_counter()
+        points = get_collection(name)
+        body = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+        return _ok({"points": run_search(points, body.get("query"), body)}, started)
+
+    @app.post("/collections/{name}/points/query/batch")
+    async def query_batch(name: str, request: Request):
+        started = time.perf_counter()
+        points = get_collection(name)
+        body = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+        return _ok([{"points": run_search(points, search.get("query"), search)} for search in body["searches"]], started)
+
+    @app.post("/collections/{name}/points/scroll")
+    async def scroll(name: str, request: Request):
+        started = time.perf_counter()
+        points = get_collection(name)
+        body = await request.json()
+        ids = sorted(points, key=str)
+        offset = ids.index(body["offset"]) if body.get("offset") in points else 0
+        page = ids[offset : offset + body.get("limit", 10)]
+        next_offset = ids[offset + len(page)] if offset + len(page) < len(ids) else None
+        result = {"points": [{"id": i, "payload": points[i][1]} for i in page], "next_page_offset": next_offset}
+        return _ok(result, started)
+
+    @app.get("/collections/{name}/snapshots/{snapshot}")
+    async def download_snapshot(name: str, snapshot: str):
+        size = int(re.match(r"\d+", snapshot).group()) * 1024 * 1024
+        chunk = b"\0" * 65536
+
+        async def body():
+            for _ in range(size // len(chunk)):
+                yield chunk
+
+        return StreamingResponse(body(), media_type="application/octet-stream", headers={"content-length": str(size)})
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the GPU services")
+    parser.add_argument("service", choices=["tei", "qdrant"])
+    parser.add_argument("--port", type=int, default=1336)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--per-item-us", type=float, default=200.0)
+    parser.add_argument("--dim", type=int, default=896)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.service == "tei":
+        app = create_fake_tei(args.latency_ms, args.per_item_us, args.dim, args.fail_rate)
+    else:
+        app = create_fake_qdrant(args.latency_ms)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
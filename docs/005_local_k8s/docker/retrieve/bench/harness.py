@@ -0,0 +1,235 @@
+import os
+import sys
+import time
+import json
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RETRIEVE_DIR = os.path.dirname(BENCH_DIR)
+
+WORDS = [
+    "parse", "config", "load", "user", "session", "token", "cache", "index", "vector", "search", "query",
+    "request", "response", "handler", "retry", "batch", "stream", "upload", "file", "path", "schema",
+    "validate", "error", "logger", "metric", "worker", "queue", "lock", "thread", "socket", "client",
+    "server", "route", "auth", "hash", "encode", "decode", "buffer", "chunk", "limit"
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples: list[float], pct: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_summary(samples: list[float]) -> dict:
+    return {f"p{p}_ms": round(percentile(samples, p) * 1000, 3) if samples else None for p in (50, 90, 99)}
+
+
+def make_corpus(size: int, rng: random.Random) -> list[dict]:
+    # Code-shaped snippets built from a small vocabulary, so queries share terms with the right snippets
+    points = []
+    for i in range(size):
+        name = "_".join(rng.sample(WORDS, 2))
+        body = " ".join(rng.choices(WORDS, k=24))
+        points.append({"file_path": f"src/{rng.choice(WORDS)}/{name}.py", "text": f"def {name}_{i}(request):\n    # {body}\n    return {name}(request)\n"})
+    return points
+
+
+def make_queries(count: int, rng: random.Random) -> list[str]:
+    return [" ".join(rng.sample(WORDS, rng.randint(2, 4))) for _ in range(count)]
+
+
+def memory(pid: int) -> dict:
+    # Linux only: current and peak resident set of the proxy process
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"rss_mb": int(fields["VmRSS"].split()[0]) / 1024, "peak_rss_mb": int(fields["VmHWM"].split()[0]) / 1024}
+    except (OSError, KeyError):
+        return {"rss_mb": None, "peak_rss_mb": None}
+
+
+def start(args: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(args, env=env, cwd=RETRIEVE_DIR, stdout=subprocess.DEVNULL)
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = 60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} never came up")
+
+
+async def seed(client: httpx.AsyncClient, corpus: list[dict], dim: int) -> None:
+    # Same path an indexer takes: passages embedded through the proxy, upserted through the catch-all
+    await client.put("/collections/bench", json={"vectors": {"size": dim, "distance": "Dot"}})
+    for start in range(0, len(corpus), 256):
+        chunk = corpus[start : start + 256]
+        resp = await client.post("/v1/embeddings", json={"input": [p["text"] for p in chunk]})
+        resp.raise_for_status()
+        vectors = [item["embedding"] for item in resp.json()["data"]]
+        points = [{"id": start + i, "vector": v, "payload": p} for i, (v, p) in enumerate(zip(vectors, chunk))]
+        (await client.put("/collections/bench/points", json={"points": points})).raise_for_status()
+
+
+async def replay(client: httpx.AsyncClient, queries: list[str], weights: list[float], concurrency: int, seconds: float, limit: int, rng: random.Random) -> dict:
+    # Each virtual user runs embed -> search back to back, picking queries with a Zipf skew the way
+    # IDE users repeat themselves
+    embed_latencies = []
+    search_latencies = []
+    sequence_latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def user():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            query = rng.choices(queries, weights)[0]
+            started = time.perf_counter()
+            try:
+                resp = await client.post("/v1/embeddings", json={"input": query})
+                resp.raise_for_status()
+                embedded = time.perf_counter()
+                vector = resp.json()["data"][0]["embedding"]
+                resp = await client.post("/collections/bench/points/search", json={"vector": vector, "limit": limit, "with_payload": True})
+                resp.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            finished = time.perf_counter()
+            embed_latencies.append(embedded - started)
+            search_latencies.append(finished - embedded)
+            sequence_latencies.append(finished - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "sequences": len(sequence_latencies),
+        "errors": errors,
+        "sequences_per_s": round(len(sequence_latencies) / elapsed, 2),
+        "embed": latency_summary(embed_latencies),
+        "search": latency_summary(search_latencies),
+        "end_to_end": latency_summary(sequence_latencies)
+    }
+
+
+def hit_rates(stats: dict) -> dict:
+    def rate(section: dict) -> float | None:
+        hits = section.get("hits", 0) + section.get("disk_hits", 0)
+        total = hits + section.get("misses", 0)
+        return round(hits / total, 4) if total else None
+
+    rates = {
+        "correlation": rate(stats),
+        "query_memo": rate(stats.get("query_memo", {})),
+        "embeddings": rate(stats.get("embeddings", {})),
+        "rerank_scores": rate(stats.get("rerank_scores", {}))
+    }
+    for name, flight in stats.get("singleflight", {}).items():
+        rates[f"singleflight_{name}_suppressed"] = round(flight["suppressed_rate"], 4)
+    return rates
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    tei_port, qdrant_port, proxy_port = free_port(), free_port(), free_port()
+    env = dict(
+        os.environ,
+        TEI_BASE_URL=f"http://127.0.0.1:{tei_port}",
+        VECTOR_DB_BASE_URL=f"http://127.0.0.1:{qdrant_port}",
+        RERANK_BACKEND="fakes:create_fake_reranker",
+        FAKE_RERANK_OVERHEAD_MS=str(args.rerank_overhead_ms),
+        PYTHONPATH=os.pathsep.join([BENCH_DIR, RETRIEVE_DIR, os.environ.get("PYTHONPATH", "")])
+    )
+    fakes = os.path.join(BENCH_DIR, "fakes.py")
+    processes = [
+        start([sys.executable, fakes, "tei", "--port", str(tei_port), "--latency-ms", str(args.tei_latency_ms), "--per-item-us", str(args.tei_per_item_us), "--dim", str(args.dim)], env),
+        start([sys.executable, fakes, "qdrant", "--port", str(qdrant_port), "--latency-ms", str(args.qdrant_latency_ms)], env),
+    ]
+    proxy = start([sys.executable, "-m", "uvicorn", "manager:app", "--host", "127.0.0.1", "--port", str(proxy_port), "--log-level", "warning"], env)
+    processes.append(proxy)
+
+    try:
+        connections = max(args.concurrency) + 8
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{proxy_port}", timeout=120.0, limits=limits) as client:
+            await wait_ready(client, f"http://127.0.0.1:{tei_port}/health")
+            await wait_ready(client, f"http://127.0.0.1:{qdrant_port}/collections/none")
+            await wait_ready(client, "/ready")
+
+            seed_started = time.perf_counter()
+            await seed(client, make_corpus(args.corpus, rng), args.dim)
+            seed_seconds = time.perf_counter() - seed_started
+
+            queries = make_queries(args.queries, rng)
+            weights = [1 / (rank + 1) ** args.zipf for rank in range(len(queries))]
+            runs = []
+            for concurrency in args.concurrency:
+                result = await replay(client, queries, weights, concurrency, args.seconds, args.limit, rng)
+                result["memory"] = memory(proxy.pid)
+                runs.append(result)
+
+            stats = (await client.get("/v1/cache/stats")).json()
+        return {
+            "config": vars(args),
+            "seed_seconds": round(seed_seconds, 3),
+            "runs": runs,
+            "memory": memory(proxy.pid),
+            "hit_rates": hit_rates(stats),
+            "rerank_batcher": stats.get("rerank_batcher"),
+            "rerank_depth": stats.get("rerank_depth")
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end embed -> search load test of manager.py against local fakes")
+    parser.add_argument("--concurrency", default="1,8,32", help="Virtual users per run, one run each")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of each run")
+    parser.add_argument("--corpus", type=int, default=2000, help="Snippets seeded into the fake Qdrant")
+    parser.add_argument("--queries", type=int, default=500, help="Distinct queries in the pool")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Query popularity skew, 0 = uniform")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--tei-latency-ms", type=float, default=15.0)
+    parser.add_argument("--tei-per-item-us", type=float, default=200.0)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=2.0)
+    parser.add_argument("--rerank-overhead-ms", type=float, default=8.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report here")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
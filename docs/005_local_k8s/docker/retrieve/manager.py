@@ -2,29 +2,151 @@ import uvicorn
 import os
 import sys
 import logging
+import logging.handlers
 import httpx
-import torch
 import time
 import asyncio
+import atexit
+import base64
+import bisect
+import contextvars
+import fcntl
 import hashlib
-from collections import OrderedDict
+import heapq
+import importlib
+import json
+import math
+import queue
+import random
+import re
+import sqlite3
+import tempfile
+import struct
+import threading
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict, deque
+from multiprocessing import resource_tracker, shared_memory
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
 from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 from fastapi.concurrency import run_in_threadpool
-from transformers import AutoModel
-from torchao.quantization import quantize_, Int4WeightOnlyConfig
 
-logging.basicConfig(
-    level=logging.INFO, 
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
+try:
+    import orjson
+except ImportError: # Optional, stdlib json is the fallback
+    orjson = None
+
+LOG_TRACE_IDS = os.environ.get("LOG_TRACE_IDS", "0") == "1" # Tag every log line with the request's X-Request-ID
+trace_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "1") == "1" # Write log lines from a background thread, never the event loop
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000)) # Lines waiting for stdout before new ones are dropped
+LOG_WARNING_WAIT = float(os.environ.get("LOG_WARNING_WAIT", 0.05)) # Seconds a warning or error off the event loop may wait for room in a full queue
+LOG_SAMPLE_EVERY = int(os.environ.get("LOG_SAMPLE_EVERY", 1)) # Keep 1 in N per-request info lines, 1 = all
+LOG_FORMAT = "%(asctime)s [%(levelname)s] [%(trace_id)s] %(message)s" if LOG_TRACE_IDS else "%(asctime)s [%(levelname)s] %(message)s"
+
+def on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # When stdout can't keep up, drop info lines rather than block the loop or queue them without bound.
+    # The last tenth of the queue is kept for warnings and errors. Off the event loop they also wait
+    # briefly for room before giving up; on it they never wait. The count rides along on the next line
+    # that fits.
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._reported = 0
+        self._info_limit = log_queue.maxsize - log_queue.maxsize // 10 if log_queue.maxsize > 0 else None
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        dropped = self.dropped
+        if dropped > self._reported:
+            record.msg = f"{record.msg} ({dropped - self._reported} log lines dropped, stdout is behind)"
+        try:
+            if record.levelno >= logging.WARNING and not on_event_loop():
+                self.queue.put(record, timeout=LOG_WARNING_WAIT)
+            elif record.levelno >= logging.WARNING:
+                self.queue.put_nowait(record)
+            elif self._info_limit is not None and self.queue.qsize() >= self._info_limit:
+                raise queue.Full
+            else:
+                self.queue.put_nowait(record)
+            self._reported = dropped
+        except queue.Full:
+            self.dropped += 1
+
+class LogListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Blocking, so stopping with a full queue waits for the backlog instead of raising queue.Full
+        self.queue.put(self._sentinel)
+
+def create_log_handler(stream, use_queue: bool, queue_size: int = LOG_QUEUE_SIZE) -> tuple[logging.Handler, logging.handlers.QueueListener | None]:
+    # With a queue, the calling thread only renders the message; timestamps, formatting and the blocking
+    # write happen on the listener thread. Trace ids are read where the record is made, the contextvar
+    # isn't visible from the listener.
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    if not use_queue:
+        if LOG_TRACE_IDS:
+            stream_handler.addFilter(TraceIdFilter())
+        return stream_handler, None
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    if LOG_TRACE_IDS:
+        queue_handler.addFilter(TraceIdFilter())
+    return queue_handler, LogListener(queue_handler.queue, stream_handler)
+
+log_handler, log_listener = create_log_handler(sys.stdout, LOG_ASYNC)
+if log_listener is not None:
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+logging.basicConfig(level=logging.INFO, handlers=[log_handler])
 logger = logging.getLogger("SmartProxy")
 
+class LogSampler:
+    # 1 in `every` calls per key gets logged, and says how many it stands for. Only for lines every
+    # request emits; anything rare or a warning goes straight to the logger.
+    def __init__(self, every: int):
+        self.every = every
+        self.counts: dict[str, int] = {}
+
+    def info(self, key: str, msg: str, *args) -> None:
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        if self.every <= 1:
+            logger.info(msg, *args)
+            return
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count % self.every:
+            return
+        if count:
+            logger.info(msg + " (1 of %d)", *args, self.every)
+        else:
+            logger.info(msg, *args)
+
+log_sampler = LogSampler(LOG_SAMPLE_EVERY)
+
 def require_env(name: str) -> str:
     value = os.environ.get(name)
     if not value:
-        logger.error(f"Required ENV var '{name}' not set")
+        logger.error("Required ENV var '%s' not set", name)
         sys.exit(1)
     return value
 
@@ -32,90 +154,1221 @@ TEI_BASE_URL = require_env("TEI_BASE_URL")
 VECTOR_DB_BASE_URL = require_env("VECTOR_DB_BASE_URL")
 PORT = int(os.environ.get("PORT", 8000))
 MODEL_PATH = os.environ.get("MODEL_PATH", "jinaai/jina-reranker-v3")
+RERANK_BACKEND = os.environ.get("RERANK_BACKEND", "auto") # auto | cuda | cpu | remote | none | package.module:factory
+RERANK_WARMUP = os.environ.get("RERANK_WARMUP", "background") # background | lazy (first search)
+RERANK_CPU_MODEL_PATH = os.environ.get("RERANK_CPU_MODEL_PATH", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CPU_BATCH_SIZE = int(os.environ.get("RERANK_CPU_BATCH_SIZE", 32)) # (query, snippet) pairs per forward pass
+RERANK_CPU_THREADS = int(os.environ.get("RERANK_CPU_THREADS", 0)) # 0 = torch default
 RERANK_BATCH_SIZE = 64 # Use listwise arch now that we implemented it
+RERANK_DEPTH_MULTIPLIER = float(os.environ.get("RERANK_DEPTH_MULTIPLIER", 2.0)) # Candidates fetched per requested hit
+RERANK_MIN_CANDIDATES = int(os.environ.get("RERANK_MIN_CANDIDATES", 20))
+RERANK_MAX_CANDIDATES = int(os.environ.get("RERANK_MAX_CANDIDATES", 100))
+RERANK_SCORE_GAP = float(os.environ.get("RERANK_SCORE_GAP", 0)) # Stop at a vector-score cliff this wide, 0 = off
+RERANK_TOKEN_BUDGET = int(os.environ.get("RERANK_TOKEN_BUDGET", 0)) # Max estimated tokens reranked per search, 0 = off
+RERANK_INCREMENTAL = os.environ.get("RERANK_INCREMENTAL", "0") == "1" # Score in vector order and stop once the top hits settle
+RERANK_INCREMENTAL_BATCH = int(os.environ.get("RERANK_INCREMENTAL_BATCH", 16)) # Candidates per round after the first `limit`
+RERANK_EARLY_STOP_PATIENCE = int(os.environ.get("RERANK_EARLY_STOP_PATIENCE", 2)) # Rounds without a new top hit before stopping, 0 = off
+RERANK_BATCH_WINDOW_MS = float(os.environ.get("RERANK_BATCH_WINDOW_MS", 2))
+RERANK_BATCH_MAX_TOKENS = int(os.environ.get("RERANK_BATCH_MAX_TOKENS", 65536))
+RERANK_QUEUE_DEPTH = int(os.environ.get("RERANK_QUEUE_DEPTH", 256))
+RERANK_SCORE_CACHE_SIZE = int(os.environ.get("RERANK_SCORE_CACHE_SIZE", 200000)) # 0 = off
+RERANK_SCORE_CACHE_TTL = int(os.environ.get("RERANK_SCORE_CACHE_TTL", 3600))
+EMBED_TOKENIZER_PATH = os.environ.get("EMBED_TOKENIZER_PATH", "jinaai/jina-code-embeddings-0.5b")
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64)) # Keep <= TEI --max-client-batch-size
+EMBED_BATCH_MAX_TOKENS = int(os.environ.get("EMBED_BATCH_MAX_TOKENS", 16384)) # Padded tokens per /embed call
+EMBED_MAX_INPUT_TOKENS = int(os.environ.get("EMBED_MAX_INPUT_TOKENS", 8192)) # TEI truncates past the model max anyway
+EMBED_SORT_BY_LENGTH = os.environ.get("EMBED_SORT_BY_LENGTH", "1") == "1"
+EMBED_INLINE_TOKENIZE_CHARS = int(os.environ.get("EMBED_INLINE_TOKENIZE_CHARS", 4096)) # Tokenize on the loop up to this many chars, else in the threadpool
+EMBED_MAX_IN_FLIGHT = int(os.environ.get("EMBED_MAX_IN_FLIGHT", 4)) # Concurrent /embed batches, shared by all requests
+EMBED_MAX_INFLIGHT_BYTES = int(os.environ.get("EMBED_MAX_INFLIGHT_BYTES", 16 * 1024 * 1024)) # UTF-8 request text plus estimated JSON replies
+EMBED_REPLY_BYTES_PER_FLOAT = 20 # A float32 printed as JSON, with its separator
+EMBED_BATCH_RETRIES = int(os.environ.get("EMBED_BATCH_RETRIES", 3))
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", 50000))
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH") # Optional sqlite file, survives restarts
+EMBED_CACHE_DISK_MAX = int(os.environ.get("EMBED_CACHE_DISK_MAX", 1000000))
+EMBED_MODEL_ID = os.environ.get("EMBED_MODEL_ID", EMBED_TOKENIZER_PATH) # Namespaces cached vectors, set it to TEI's model/revision if the tokenizer path doesn't pin it
+
+# Query text -> embedding memo, so retyped searches skip tokenizing and TEI entirely
+QUERY_MEMO_SIZE = int(os.environ.get("QUERY_MEMO_SIZE", 10000))
+QUERY_MEMO_TTL = float(os.environ.get("QUERY_MEMO_TTL", 3600))
+
+# Vector -> query text correlation, shared when embed and search calls can land on different workers
+CORRELATION_BACKEND = os.environ.get("CORRELATION_BACKEND", "memory") # memory | shm | redis | package.module:factory
+CORRELATION_SIZE = int(os.environ.get("CORRELATION_SIZE", 1000)) # Entries, ignored by redis
+CORRELATION_TTL = float(os.environ.get("CORRELATION_TTL", 60))
+CORRELATION_SHM_NAME = os.environ.get("CORRELATION_SHM_NAME", "smartproxy-correlation")
+CORRELATION_SHM_TEXT_BYTES = int(os.environ.get("CORRELATION_SHM_TEXT_BYTES", 2048)) # Longer queries are truncated
+CORRELATION_REDIS_URL = os.environ.get("CORRELATION_REDIS_URL", "redis://localhost:6379/0")
+
+# Dedicated rerank worker: RERANK_BACKEND=remote sends batches here instead of loading a model
+SMARTPROXY_ROLE = os.environ.get("SMARTPROXY_ROLE", "") # rerank-worker serves /v1/rerank for the others, never set it on a public port
+RERANK_WORKER_URL = os.environ.get("RERANK_WORKER_URL", "unix:/tmp/smartproxy-rerank.sock") # http://host:port or unix:/path
+RERANK_WORKER_WAIT = float(os.environ.get("RERANK_WORKER_WAIT", 900)) # Seconds to wait for the worker's model
+
+# Hybrid retrieval: a local BM25 index over payload text, fused with the vector hits before rerank
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "0") == "1"
+LEXICAL_INDEX_PATH = os.environ.get("LEXICAL_INDEX_PATH") # Optional directory, one append-only file per collection
+LEXICAL_RRF_K = int(os.environ.get("LEXICAL_RRF_K", 60))
 
 QUERY_PREFIX = "Find the code snippet most similar to the query of:\n"
 PASSAGE_PREFIX = "Candidate code snippet:\n"
 
 
+class Histogram:
+    # Prometheus histogram without the client library. Observing is a bisect and three adds under an
+    # uncontended lock (workers observe from the threadpool too), well under a microsecond.
+    def __init__(self, name: str, description: str, buckets: tuple, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        # Exact bounds, so le="1048576" rather than %g's rounded le="1.04858e+06"
+        self._le = tuple(str(int(bound)) if float(bound).is_integer() else repr(float(bound)) for bound in self.buckets) + ("+Inf",)
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 3)
+            series[slot] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, series in snapshot.items():
+            base = ",".join(f'{n}="{v}"' for n, v in zip(self.labelnames, labels))
+            prefix = base + "," if base else ""
+            suffix = "{" + base + "}" if base else ""
+            cumulative = 0
+            for le, count in zip(self._le, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{suffix} {series[-2]}")
+            lines.append(f"{self.name}_count{suffix} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = dict(self._values)
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in snapshot.items():
+            base = ",".join(f'{n}="{v}"' for n, v in zip(self.labelnames, labels))
+            lines.append(f"{self.name}{{{base}}} {value}" if base else f"{self.name} {value}")
+        return lines
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = tuple(256 * 4 ** i for i in range(11)) # 256B .. 256MB
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+HTTP_SECONDS = Histogram("proxy_http_request_seconds", "Request time until the last response byte", LATENCY_BUCKETS, ("route",))
+HTTP_REQUEST_BYTES = Histogram("proxy_http_request_bytes", "Request body size", BYTES_BUCKETS, ("route",))
+HTTP_RESPONSE_BYTES = Histogram("proxy_http_response_bytes", "Response body size", BYTES_BUCKETS, ("route",))
+UPSTREAM_SECONDS = Histogram("proxy_upstream_seconds", "Upstream call time until response headers", LATENCY_BUCKETS, ("target",))
+UPSTREAM_BYTES = Histogram("proxy_upstream_response_bytes", "Buffered upstream response size", BYTES_BUCKETS, ("target",))
+THREADPOOL_WAIT = Histogram("proxy_threadpool_queue_wait_seconds", "Time from submit until a worker thread picks the call up", LATENCY_BUCKETS, ("stage",))
+RERANK_BATCH_SECONDS = Histogram("proxy_rerank_batch_seconds", "Rerank batch time including threadpool wait", LATENCY_BUCKETS)
+RERANK_BATCH_JOBS = Histogram("proxy_rerank_batch_jobs", "Search jobs merged into one rerank batch", COUNT_BUCKETS)
+RERANK_BATCH_CANDIDATES = Histogram("proxy_rerank_batch_candidates", "Candidates scored per rerank batch", COUNT_BUCKETS)
+SINGLEFLIGHT_CALLS = Counter("proxy_singleflight_calls_total", "Coalescable calls that ran upstream (leader) or shared one in flight (suppressed)", ("call", "role"))
+METRICS = [
+    HTTP_SECONDS, HTTP_REQUEST_BYTES, HTTP_RESPONSE_BYTES, UPSTREAM_SECONDS, UPSTREAM_BYTES,
+    THREADPOOL_WAIT, RERANK_BATCH_SECONDS, RERANK_BATCH_JOBS, RERANK_BATCH_CANDIDATES, SINGLEFLIGHT_CALLS
+]
+
+async def run_in_threadpool_timed(stage: str, func, *args):
+    queued = time.perf_counter()
+
+    def timed():
+        THREADPOOL_WAIT.observe(time.perf_counter() - queued, stage)
+        return func(*args)
+
+    return await run_in_threadpool(timed)
+
+
+def json_dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":")).encode()
+
+def json_loads(raw: bytes | str):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def json_response(content, response: Response | None = None) -> Response:
+    # Skips FastAPI's jsonable_encoder, which walks every float of every vector
+    headers = dict(response.headers) if response is not None else None
+    return Response(content=json_dumps(content), media_type="application/json", headers=headers)
+
+def pack_vector(vector) -> bytes:
+    # Little-endian float32, same layout as OpenAI's encoding_format=base64
+    if isinstance(vector, array) and vector.typecode == "f":
+        if sys.byteorder == "little":
+            return vector.tobytes()
+        swapped = array("f", vector)
+        swapped.byteswap()
+        return swapped.tobytes()
+    return struct.pack(f"<{len(vector)}f", *vector)
+
+def unpack_vector(encoded: str | bytes) -> tuple[list[float], bytes]:
+    raw = base64.b64decode(encoded, validate=True)
+    if not raw or len(raw) % 4:
+        raise ValueError("base64 vector is not a whole number of float32s")
+    return list(struct.unpack(f"<{len(raw) // 4}f", raw)), raw
+
+
+class TTLCache:
+    # The TTL is fixed, so insertion order is expiry order: a plain FIFO of deadlines stays sorted
+    # and expiry only ever pops from its head. Refreshed keys leave stale FIFO entries behind,
+    # which are skipped when they surface. Every entry is pushed and popped once -> amortized O(1).
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.entries: OrderedDict[bytes, tuple[object, float]] = OrderedDict()
+        self._deadlines: deque[tuple[float, bytes]] = deque()
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _expire(self, now: float) -> None:
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            deadline, key = deadlines.popleft()
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] == deadline:
+                del self.entries[key]
+                self.expired += 1
+        if len(deadlines) > 4 * len(self.entries) + 1024:
+            # Same key refreshed over and over; rebuild so the FIFO can't outgrow the cache
+            self._deadlines = deque(sorted((deadline, key) for key, (_, deadline) in self.entries.items()))
+
+    def get(self, key: bytes):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self.entries[key]
+            self.expired += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: bytes, value) -> None:
+        now = time.monotonic()
+        self._expire(now)
+        deadline = now + self.ttl
+        self.entries[key] = (value, deadline)
+        self.entries.move_to_end(key)
+        self._deadlines.append((deadline, key))
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def pop(self, key: bytes):
+        entry = self.entries.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self._deadlines.clear()
+
+
+class MemoryCorrelationStore:
+    # No lock: nothing in here awaits, so every call is atomic on the event loop
+    name = "memory"
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.cache = TTLCache(max_size, ttl_seconds)
+
+    async def get(self, key: bytes) -> str | None:
+        return self.cache.get(key)
+
+    async def set(self, key: bytes, query_text: str) -> None:
+        self.cache.set(key, query_text)
+
+    async def stats(self) -> dict:
+        return {"size": len(self.cache), "expired": self.cache.expired, "evicted": self.cache.evicted}
+
+    async def close(self) -> None:
+        pass
+
+
+class SharedMemoryCorrelationStore:
+    # Fixed hash table in a named shared memory segment, for uvicorn workers on one host. Slots are
+    # [seq u32][length u32][deadline f64][key 16B][text], four times as many as entries, probed linearly
+    # over a 16-slot window (a full window evicts the entry closest to expiring). At full capacity that
+    # loses well under 0.1% of live entries early; a lost entry only costs that search its rerank.
+    # Writers serialize on a flock and bump seq to odd while writing; readers retry on an odd or changed
+    # seq, so lookups never take the lock. Deadlines are wall-clock, the one clock every process agrees on.
+    SLOT = struct.Struct("<IId16s")
+    SLOTS_PER_ENTRY = 4
+    PROBES = 16
+    LOCK_ATTEMPTS = 20 # Non-blocking flock tries, 0.5ms apart, before the write is dropped
+
+    name = "shm"
+
+    def __init__(self, segment: str, max_entries: int, ttl_seconds: float, text_bytes: int = 2048):
+        self.slots = max(self.SLOTS_PER_ENTRY * max_entries, self.PROBES)
+        self.ttl = ttl_seconds
+        self.text_bytes = text_bytes
+        self.slot_size = self.SLOT.size + text_bytes
+        # Sizing is in the name, so a restart with different settings never attaches to a stale layout
+        self.segment = f"{segment}-{self.slots}x{text_bytes}"
+        size = self.slots * self.slot_size
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.segment, create=True, size=size)
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory(name=self.segment)
+        # Otherwise the resource tracker unlinks the segment as soon as any one worker exits
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.buf = self.shm.buf
+        self._lock_fd = os.open(os.path.join(tempfile.gettempdir(), f"{self.segment}.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+        self.expired = 0
+        self.evicted = 0
+        self.dropped = 0
+
+    def _offsets(self, key: bytes):
+        start = int.from_bytes(key[:8], "little")
+        return ((start + probe) % self.slots * self.slot_size for probe in range(self.PROBES))
+
+    def _read(self, offset: int) -> tuple[bytes, float, bytes] | None:
+        for _ in range(8):
+            seq, length, deadline, slot_key = self.SLOT.unpack_from(self.buf, offset)
+            if seq & 1:
+                continue
+            text = bytes(self.buf[offset + self.SLOT.size : offset + self.SLOT.size + length])
+            if struct.unpack_from("<I", self.buf, offset)[0] == seq:
+                return slot_key, deadline, text
+        return None # Writer kept the slot busy, treat as a miss
+
+    async def get(self, key: bytes) -> str | None:
+        now = time.time()
+        for offset in self._offsets(key):
+            slot = self._read(offset)
+            if slot is None or slot[0] != key:
+                continue
+            if slot[1] <= now:
+                self.expired += 1
+                return None
+            return slot[2].decode(errors="ignore")
+        return None
+
+    async def _lock(self) -> bool:
+        # Never block the event loop on another process's lock, which could be descheduled mid-write
+        for _ in range(self.LOCK_ATTEMPTS):
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                await asyncio.sleep(0.0005)
+        return False
+
+    async def set(self, key: bytes, query_text: str) -> None:
+        data = query_text.encode()[: self.text_bytes]
+        if not await self._lock():
+            self.dropped += 1
+            return
+        now = time.time()
+        try:
+            # Same key, else a free or expired slot, else evict the one closest to expiring
+            target = None
+            oldest = None
+            for offset in self._offsets(key):
+                _, _, deadline, slot_key = self.SLOT.unpack_from(self.buf, offset)
+                if slot_key == key:
+                    target = offset
+                    break
+                if deadline <= now and target is None:
+                    target = offset
+                if oldest is None or deadline < oldest[0]:
+                    oldest = (deadline, offset)
+            if target is None:
+                target = oldest[1]
+                self.evicted += 1
+
+            seq = struct.unpack_from("<I", self.buf, target)[0]
+            struct.pack_into("<I", self.buf, target, (seq + 1) & 0xFFFFFFFF)
+            self.SLOT.pack_into(self.buf, target, (seq + 1) & 0xFFFFFFFF, len(data), now + self.ttl, key)
+            self.buf[target + self.SLOT.size : target + self.SLOT.size + len(data)] = data
+            struct.pack_into("<I", self.buf, target, (seq + 2) & 0xFFFFFFFF)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    async def stats(self) -> dict:
+        now = time.time()
+        live = sum(
+            1 for slot in range(self.slots)
+            if struct.unpack_from("<d", self.buf, slot * self.slot_size + 8)[0] > now
+        )
+        return {"size": live, "segment": self.segment, "expired": self.expired, "evicted": self.evicted, "dropped": self.dropped}
+
+    async def close(self) -> None:
+        self.buf = None
+        self.shm.close()
+        os.close(self._lock_fd)
+
+    def unlink(self) -> None:
+        # Segments outlive the workers on purpose; this is for tests and benchmarks cleaning up
+        resource_tracker.register(self.shm._name, "shared_memory")
+        self.shm.unlink()
+
+
+class RedisCorrelationStore:
+    # Works across pods. Redis enforces the TTL; size limits are its maxmemory policy's job. Errors
+    # degrade to a miss, which only costs the rerank for that search.
+    name = "redis"
+
+    LOG_INTERVAL = 60
+
+    def __init__(self, client, ttl_seconds: float, prefix: str = "smartproxy:query:"):
+        self.client = client
+        self.ttl = ttl_seconds
+        self.prefix = prefix
+        self.errors = 0
+        self._logged_errors = 0
+        self._logged_at: float | None = None
+
+    def _failed(self, action: str, e: Exception) -> None:
+        # Every search hits the store, so an outage would log twice per request. The first failure is
+        # logged, then one line a minute with how many were left out.
+        self.errors += 1
+        now = time.monotonic()
+        if self._logged_at is not None and now - self._logged_at < self.LOG_INTERVAL:
+            return
+        skipped = self.errors - self._logged_errors - 1
+        if skipped:
+            logger.warning("Correlation %s failed: %s (%s more failures since the last report)", action, e, skipped)
+        else:
+            logger.warning("Correlation %s failed: %s", action, e)
+        self._logged_errors = self.errors
+        self._logged_at = now
+
+    async def get(self, key: bytes) -> str | None:
+        try:
+            value = await self.client.get(self.prefix + key.hex())
+        except Exception as e:
+            self._failed("lookup", e)
+            return None
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key: bytes, query_text: str) -> None:
+        try:
+            await self.client.set(self.prefix + key.hex(), query_text, ex=max(1, math.ceil(self.ttl)))
+        except Exception as e:
+            self._failed("store", e)
+
+    async def stats(self) -> dict:
+        return {"size": None, "expired": None, "evicted": None, "errors": self.errors}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_correlation_store(spec: str):
+    if spec == "memory":
+        return MemoryCorrelationStore(CORRELATION_SIZE, CORRELATION_TTL)
+    if spec == "shm":
+        return SharedMemoryCorrelationStore(CORRELATION_SHM_NAME, CORRELATION_SIZE, CORRELATION_TTL, CORRELATION_SHM_TEXT_BYTES)
+    if spec == "redis":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("CORRELATION_BACKEND=redis needs the redis package")
+        return RedisCorrelationStore(redis_asyncio.from_url(CORRELATION_REDIS_URL), CORRELATION_TTL)
+    # package.module:factory, e.g. a fake Redis client in tests
+    module_name, _, factory = spec.partition(":")
+    return getattr(importlib.import_module(module_name), factory or "create_store")()
+
+
 class QueryCache:
-    def __init__(self, max_size: int = 1000, ttl_seconds: int = 60):
-        self.cache: OrderedDict[str, tuple[str, float]] = OrderedDict()
+    # Hit/miss accounting is per worker, the entries live wherever the store keeps them
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 60, store=None):
+        self.backend = store if store is not None else MemoryCorrelationStore(max_size, ttl_seconds)
         self.max_size = max_size
         self.ttl = ttl_seconds
-        self._lock = asyncio.Lock()
         self._hits = 0
         self._misses = 0
     
-    def _hash_vector(self, vector: list) -> str:
-        key = ",".join(f"{v:.6f}" for v in vector[:32])
+    @staticmethod
+    def _hash_vector(vector: list | array | bytes) -> bytes:
+        # Whole vector packed as float32, so JSON round-trips through the client can't shift the key.
+        # Already-packed bytes (base64 transport) hash as-is.
         # Like unc Fowler says, it's jus cache invalidation and namin thangz
-        return hashlib.md5(key.encode()).hexdigest()
-    
-    def _evict_expired(self) -> int:
-        now = time.time()
-        expired = [k for k, (_, ts) in self.cache.items() if now - ts > self.ttl]
-        for k in expired:
-            del self.cache[k]
-        return len(expired)
+        packed = vector if isinstance(vector, bytes) else pack_vector(vector)
+        return hashlib.blake2b(packed, digest_size=16).digest()
     
-    async def store(self, vector: list, query_text: str) -> None:
-        async with self._lock:
-            evicted = self._evict_expired()
-            if evicted > 0:
-                logger.debug(f"Evicted {evicted} expired cache entries")
-            
-            h = self._hash_vector(vector)
-            self.cache[h] = (query_text, time.time())
-            self.cache.move_to_end(h)
-            
-            if len(self.cache) > self.max_size:
-                self.cache.popitem(last=False)
-                logger.debug(f"LRU eviction triggered, cache size: {self.max_size}")
-            
+    async def store(self, vector: list | array | bytes, query_text: str) -> None:
+        await self.backend.set(self._hash_vector(vector), query_text)
+        
+        if logger.isEnabledFor(logging.DEBUG):
             preview = query_text[:50] + "..." if len(query_text) > 50 else query_text
-            logger.debug(f"Cached query: {preview}")
+            logger.debug("Cached query: %s", preview)
     
-    async def get(self, vector: list) -> str | None:
-        async with self._lock:
-            self._evict_expired()
-            h = self._hash_vector(vector)
-            entry = self.cache.get(h)
-            
-            if entry:
-                self._hits += 1
-                self.cache.move_to_end(h)
-                logger.debug(f"Cache hit (hits: {self._hits}, misses: {self._misses})")
-                return entry[0]
-            
-            self._misses += 1
-            logger.debug(f"Cache miss (hits: {self._hits}, misses: {self._misses})")
-            return None
+    async def get(self, vector: list | array | bytes) -> str | None:
+        query_text = await self.backend.get(self._hash_vector(vector))
+        
+        if query_text is not None:
+            self._hits += 1
+            logger.debug("Cache hit (hits: %s, misses: %s)", self._hits, self._misses)
+            return query_text
+        
+        self._misses += 1
+        logger.debug("Cache miss (hits: %s, misses: %s)", self._hits, self._misses)
+        return None
     
     async def stats(self) -> dict:
-        async with self._lock:
+        return {
+            "backend": self.backend.name,
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / (self._hits + self._misses) if (self._hits + self._misses) > 0 else 0.0,
+            **await self.backend.stats()
+        }
+
+
+class QueryEmbeddingMemo:
+    # Whitespace-normalized query -> (vector, prompt tokens). Sits in front of the embedding cache: a hit
+    # here skips tokenizing and hashing the prefixed text as well as TEI.
+    WHITESPACE = re.compile(r"\s+")
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.cache = TTLCache(max_size, ttl_seconds)
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def key(cls, query_text: str) -> bytes:
+        normalized = cls.WHITESPACE.sub(" ", query_text).strip()
+        return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes) -> tuple[array, int] | None:
+        if self.max_size <= 0:
+            return None
+        memo = self.cache.get(key)
+        if memo is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return memo
+
+    def put(self, key: bytes, vector: list | array, prompt_tokens: int) -> None:
+        if self.max_size > 0:
+            self.cache.set(key, (vector if isinstance(vector, array) else array("f", vector), prompt_tokens))
+
+    async def stats(self) -> dict:
+        return {
+            "size": len(self.cache),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / (self._hits + self._misses) if (self._hits + self._misses) > 0 else 0.0,
+            "expired": self.cache.expired,
+            "evicted": self.cache.evicted
+        }
+
+
+class ByteBudget:
+    # Caps request bytes in flight. A batch bigger than the whole budget still runs, just alone.
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, size: int) -> int:
+        size = min(size, self.limit)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.used + size <= self.limit)
+            self.used += size
+        return size
+
+    async def release(self, size: int) -> None:
+        async with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+
+class EmbeddingCache:
+    # Keyed by the prefixed text, so query and passage embeddings of the same string never mix. Entries
+    # are (vector, prompt tokens) like QueryEmbeddingMemo, so a hit needs no tokenizing for usage. The
+    # model id is hashed into every key: after TEI changes model, a reused sqlite file misses instead of
+    # serving the old model's vectors, and its rows age out through disk_max.
+    def __init__(self, max_size: int = 50000, path: str | None = None, disk_max: int = 1000000, model_id: str = ""):
+        self.cache: OrderedDict[bytes, tuple[array, int | None]] = OrderedDict()
+        self.max_size = max_size
+        self.model_id = model_id
+        self._key_prefix = model_id.encode() + b"\0"
+        self.path = path
+        self.disk_max = disk_max
+        self._db = None
+        self._db_rows = 0
+        self._db_lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._bytes_saved = 0
+
+    def key(self, text: str) -> bytes:
+        return hashlib.blake2b(self._key_prefix + text.encode(), digest_size=16).digest()
+
+    def open(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, tokens INTEGER)")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")]
+        if "tokens" not in columns:
+            # Rows from before token counts were stored read back with tokens NULL and get counted again
+            self._db.execute("ALTER TABLE embeddings ADD COLUMN tokens INTEGER")
+        self._db.commit()
+        self._db_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info("Embedding cache backed by %s (%s stored vectors, model %s)", self.path, self._db_rows, self.model_id)
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def _remember(self, key: bytes, entry: tuple[array, int | None]) -> None:
+        if self.max_size <= 0:
+            return
+        self.cache[key] = entry
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def _disk_get_many(self, keys: list[bytes]) -> dict[bytes, tuple[array, int | None]]:
+        found = {}
+        with self._db_lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(f"SELECT key, vector, tokens FROM embeddings WHERE key IN ({placeholders})", chunk)
+                for key, blob, tokens in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = (vector, tokens)
+        return found
+
+    def _disk_put_many(self, items: list[tuple[bytes, bytes, int]]) -> None:
+        items = list({item[0]: item for item in items}.values())
+        with self._db_lock:
+            # Rows being rewritten (concurrent misses on the same chunk) are deleted first and counted, so
+            # only genuinely new rows count toward disk_max. The insert still gets a fresh, newest rowid.
+            before = self._db.total_changes
+            for start in range(0, len(items), 500):
+                chunk = [item[0] for item in items[start : start + 500]]
+                placeholders = ",".join("?" * len(chunk))
+                self._db.execute(f"DELETE FROM embeddings WHERE key IN ({placeholders})", chunk)
+            replaced = self._db.total_changes - before
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, tokens) VALUES (?, ?, ?)", items)
+            self._db_rows += len(items) - replaced
+            if self._db_rows > self.disk_max:
+                # REPLACE bumps the rowid, so the lowest rowids are the least recently written
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                    (self._db_rows - self.disk_max,)
+                )
+                self._db_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._db.commit()
+
+    async def get_many(self, texts: list[str]) -> tuple[list[tuple[array, int | None] | None], list[bytes]]:
+        keys = [self.key(t) for t in texts]
+        found: list[tuple[array, int | None] | None] = [None] * len(keys)
+        if self.max_size <= 0 and self._db is None:
+            self._misses += len(keys)
+            return found, keys
+
+        pending = []
+        for i, key in enumerate(keys):
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.cache.move_to_end(key)
+                found[i] = entry
+                vector = entry[0]
+                self._hits += 1
+                self._bytes_saved += len(texts[i].encode()) + vector.itemsize * len(vector)
+            else:
+                pending.append(i)
+
+        if pending and self._db is not None:
+            try:
+                stored = await run_in_threadpool_timed("embed_cache", self._disk_get_many, list({keys[i] for i in pending}))
+            except Exception as e:
+                logger.error("Embedding cache read failed: %s", e)
+                stored = {}
+            still_pending = []
+            for i in pending:
+                entry = stored.get(keys[i])
+                if entry is not None:
+                    self._remember(keys[i], entry)
+                    found[i] = entry
+                    vector = entry[0]
+                    self._disk_hits += 1
+                    self._bytes_saved += len(texts[i].encode()) + vector.itemsize * len(vector)
+                else:
+                    still_pending.append(i)
+            pending = still_pending
+
+        self._misses += len(pending)
+        return found, keys
+
+    async def put_many(self, keys: list[bytes], vectors: list[list[float] | array], token_counts: list[int]) -> None:
+        packed = [
+            (key, vector if isinstance(vector, array) else array("f", vector), tokens)
+            for key, vector, tokens in zip(keys, vectors, token_counts)
+        ]
+        for key, vector, tokens in packed:
+            self._remember(key, (vector, tokens))
+        if self._db is not None and packed:
+            try:
+                await run_in_threadpool_timed("embed_cache", self._disk_put_many, [(key, vector.tobytes(), tokens) for key, vector, tokens in packed])
+            except Exception as e:
+                logger.error("Embedding cache write failed: %s", e)
+
+    async def stats(self) -> dict:
+        lookups = self._hits + self._disk_hits + self._misses
+        return {
+            "size": len(self.cache),
+            "max_size": self.max_size,
+            "disk_path": self.path,
+            "model_id": self.model_id,
+            "disk_size": self._db_rows if self._db is not None else 0,
+            "hits": self._hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "hit_rate": (self._hits + self._disk_hits) / lookups if lookups > 0 else 0.0,
+            "bytes_saved": self._bytes_saved
+        }
+
+
+class RerankScoreCache:
+    # (query, snippet) -> relevance score. Keys hash the exact texts the model saw, so an edited payload
+    # can't hit a stale score. Invalidation just frees what upserts made unreachable.
+    def __init__(self, max_size: int = 200000, ttl_seconds: int = 3600):
+        self.cache = TTLCache(max_size, ttl_seconds)
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._point_texts: dict[tuple[str, object], bytes] = {}
+        self._text_queries: dict[bytes, set[bytes]] = {}
+        self._pairs = 0 # (query, text) pairs in _text_queries, live or not
+        self._hits = 0
+        self._misses = 0
+        self._invalidated = 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+    def get_many(self, query_key: bytes, candidates: list[str]) -> tuple[list[float | None], list[bytes]]:
+        text_keys = [self.key(c) for c in candidates]
+        if self.max_size <= 0:
+            self._misses += len(candidates)
+            return [None] * len(candidates), text_keys
+        scores = [self.cache.get(query_key + text_key) for text_key in text_keys]
+        hits = sum(score is not None for score in scores)
+        self._hits += hits
+        self._misses += len(scores) - hits
+        return scores, text_keys
+
+    def put(self, query_key: bytes, text_key: bytes, score: float) -> None:
+        if self.max_size <= 0:
+            return
+        self.cache.set(query_key + text_key, score)
+        queries = self._text_queries.setdefault(text_key, set())
+        if query_key not in queries:
+            queries.add(query_key)
+            self._pairs += 1
+        # The cache holds at most max_size pairs, so this caps the dead ones and keeps rebuilds amortized O(1)
+        if self._pairs > 2 * self.max_size:
+            self._compact()
+
+    def track(self, collection_name: str, point_ids: list, text_keys: list[bytes]) -> None:
+        if self.max_size <= 0:
+            return
+        for point_id, text_key in zip(point_ids, text_keys):
+            if point_id is not None:
+                self._point_texts[(collection_name, point_id)] = text_key
+
+    def _drop_text(self, text_key: bytes) -> None:
+        queries = self._text_queries.pop(text_key, ())
+        self._pairs -= len(queries)
+        for query_key in queries:
+            if self.cache.pop(query_key + text_key) is not None:
+                self._invalidated += 1
+
+    def _compact(self) -> None:
+        # Expiry and LRU eviction don't report back, so rebuild the reverse indexes from what is still cached
+        live: dict[bytes, set[bytes]] = {}
+        for key in self.cache.entries:
+            live.setdefault(key[16:], set()).add(key[:16])
+        self._text_queries = live
+        self._pairs = len(self.cache.entries)
+        self._point_texts = {point: text_key for point, text_key in self._point_texts.items() if text_key in live}
+
+    def invalidate_points(self, collection_name: str, point_ids: list | None) -> None:
+        if point_ids is None:
+            point_ids = [point_id for name, point_id in self._point_texts if name == collection_name]
+        for point_id in point_ids:
+            text_key = self._point_texts.pop((collection_name, point_id), None)
+            if text_key is not None:
+                self._drop_text(text_key)
+
+    async def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self.cache),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "tracked_points": len(self._point_texts),
+            "tracked_pairs": self._pairs,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups > 0 else 0.0,
+            "invalidated": self._invalidated
+        }
+
+
+class LexicalIndex:
+    # BM25 over the same "File: path\ntext" the reranker sees. Identifiers are indexed whole and split
+    # on snake_case/camelCase, so "parseConfig" matches "parse config" and the exact name. Updates are
+    # appended to a per-collection log of zlib-compressed records and folded into a snapshot when the log
+    # outgrows the live index. All access goes through the lock, writers run on one background thread.
+    TOKEN = re.compile(r"[A-Za-z0-9_]+")
+    SUBWORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+    RECORD = struct.Struct("<I")
+
+    def __init__(self, path: str | None = None, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.ready = path is None
+        self.error: str | None = None
+        self._collections: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._fused = 0
+
+    @classmethod
+    def terms(cls, text: str) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for word in cls.TOKEN.findall(text):
+            if len(word) > 64:
+                continue
+            counts[word.lower()] = counts.get(word.lower(), 0) + 1
+            parts = cls.SUBWORD.findall(word)
+            if len(parts) > 1:
+                for part in parts:
+                    counts[part.lower()] = counts.get(part.lower(), 0) + 1
+        return counts
+
+    def _collection(self, name: str) -> dict:
+        if name not in self._collections:
+            self._collections[name] = {"docs": {}, "lens": {}, "postings": {}, "total_len": 0, "log_ops": 0}
+        return self._collections[name]
+
+    def _remove(self, col: dict, point_id) -> None:
+        doc = col["docs"].pop(point_id, None)
+        if doc is None:
+            return
+        for term in doc:
+            posting = col["postings"][term]
+            del posting[point_id]
+            if not posting:
+                del col["postings"][term]
+        col["total_len"] -= col["lens"].pop(point_id)
+
+    def _add(self, col: dict, point_id, doc: dict[str, int]) -> None:
+        self._remove(col, point_id)
+        if not doc:
+            return
+        col["docs"][point_id] = doc
+        col["lens"][point_id] = sum(doc.values())
+        for term, tf in doc.items():
+            col["postings"].setdefault(term, {})[point_id] = tf
+        col["total_len"] += col["lens"][point_id]
+
+    def _apply_record(self, name: str, record: dict) -> None:
+        if record.get("drop"):
+            self._collections.pop(name, None)
+            return
+        col = self._collection(name)
+        for point_id in record.get("d", []):
+            self._remove(col, point_id)
+        for point_id, doc in record.get("u", []):
+            self._add(col, point_id, doc)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{quote(name, safe='')}.lex")
+
+    def _encode(self, record: dict) -> bytes:
+        blob = zlib.compress(json_dumps(record), 6)
+        return self.RECORD.pack(len(blob)) + blob
+
+    def _append(self, name: str, record: dict) -> None:
+        if self.path is None:
+            return
+        if record.get("drop"):
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+            return
+        with open(self._file(name), "ab") as f:
+            f.write(self._encode(record))
+        col = self._collection(name)
+        col["log_ops"] += len(record.get("u", [])) + len(record.get("d", []))
+        if col["log_ops"] > 2 * len(col["docs"]) + 10000:
+            self._compact(name, col)
+
+    def _compact(self, name: str, col: dict) -> None:
+        # Rewrite as a snapshot of live docs, chunked so no single record gets huge
+        tmp = self._file(name) + ".tmp"
+        docs = list(col["docs"].items())
+        with open(tmp, "wb") as f:
+            for start in range(0, len(docs), 10000):
+                f.write(self._encode({"u": [[point_id, doc] for point_id, doc in docs[start : start + 10000]]}))
+        os.replace(tmp, self._file(name))
+        col["log_ops"] = len(docs)
+        logger.info("Compacted lexical index for %s (%s docs)", name, len(docs))
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            for filename in os.listdir(self.path):
+                if not filename.endswith(".lex"):
+                    continue
+                name = unquote(filename[:-4])
+                file_path = os.path.join(self.path, filename)
+                good = ops = 0
+                with open(file_path, "rb") as f:
+                    data = f.read()
+                while good + self.RECORD.size <= len(data):
+                    (size,) = self.RECORD.unpack_from(data, good)
+                    try:
+                        record = json_loads(zlib.decompress(data[good + self.RECORD.size : good + self.RECORD.size + size]))
+                    except Exception:
+                        break
+                    self._apply_record(name, record)
+                    ops += len(record.get("u", [])) + len(record.get("d", []))
+                    good += self.RECORD.size + size
+                if good < len(data):
+                    # Torn write from a crash mid-append, drop the partial tail
+                    logger.warning("Truncating damaged lexical index %s at byte %s", file_path, good)
+                    with open(file_path, "r+b") as f:
+                        f.truncate(good)
+                self._collection(name)["log_ops"] = ops
+                logger.info("Lexical index for %s: %s docs", name, len(self._collection(name)['docs']))
+            self.ready = True
+
+    def update(self, name: str, upserts: list[tuple], deletes: list | None) -> None:
+        # deletes None drops the whole collection
+        record = {"drop": True} if deletes is None else {"u": [[point_id, self.terms(text)] for point_id, text in upserts], "d": deletes}
+        with self._lock:
+            self._apply_record(name, record)
+            self._append(name, record)
+
+    def search(self, name: str, query: str, limit: int) -> list:
+        with self._lock:
+            self._searches += 1
+            col = self._collections.get(name)
+            if not col or not col["docs"]:
+                return []
+            n = len(col["docs"])
+            avg_len = col["total_len"] / n
+            lens = col["lens"]
+            scores: dict = {}
+            for term in self.terms(query):
+                posting = col["postings"].get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for point_id, tf in posting.items():
+                    norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * lens[point_id] / avg_len))
+                    scores[point_id] = scores.get(point_id, 0.0) + idf * norm
+        return heapq.nlargest(limit, scores, key=scores.get)
+
+    def record_fused(self, count: int) -> None:
+        self._fused += count
+
+    def stats(self) -> dict:
+        with self._lock:
             return {
-                "size": len(self.cache),
-                "max_size": self.max_size,
-                "ttl_seconds": self.ttl,
-                "hits": self._hits,
-                "misses": self._misses,
-                "hit_rate": self._hits / (self._hits + self._misses) if (self._hits + self._misses) > 0 else 0.0
+                "ready": self.ready,
+                "error": self.error,
+                "path": self.path,
+                "collections": {
+                    name: {"docs": len(col["docs"]), "terms": len(col["postings"]), "log_ops": col["log_ops"]}
+                    for name, col in self._collections.items()
+                },
+                "searches": self._searches,
+                "fused_hits": self._fused
             }
 
 
-query_cache = QueryCache(max_size=1000, ttl_seconds=60)
-http_client = None
-model = None
+class SingleFlight:
+    # Concurrent calls with the same key share one execution and all get its result (or exception).
+    # The work runs in its own task, so the first caller hanging up doesn't cancel it for the rest.
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[bytes, asyncio.Task] = {}
+        self._leaders = 0
+        self._suppressed = 0
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    global http_client, model
-    
-    logger.info(f"Loading Reranker ({MODEL_PATH}) with TorchAO...")
-    try:
+    @staticmethod
+    def _retrieve(task: asyncio.Task) -> None:
+        # Keeps "exception never retrieved" quiet when every caller went away first
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: bytes, func, *args):
+        task = self._calls.get(key)
+        if task is None:
+            self._leaders += 1
+            SINGLEFLIGHT_CALLS.inc(self.name, "leader")
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._calls.pop(key, None) if self._calls.get(key) is done else None)
+            task.add_done_callback(self._retrieve)
+        else:
+            self._suppressed += 1
+            SINGLEFLIGHT_CALLS.inc(self.name, "suppressed")
+        return await asyncio.shield(task)
+
+    async def stats(self) -> dict:
+        total = self._leaders + self._suppressed
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self._leaders,
+            "suppressed": self._suppressed,
+            "suppressed_rate": self._suppressed / total if total > 0 else 0.0
+        }
+
+
+class RerankQueueFull(Exception):
+    pass
+
+
+class RerankBatcher:
+    # Collects (query, candidates) jobs from concurrent requests for up to window_ms or max_tokens,
+    # then runs them as one call on a single worker thread and hands each caller its own scores
+    def __init__(self, run_batch, window_ms: float = 2, max_tokens: int = 65536, max_queue: int = 256, fused=lambda: True):
+        self.run_batch = run_batch
+        self.fused = fused
+        self.window = window_ms / 1000
+        self.max_tokens = max_tokens
+        self.max_queue = max_queue
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._depth = 0
+        self._batches = 0
+        self._jobs = 0
+        self._rejected = 0
+
+    @staticmethod
+    def _estimate_tokens(query: str, candidates: list[str]) -> int:
+        return (len(query) + sum(len(c) for c in candidates)) // 4 + 1
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        while self._queue is not None and not self._queue.empty():
+            _, _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Reranker shutting down"))
+        # Later submits run directly, like before start(), instead of waiting on a queue nobody drains
+        self._queue = None
+
+    async def submit(self, query: str, candidates: list[str]) -> list[dict]:
+        if self._queue is None:
+            return await run_in_threadpool_timed("rerank", run_rerank_sync, query, candidates)
+        if self._depth >= self.max_queue:
+            self._rejected += 1
+            raise RerankQueueFull(f"Rerank queue full ({self._depth} pending)")
+
+        future = asyncio.get_running_loop().create_future()
+        self._depth += 1
+        try:
+            self._queue.put_nowait((query, candidates, self._estimate_tokens(query, candidates), future))
+            return await future
+        finally:
+            self._depth -= 1
+
+    async def submit_many(self, jobs: list[tuple[str, list[str]]]) -> list[list[dict]]:
+        # Enqueued in one go, so the worker picks them up together as a single batch
+        if self._queue is None:
+            results = await run_in_threadpool_timed("rerank", self.run_batch, jobs)
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+            return results
+        return await asyncio.gather(*(self.submit(query, candidates) for query, candidates in jobs))
+
+    async def _collect(self, batch: list[tuple]) -> tuple | None:
+        # Fills batch in place and returns the job that didn't fit. Backends that would only run the jobs
+        # back to back gain nothing from waiting, so they just take what is already queued.
+        loop = asyncio.get_running_loop()
+        tokens = batch[0][2]
+        deadline = loop.time() + (self.window if self.fused() else 0)
+        while tokens < self.max_tokens:
+            if not self._queue.empty():
+                job = self._queue.get_nowait()
+            else:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if tokens + job[2] > self.max_tokens:
+                return job
+            batch.append(job)
+            tokens += job[2]
+        return None
+
+    async def _run(self) -> None:
+        carry = None
+        batch = []
+        try:
+            while True:
+                batch = [carry if carry is not None else await self._queue.get()]
+                carry = None
+                carry = await self._collect(batch)
+                batch = [job for job in batch if not job[3].done()]
+                if not batch:
+                    continue
+
+                self._batches += 1
+                self._jobs += len(batch)
+                started = time.perf_counter()
+                try:
+                    results = await run_in_threadpool_timed("rerank", self.run_batch, [(job[0], job[1]) for job in batch])
+                except Exception as e:
+                    results = [e] * len(batch)
+                RERANK_BATCH_SECONDS.observe(time.perf_counter() - started)
+                RERANK_BATCH_JOBS.observe(len(batch))
+                RERANK_BATCH_CANDIDATES.observe(sum(len(job[1]) for job in batch))
+
+                for job, result in zip(batch, results):
+                    future = job[3]
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+                batch = []
+        except asyncio.CancelledError:
+            # Jobs already taken off the queue would otherwise never get an answer
+            for job in [*batch, carry]:
+                if job is not None and not job[3].done():
+                    job[3].set_exception(RuntimeError("Reranker shutting down"))
+            raise
+
+    async def stats(self) -> dict:
+        return {
+            "queue_depth": self._depth,
+            "max_queue": self.max_queue,
+            "window_ms": self.window * 1000,
+            "max_tokens": self.max_tokens,
+            "batches": self._batches,
+            "jobs": self._jobs,
+            "avg_batch_size": self._jobs / self._batches if self._batches > 0 else 0.0,
+            "rejected": self._rejected
+        }
+
+
+query_cache = QueryCache(max_size=CORRELATION_SIZE, ttl_seconds=CORRELATION_TTL, store=create_correlation_store(CORRELATION_BACKEND))
+rerank_score_cache = RerankScoreCache(max_size=RERANK_SCORE_CACHE_SIZE, ttl_seconds=RERANK_SCORE_CACHE_TTL)
+embedding_cache = EmbeddingCache(max_size=EMBED_CACHE_SIZE, path=EMBED_CACHE_PATH, disk_max=EMBED_CACHE_DISK_MAX, model_id=EMBED_MODEL_ID)
+embedding_flight = SingleFlight("embeddings")
+search_flight = SingleFlight("search")
+query_memo = QueryEmbeddingMemo(max_size=QUERY_MEMO_SIZE, ttl_seconds=QUERY_MEMO_TTL)
+lexical_index = LexicalIndex(path=LEXICAL_INDEX_PATH)
+# A single writer keeps index updates in request order and off the event loop
+lexical_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lexical")
+embed_in_flight = asyncio.Semaphore(EMBED_MAX_IN_FLIGHT)
+embed_bytes_budget = ByteBudget(EMBED_MAX_INFLIGHT_BYTES)
+
+
+class RerankerBackend(ABC):
+    name = "none"
+    fused_batch = False # True when rerank_batch scores several jobs in one call, worth waiting a window for
+
+    def load(self) -> None:
+        pass
+
+    @abstractmethod
+    def rerank(self, query: str, documents: list[str]) -> list[dict]:
+        ...
+
+    def rerank_batch(self, jobs: list[tuple[str, list[str]]]) -> list:
+        results = []
+        for query, documents in jobs:
+            try:
+                results.append(self.rerank(query, documents))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class CudaRerankerBackend(RerankerBackend):
+    # jina-reranker-v3 on the GPU: flash-attention, bf16, TorchAO Int4 weights
+    name = "cuda"
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self.model = None
+
+    def load(self) -> None:
+        import torch
+        from transformers import AutoModel
+        from torchao.quantization import quantize_, Int4WeightOnlyConfig
+
+        logger.info("Loading Reranker (%s) with TorchAO...", self.model_path)
         model = AutoModel.from_pretrained(
-            MODEL_PATH,
+            self.model_path,
             trust_remote_code=True,
             attn_implementation="flash_attention_2",
             torch_dtype=torch.bfloat16, 
@@ -126,22 +1379,503 @@ async def lifespan(app: FastAPI):
         quantize_(model, Int4WeightOnlyConfig(group_size=128))
         
         model.eval()
+        self.model = model
         logger.info("Reranker Loaded & Quantized")
+
+    def rerank(self, query: str, documents: list[str]) -> list[dict]:
+        return self.model.rerank(query, documents)
+
+
+class CpuRerankerBackend(RerankerBackend):
+    # Small pointwise cross-encoder with int8 dynamic-quantized Linear layers. Weaker than jina-v3, but it
+    # keeps GPU-less nodes (and CI) reranking. Pointwise means pairs from different queries share a pass.
+    name = "cpu"
+    fused_batch = True
+
+    def __init__(self, model_path: str, batch_size: int = 32, threads: int = 0):
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.threads = threads
+        self.model = None
+        self.tokenizer = None
+
+    def load(self) -> None:
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        logger.info("Loading CPU Reranker (%s) with int8 dynamic quantization...", self.model_path)
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
+        model.eval()
+        self.model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        logger.info("CPU Reranker Loaded")
+
+    def _score_pairs(self, queries: list[str], documents: list[str]) -> list[float]:
+        import torch
+
+        scores = []
+        with torch.inference_mode():
+            for start in range(0, len(documents), self.batch_size):
+                features = self.tokenizer(
+                    queries[start : start + self.batch_size],
+                    documents[start : start + self.batch_size],
+                    padding=True,
+                    truncation=True,
+                    max_length=512,
+                    return_tensors="pt"
+                )
+                logits = self.model(**features).logits
+                logits = logits[:, 0] if logits.shape[-1] == 1 else logits[:, -1]
+                scores.extend(torch.sigmoid(logits).tolist())
+        return scores
+
+    def rerank(self, query: str, documents: list[str]) -> list[dict]:
+        return self.rerank_batch([(query, documents)])[0]
+
+    def rerank_batch(self, jobs: list[tuple[str, list[str]]]) -> list:
+        queries = [query for query, documents in jobs for _ in documents]
+        documents = [document for _, job_documents in jobs for document in job_documents]
+        scores = self._score_pairs(queries, documents)
+
+        results = []
+        offset = 0
+        for _, job_documents in jobs:
+            job_scores = scores[offset : offset + len(job_documents)]
+            offset += len(job_documents)
+            ranked = [{"index": i, "relevance_score": score} for i, score in enumerate(job_scores)]
+            ranked.sort(key=lambda item: item["relevance_score"], reverse=True)
+            results.append(ranked)
+        return results
+
+
+class RemoteRerankerBackend(RerankerBackend):
+    fused_batch = True
+    # Sends batches to the one process that owns the GPU, so HTTP workers scale out without loading the
+    # model N times. The worker feeds them into its own batcher, merging batches from every caller.
+    name = "remote"
+
+    def __init__(self, url: str, wait_seconds: float = 900):
+        transport = None
+        if url.startswith("unix:"):
+            transport = httpx.HTTPTransport(uds=url[len("unix:"):])
+            url = "http://rerank-worker"
+        self.client = httpx.Client(base_url=url, transport=transport, timeout=120.0)
+        self.wait_seconds = wait_seconds
+
+    def load(self) -> None:
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            try:
+                resp = self.client.get("/ready")
+                reranker = resp.json().get("reranker", {})
+                if reranker.get("state") == "ready":
+                    logger.info("Rerank worker ready (%s)", reranker.get('backend'))
+                    return
+                if resp.status_code == 200:
+                    raise RuntimeError(f"rerank worker has no model: {reranker.get('error')}")
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"rerank worker not ready after {self.wait_seconds:.0f}s")
+            time.sleep(1)
+
+    def rerank(self, query: str, documents: list[str]) -> list[dict]:
+        result = self.rerank_batch([(query, documents)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def rerank_batch(self, jobs: list[tuple[str, list[str]]]) -> list:
+        resp = self.client.post(
+            "/v1/rerank",
+            content=json_dumps({"jobs": [[query, documents] for query, documents in jobs]}),
+            headers={"Content-Type": "application/json"}
+        )
+        if resp.status_code == 429:
+            raise RerankQueueFull("Rerank worker queue full")
+        resp.raise_for_status()
+        return [
+            RuntimeError(result["error"]) if "error" in result else result["results"]
+            for result in json_loads(resp.content)["results"]
+        ]
+
+
+def reranker_candidates(spec: str) -> list:
+    if spec == "none":
+        return []
+    if spec == "cuda":
+        return [CudaRerankerBackend(MODEL_PATH)]
+    if spec == "cpu":
+        return [CpuRerankerBackend(RERANK_CPU_MODEL_PATH, RERANK_CPU_BATCH_SIZE, RERANK_CPU_THREADS)]
+    if spec == "remote":
+        return [RemoteRerankerBackend(RERANK_WORKER_URL, RERANK_WORKER_WAIT)]
+    if spec == "auto":
+        try:
+            import torch
+            has_cuda = torch.cuda.is_available()
+        except Exception:
+            has_cuda = False
+        cpu = reranker_candidates("cpu")
+        return reranker_candidates("cuda") + cpu if has_cuda else cpu
+    # package.module:factory, for out-of-tree backends and test fakes
+    module_name, _, factory = spec.partition(":")
+    return [getattr(importlib.import_module(module_name), factory or "create_backend")()]
+
+
+http_client = None
+model = None
+reranker_status = {"state": "pending", "backend": None, "error": None}
+reranker_task: asyncio.Task | None = None
+
+async def warm_up_reranker() -> None:
+    global model
+    reranker_status.update(state="loading", backend=None, error=None)
+    try:
+        # auto imports torch to probe CUDA, and factories import their modules; both take seconds
+        candidates = await run_in_threadpool(reranker_candidates, RERANK_BACKEND)
     except Exception as e:
-        logger.error(f"Failed to load reranker: {e}")
+        candidates = []
+        reranker_status["error"] = str(e)
+        logger.error("Bad RERANK_BACKEND '%s': %s", RERANK_BACKEND, e)
+
+    for backend in candidates:
+        name = getattr(backend, "name", type(backend).__name__)
+        try:
+            load = getattr(backend, "load", None)
+            if load is not None:
+                await run_in_threadpool(load)
+        except Exception as e:
+            reranker_status["error"] = f"{name}: {e}"
+            logger.error("Failed to load reranker backend '%s': %s", name, e)
+            continue
+        model = backend
+        reranker_status.update(state="ready", backend=name, error=None)
+        logger.info("Reranker backend '%s' ready", name)
+        return
+
+    reranker_status["state"] = "disabled" if RERANK_BACKEND == "none" else "failed"
+    logger.warning("No reranker backend available - searches will return vector order")
 
+def ensure_reranker() -> None:
+    global reranker_task
+    if reranker_task is None:
+        reranker_task = asyncio.create_task(warm_up_reranker())
+
+def report_lexical_load(future: asyncio.Future) -> None:
+    # Done callback for the startup load. The index stays not ready, so searches fall back to vector only.
+    error = None if future.cancelled() else future.exception()
+    if error is not None:
+        lexical_index.error = str(error)
+        logger.error("Failed to load lexical index from %s: %s", lexical_index.path, error)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+
+    # Nothing heavy blocks startup: health checks and plain proxying work while models load
+    if RERANK_WARMUP != "lazy":
+        ensure_reranker()
+    tokenizer_task = asyncio.create_task(run_in_threadpool(load_tokenizer))
+
+    embedding_cache.open()
+    if HYBRID_SEARCH:
+        asyncio.get_running_loop().run_in_executor(lexical_writer, lexical_index.load).add_done_callback(report_lexical_load)
+    rerank_batcher.start()
     http_client = httpx.AsyncClient(
         timeout=120.0, 
         limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
     )
     yield
+    await rerank_batcher.stop()
     await http_client.aclose()
+    await query_cache.backend.close()
+    embedding_cache.close()
+    tokenizer_task.cancel()
 
 app = FastAPI(lifespan=lifespan)
 
+def route_label(path: str) -> str:
+    if path == "/v1/embeddings":
+        return "embeddings"
+    if "/points/search" in path or "/points/query" in path:
+        return "search"
+    if path.startswith(("/v1/", "/proxy/")) or path in ("/health", "/ready"):
+        return "admin"
+    return "proxy"
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, so streamed proxy bodies stay streamed
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = route_label(scope["path"])
+        started = time.perf_counter()
+        request_bytes = 0
+        response_bytes = 0
+        trace_id = None
+        token = None
+        if LOG_TRACE_IDS:
+            for name, value in scope["headers"]:
+                if name == b"x-request-id":
+                    trace_id = value.decode("latin-1")[:64]
+                    break
+            trace_id = trace_id or os.urandom(6).hex()
+            token = trace_id_var.set(trace_id)
+
+        async def counted_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counted_send(message):
+            nonlocal response_bytes
+            if message["type"] == "http.response.start" and trace_id is not None:
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", trace_id.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counted_receive, counted_send)
+        finally:
+            HTTP_SECONDS.observe(time.perf_counter() - started, route)
+            HTTP_REQUEST_BYTES.observe(request_bytes, route)
+            HTTP_RESPONSE_BYTES.observe(response_bytes, route)
+            if token is not None:
+                trace_id_var.reset(token)
+
+app.add_middleware(MetricsMiddleware)
+
 def run_rerank_sync(query, candidates):
     return model.rerank(query, candidates)
 
+def run_rerank_batch_sync(jobs):
+    # jina-reranker-v3 is listwise, one query per forward pass. Use a batched entrypoint if the backend
+    # has one, otherwise run the jobs back to back so concurrent requests don't fight over the GPU.
+    rerank_batch = getattr(model, "rerank_batch", None)
+    if rerank_batch is not None:
+        return rerank_batch(jobs)
+    results = []
+    for query, candidates in jobs:
+        try:
+            results.append(model.rerank(query, candidates))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def rerank_depth(original_limit: int) -> int:
+    depth = math.ceil(original_limit * RERANK_DEPTH_MULTIPLIER)
+    return max(original_limit, RERANK_MIN_CANDIDATES, min(depth, RERANK_MAX_CANDIDATES))
+
+def trim_rerank_candidates(candidates: list[str], vector_scores: list[float] | None, keep: int) -> int:
+    # Qdrant returns hits best-first, so cutting the tail only drops the least likely candidates
+    count = len(candidates)
+    if RERANK_SCORE_GAP > 0 and vector_scores is not None:
+        for i in range(max(keep, 1), count):
+            if vector_scores[i - 1] - vector_scores[i] >= RERANK_SCORE_GAP:
+                count = i
+                break
+    if RERANK_TOKEN_BUDGET > 0:
+        tokens = 0
+        for i in range(count):
+            tokens += len(candidates[i]) // 4 + 1
+            if tokens > RERANK_TOKEN_BUDGET:
+                count = max(i, 1)
+                break
+    return count
+
+rerank_depth_stats = {"searches": 0, "requested": 0, "reranked": 0, "returned": 0}
+
+def record_rerank_depth(requested: int, reranked: int, returned: int) -> dict[str, str]:
+    rerank_depth_stats["searches"] += 1
+    rerank_depth_stats["requested"] += requested
+    rerank_depth_stats["reranked"] += reranked
+    rerank_depth_stats["returned"] += returned
+    log_sampler.info("rerank_depth", "Rerank depth: requested %s, reranked %s, returned %s", requested, reranked, returned)
+    return {
+        "X-Rerank-Candidates-Requested": str(requested),
+        "X-Rerank-Candidates-Reranked": str(reranked),
+        "X-Rerank-Candidates-Returned": str(returned)
+    }
+
+def model_fuses_batches() -> bool:
+    # Backends outside RerankerBackend (module:factory) are trusted if they bring their own rerank_batch
+    return getattr(model, "fused_batch", hasattr(model, "rerank_batch"))
+
+rerank_batcher = RerankBatcher(
+    run_rerank_batch_sync,
+    window_ms=RERANK_BATCH_WINDOW_MS,
+    max_tokens=RERANK_BATCH_MAX_TOKENS,
+    max_queue=RERANK_QUEUE_DEPTH,
+    fused=model_fuses_batches
+)
+
+tokenizer_state = {"loaded": False, "tokenizer": None}
+tokenizer_lock = threading.Lock()
+
+def load_tokenizer():
+    # Only the lifespan warm-up calls this, from the threadpool. Until it finishes count_tokens estimates,
+    # so a query arriving mid-load never loads a second copy on the event loop.
+    with tokenizer_lock:
+        if tokenizer_state["loaded"]:
+            return tokenizer_state["tokenizer"]
+        try:
+            from transformers import AutoTokenizer
+            tokenizer_state["tokenizer"] = AutoTokenizer.from_pretrained(EMBED_TOKENIZER_PATH)
+            logger.info("Loaded embedding tokenizer (%s)", EMBED_TOKENIZER_PATH)
+        except Exception as e:
+            logger.warning("Failed to load embedding tokenizer, estimating 4 chars/token: %s", e)
+        tokenizer_state["loaded"] = True
+        return tokenizer_state["tokenizer"]
+
+def count_tokens(texts: list[str]) -> list[int]:
+    tokenizer = tokenizer_state["tokenizer"]
+    if tokenizer is None:
+        return [max(1, len(t) // 4) for t in texts]
+    encoded = tokenizer(texts, add_special_tokens=True, truncation=False, verbose=False)["input_ids"]
+    return [min(len(ids), EMBED_MAX_INPUT_TOKENS) for ids in encoded]
+
+def plan_embed_batches(token_counts: list[int]) -> list[list[int]]:
+    # Budget is padded tokens (longest x count), so one huge file can't ride along with 63 one-liners.
+    # Sorting by length first keeps similar sizes together and the padding small.
+    order = sorted(range(len(token_counts)), key=token_counts.__getitem__) if EMBED_SORT_BY_LENGTH else range(len(token_counts))
+    batches = []
+    current = []
+    longest = 0
+    for i in order:
+        longest_with = max(longest, token_counts[i])
+        if current and (len(current) >= EMBED_BATCH_SIZE or longest_with * (len(current) + 1) > EMBED_BATCH_MAX_TOKENS):
+            batches.append(current)
+            current = []
+            longest_with = token_counts[i]
+        current.append(i)
+        longest = longest_with
+    if current:
+        batches.append(current)
+    return batches
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
+class EmbedReplyMismatch(Exception):
+    pass
+
+def embed_reply_vectors(data, expected: int) -> list:
+    # TEI's /embed answers a list in input order. An OpenAI-style {"data": [...]} reply is put back in
+    # order by index. Anything short, duplicated or out of range would leave holes in the response.
+    if isinstance(data, dict) and isinstance(data.get("data"), list):
+        vectors = [None] * expected
+        for item in data["data"]:
+            index = item.get("index") if isinstance(item, dict) else None
+            if not isinstance(index, int) or not 0 <= index < expected or vectors[index] is not None:
+                raise EmbedReplyMismatch(f"TEI returned an embedding with index {index!r} for {expected} inputs")
+            vectors[index] = item.get("embedding")
+        data = vectors
+    if not isinstance(data, list) or len(data) != expected or not all(isinstance(vector, list) for vector in data):
+        got = len(data) if isinstance(data, list) else type(data).__name__
+        raise EmbedReplyMismatch(f"TEI returned {got} embeddings for {expected} inputs")
+    return data
+
+embed_reply_state = {"dim": None} # Learned from the first reply, so the budget can count what comes back
+
+def embed_batch_bytes(batch_inputs: list[str]) -> int:
+    # A reply is dim floats of JSON per input, tens of times the request for short inputs
+    request_bytes = sum(len(t.encode()) for t in batch_inputs)
+    dim = embed_reply_state["dim"]
+    return request_bytes + (len(batch_inputs) * dim * EMBED_REPLY_BYTES_PER_FLOAT if dim else 0)
+
+async def post_embed_batch(batch_inputs: list[str], batch_no: int) -> list:
+    size = embed_batch_bytes(batch_inputs)
+    async with embed_in_flight:
+        held = await embed_bytes_budget.acquire(size)
+        try:
+            for attempt in range(EMBED_BATCH_RETRIES + 1):
+                try:
+                    started = time.perf_counter()
+                    resp = await http_client.post(
+                        f"{TEI_BASE_URL}/embed",
+                        json={"inputs": batch_inputs, "truncate": True}
+                    )
+                    UPSTREAM_SECONDS.observe(time.perf_counter() - started, "tei_embed")
+                    UPSTREAM_BYTES.observe(len(resp.content), "tei_embed")
+                    resp.raise_for_status()
+                    vectors = embed_reply_vectors(json_loads(resp.content), len(batch_inputs))
+                    embed_reply_state["dim"] = len(vectors[0]) if vectors else embed_reply_state["dim"]
+                    return vectors
+                except Exception as e:
+                    if attempt == EMBED_BATCH_RETRIES or not is_retryable(e):
+                        raise
+                    wait_time = random.uniform(0, 0.1 * (2 ** attempt))
+                    logger.warning("Embed batch %s failed (%s), retry %s in %.2fs", batch_no, e, attempt + 1, wait_time)
+                    await asyncio.sleep(wait_time)
+        finally:
+            await embed_bytes_budget.release(held)
+
+async def embed_batches(inputs: list[str], token_counts: list[int]) -> list:
+    batches = plan_embed_batches(token_counts)
+    tasks = [asyncio.create_task(post_embed_batch([inputs[i] for i in batch], n)) for n, batch in enumerate(batches)]
+    try:
+        batch_results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    # Undo the length sort
+    embeddings = [None] * len(inputs)
+    for batch, batch_embeddings in zip(batches, batch_results):
+        for i, vec in zip(batch, batch_embeddings):
+            embeddings[i] = vec
+    return embeddings
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "reranker": reranker_status}
+
+@app.get("/ready")
+async def ready():
+    # Ready once warm-up has settled either way; a failed backend still serves, just without reranking
+    settled = reranker_status["state"] in ("ready", "failed", "disabled") or (RERANK_WARMUP == "lazy" and reranker_task is None)
+    return Response(
+        content=json_dumps({"ready": settled, "reranker": reranker_status}),
+        status_code=200 if settled else 503,
+        media_type="application/json"
+    )
+
+async def rerank_jobs(request: Request):
+    # IPC entrypoint for RERANK_BACKEND=remote workers; their jobs join this process's batcher. Only the
+    # rerank worker registers it, so it can't be reached on the public port.
+    try:
+        jobs = json_loads(await request.body())["jobs"]
+    except:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if model is None:
+        raise HTTPException(status_code=503, detail="Reranker not ready")
+
+    results = await asyncio.gather(
+        *(rerank_batcher.submit(query, documents) for query, documents in jobs), return_exceptions=True
+    )
+    if any(isinstance(result, RerankQueueFull) for result in results):
+        raise HTTPException(status_code=429, detail="Rerank queue full")
+    return json_response({"results": [
+        {"error": str(result)} if isinstance(result, Exception) else
+        {"results": [{"index": item["index"], "relevance_score": float(item["relevance_score"])} for item in result]}
+        for result in results
+    ]})
+
+if SMARTPROXY_ROLE == "rerank-worker":
+    app.add_api_route("/v1/rerank", rerank_jobs, methods=["POST"])
+
 @app.get("/v1/models")
 async def list_models():
     return {
@@ -154,15 +1888,79 @@ async def list_models():
 
 @app.get("/v1/cache/stats")
 async def cache_stats():
-    return await query_cache.stats()
+    stats = await query_cache.stats()
+    stats["query_memo"] = await query_memo.stats()
+    stats["embeddings"] = await embedding_cache.stats()
+    stats["rerank_scores"] = await rerank_score_cache.stats()
+    stats["rerank_batcher"] = await rerank_batcher.stats()
+    stats["singleflight"] = {"embeddings": await embedding_flight.stats(), "search": await search_flight.stats()}
+    if HYBRID_SEARCH:
+        stats["lexical"] = lexical_index.stats()
+    searches = rerank_depth_stats["searches"]
+    stats["rerank_depth"] = {
+        **rerank_depth_stats,
+        "avg_requested": rerank_depth_stats["requested"] / searches if searches > 0 else 0.0,
+        "avg_reranked": rerank_depth_stats["reranked"] / searches if searches > 0 else 0.0,
+        "avg_returned": rerank_depth_stats["returned"] / searches if searches > 0 else 0.0
+    }
+    return stats
+
+@app.get("/proxy/metrics") # Qdrant serves its own /metrics, still reached through catch_all_proxy
+async def metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    # Cache and queue state is already counted by its owner, just re-shape it at scrape time
+    caches = {
+        "query": await query_cache.stats(),
+        "query_memo": await query_memo.stats(),
+        "embeddings": await embedding_cache.stats(),
+        "rerank_scores": await rerank_score_cache.stats()
+    }
+    lines.append("# HELP proxy_cache_lookups_total Cache lookups by result")
+    lines.append("# TYPE proxy_cache_lookups_total counter")
+    for name, stats in caches.items():
+        lines.append(f'proxy_cache_lookups_total{{cache="{name}",result="hit"}} {stats["hits"] + stats.get("disk_hits", 0)}')
+        lines.append(f'proxy_cache_lookups_total{{cache="{name}",result="miss"}} {stats["misses"]}')
+    lines.append("# HELP proxy_cache_entries Entries held in memory")
+    lines.append("# TYPE proxy_cache_entries gauge")
+    for name, stats in caches.items():
+        if stats["size"] is not None: # Redis doesn't report a per-store size
+            lines.append(f'proxy_cache_entries{{cache="{name}"}} {stats["size"]}')
+    lines.append("# HELP proxy_embedding_cache_bytes_saved_total Input and vector bytes not sent to TEI")
+    lines.append("# TYPE proxy_embedding_cache_bytes_saved_total counter")
+    lines.append(f'proxy_embedding_cache_bytes_saved_total {caches["embeddings"]["bytes_saved"]}')
+
+    lines.append("# HELP proxy_reranker_ready 1 when a reranker backend is loaded")
+    lines.append("# TYPE proxy_reranker_ready gauge")
+    lines.append(f'proxy_reranker_ready{{backend="{reranker_status["backend"] or "none"}"}} {int(reranker_status["state"] == "ready")}')
+
+    if isinstance(log_handler, DroppingQueueHandler):
+        lines.append("# HELP proxy_log_lines_dropped_total Log lines dropped because stdout fell behind")
+        lines.append("# TYPE proxy_log_lines_dropped_total counter")
+        lines.append(f"proxy_log_lines_dropped_total {log_handler.dropped}")
+
+    batcher = await rerank_batcher.stats()
+    lines.append("# HELP proxy_rerank_queue_depth Rerank jobs waiting or running")
+    lines.append("# TYPE proxy_rerank_queue_depth gauge")
+    lines.append(f"proxy_rerank_queue_depth {batcher['queue_depth']}")
+    lines.append("# HELP proxy_rerank_rejected_total Rerank jobs shed because the queue was full")
+    lines.append("# TYPE proxy_rerank_rejected_total counter")
+    lines.append(f"proxy_rerank_rejected_total {batcher['rejected']}")
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 @app.post("/v1/embeddings")
 async def create_embeddings(request: Request):
     try:
-        body = await request.json()
+        body = json_loads(await request.body())
     except:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
+    encoding_format = body.get("encoding_format") or "float"
+    if encoding_format not in ("float", "base64"):
+        raise HTTPException(status_code=400, detail=f"Unsupported encoding_format: {encoding_format}")
+
     raw_input = body.get("input")
     if not raw_input:
         raise HTTPException(status_code=400, detail="Missing input")
@@ -175,6 +1973,22 @@ async def create_embeddings(request: Request):
     is_query = len(texts) == 1 and len(texts[0]) < 2000
     original_query_text = texts[0] if is_query else None
 
+    if is_query:
+        memo_key = QueryEmbeddingMemo.key(original_query_text)
+        memo = query_memo.get(memo_key)
+        if memo is not None:
+            # Still refresh the correlation, with this exact text, so the search that follows reranks
+            vector, prompt_tokens = memo
+            await query_cache.store(vector, original_query_text)
+            return embedding_response([vector], prompt_tokens, encoding_format)
+
+    # Identical inputs already in flight share that TEI call; the encoding is applied per caller
+    flight_key = hashlib.blake2b(json_dumps(texts), digest_size=16).digest()
+    vectors, prompt_tokens = await embedding_flight.do(flight_key, embed_texts, texts, is_query)
+    return embedding_response(vectors, prompt_tokens, encoding_format)
+
+async def embed_texts(texts: list[str], is_query: bool) -> tuple[list, int]:
+    original_query_text = texts[0] if is_query else None
     processed_inputs = []
     for t in texts:
         if is_query:
@@ -182,192 +1996,735 @@ async def create_embeddings(request: Request):
         else:
             processed_inputs.append(PASSAGE_PREFIX + t)
 
-    all_embeddings = []
-    total_items = len(processed_inputs)
+    cached, keys = await embedding_cache.get_many(processed_inputs)
+
+    # Dedupe misses so repeated chunks in one request hit TEI once. Hits carry their token count, so only
+    # misses (and hits stored before counts were kept) get tokenized.
+    miss_positions: dict[bytes, list[int]] = {}
+    uncounted: dict[bytes, list[int]] = {}
+    token_counts = [0] * len(processed_inputs)
+    all_embeddings = [None] * len(processed_inputs)
+    for i, entry in enumerate(cached):
+        if entry is None:
+            miss_positions.setdefault(keys[i], []).append(i)
+        else:
+            all_embeddings[i], tokens = entry
+            if tokens is None:
+                uncounted.setdefault(keys[i], []).append(i)
+            else:
+                token_counts[i] = tokens
+
+    to_count = [processed_inputs[positions[0]] for positions in (*miss_positions.values(), *uncounted.values())]
+    # A handoff costs more than tokenizing a query or two, but a few large files would stall the loop
+    if sum(map(len, to_count)) > EMBED_INLINE_TOKENIZE_CHARS:
+        counted = await run_in_threadpool_timed("tokenize", count_tokens, to_count)
+    elif to_count:
+        counted = count_tokens(to_count)
+    else:
+        counted = []
+    for positions, tokens in zip((*miss_positions.values(), *uncounted.values()), counted):
+        for i in positions:
+            token_counts[i] = tokens
+
+    miss_keys = list(miss_positions)
+    miss_inputs = [processed_inputs[positions[0]] for positions in miss_positions.values()]
+    miss_tokens = [token_counts[positions[0]] for positions in miss_positions.values()]
+    total_items = len(miss_inputs)
     
-    if total_items > RERANK_BATCH_SIZE:
-        logger.info(f"Chunking {total_items} inputs into batches of {RERANK_BATCH_SIZE}")
+    if total_items > EMBED_BATCH_SIZE:
+        log_sampler.info("embed_batches", "Batching %s uncached inputs by %s tokens, %s in flight", total_items, EMBED_BATCH_MAX_TOKENS, EMBED_MAX_IN_FLIGHT)
     
     try:
-        for batch_start in range(0, total_items, RERANK_BATCH_SIZE):
-            batch_end = min(batch_start + RERANK_BATCH_SIZE, total_items)
-            batch_inputs = processed_inputs[batch_start:batch_end]
-            
-            resp = await http_client.post(
-                f"{TEI_BASE_URL}/embed",
-                json={"inputs": batch_inputs, "truncate": True}
-            )
-            resp.raise_for_status()
-            batch_embeddings = resp.json()
-            all_embeddings.extend(batch_embeddings)
-            
-            if total_items > RERANK_BATCH_SIZE:
-                logger.debug(f"Processed batch {batch_start // RERANK_BATCH_SIZE + 1}/{(total_items + RERANK_BATCH_SIZE - 1) // RERANK_BATCH_SIZE}")
+        fresh_embeddings = await embed_batches(miss_inputs, miss_tokens)
     except httpx.HTTPStatusError as e:
-        logger.error(f"TEI Embedder Failed: {e.response.status_code} - {e.response.text}")
+        logger.error("TEI Embedder Failed: %s - %s", e.response.status_code, e.response.text)
         raise HTTPException(status_code=500, detail=f"Embedder Failed: {e.response.status_code}")
+    except EmbedReplyMismatch as e:
+        logger.error("TEI Embedder Failed: %s", e)
+        raise HTTPException(status_code=502, detail="Embedder returned a malformed batch")
     except Exception as e:
-        logger.error(f"TEI Embedder Failed: {e}")
+        logger.error("TEI Embedder Failed: %s", e)
         raise HTTPException(status_code=500, detail="Embedder Failed")
 
+    # Older rows are written back with their count so the next hit skips the tokenizer
+    await embedding_cache.put_many(
+        miss_keys + list(uncounted),
+        fresh_embeddings + [all_embeddings[positions[0]] for positions in uncounted.values()],
+        miss_tokens + [token_counts[positions[0]] for positions in uncounted.values()]
+    )
+    for key, vec in zip(miss_keys, fresh_embeddings):
+        for i in miss_positions[key]:
+            all_embeddings[i] = vec
+
     if is_query and original_query_text and all_embeddings and len(all_embeddings) > 0:
         await query_cache.store(all_embeddings[0], original_query_text)
 
-    total_chars = sum(len(t) for t in texts)
-    approx_tokens = max(1, total_chars // 4)
+    prompt_tokens = sum(token_counts)
+    if is_query:
+        query_memo.put(QueryEmbeddingMemo.key(original_query_text), all_embeddings[0], prompt_tokens)
+    return all_embeddings, prompt_tokens
+
+def embedding_response(vectors: list, prompt_tokens: int, encoding_format: str) -> Response:
+    if encoding_format == "base64":
+        encoded = [base64.b64encode(pack_vector(vec)).decode() for vec in vectors]
+    else:
+        encoded = [vec.tolist() if isinstance(vec, array) else vec for vec in vectors]
     
-    return {
+    return json_response({
         "object": "list",
-        "data": [{"object": "embedding", "embedding": vec, "index": i} for i, vec in enumerate(all_embeddings)],
+        "data": [{"object": "embedding", "embedding": vec, "index": i} for i, vec in enumerate(encoded)],
         "model": "jina-code-embeddings",
-        "usage": {"prompt_tokens": approx_tokens, "total_tokens": approx_tokens}
-    }
+        "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+    })
 
-@app.post("/collections/{collection_name}/points/search")
-async def proxy_qdrant_search(collection_name: str, request: Request):
-    logger.info(f"Search: {collection_name}")
-    
+async def score_candidate_groups(groups: list[tuple[str, str, list[str], list]]) -> list[list[float]]:
+    # groups are (collection, query_text, candidates, point_ids). Every group's cache lookups happen up
+    # front and all misses go to the batcher together, so a batch of searches costs one model pass.
+    group_scores = []
+    jobs = []
+    pending = []
+    total = 0
+    for collection_name, query_text, candidates, point_ids in groups:
+        query_key = rerank_score_cache.key(query_text)
+        scores, text_keys = rerank_score_cache.get_many(query_key, candidates)
+        rerank_score_cache.track(collection_name, point_ids, text_keys)
+        group_scores.append(scores)
+        total += len(candidates)
+
+        # Only misses go to the model. The reranker is listwise, so a cached score came from a different
+        # candidate list; close enough for ordering, and far cheaper than another forward pass.
+        misses = [i for i, score in enumerate(scores) if score is None]
+        for batch_start in range(0, len(misses), RERANK_BATCH_SIZE):
+            chunk = misses[batch_start : batch_start + RERANK_BATCH_SIZE]
+            jobs.append((query_text, [candidates[i] for i in chunk]))
+            pending.append((scores, query_key, text_keys, chunk))
+
+    if not jobs:
+        log_sampler.info("rerank", "All %s rerank scores cached", total)
+        return group_scores
+
+    missed = sum(len(chunk) for _, _, _, chunk in pending)
+    log_sampler.info("rerank", "Reranking %s candidates across %s queries (%s cached)", missed, len(groups), total - missed)
+    batch_results = await rerank_batcher.submit_many(jobs)
+    for (scores, query_key, text_keys, chunk), batch_scores in zip(pending, batch_results):
+        for item in batch_scores:
+            i = chunk[item["index"]]
+            scores[i] = float(item["relevance_score"])
+            rerank_score_cache.put(query_key, text_keys[i], scores[i])
+    return group_scores
+
+async def score_candidate_groups_incremental(groups: list[tuple[str, str, list[str], list]], limits: list[int], thresholds: list[float | None]) -> list[list[float]]:
+    # Scores each group in vector order, a round at a time, and returns only the scored prefix. A group
+    # stops once `limit` scores clear its threshold, or after RERANK_EARLY_STOP_PATIENCE rounds in a row
+    # where nothing broke into its top `limit`. Rounds still batch all active groups into one model pass.
+    group_scores = [[] for _ in groups]
+    stable = [0] * len(groups)
+    active = list(range(len(groups)))
+    while active:
+        rounds = []
+        for g in active:
+            collection_name, query_text, candidates, point_ids = groups[g]
+            start = len(group_scores[g])
+            end = start + (RERANK_INCREMENTAL_BATCH if start else max(limits[g], RERANK_INCREMENTAL_BATCH))
+            rounds.append((collection_name, query_text, candidates[start:end], point_ids[start:end]))
+        round_scores = await score_candidate_groups(rounds)
+
+        still_active = []
+        for g, scores in zip(active, round_scores):
+            scored = group_scores[g]
+            limit = max(limits[g], 1)
+            kth = heapq.nlargest(limit, scored)[-1] if len(scored) >= limit else None
+            scored.extend(scores)
+            if len(scored) >= len(groups[g][2]):
+                continue
+            stable[g] = stable[g] + 1 if kth is not None and max(scores) <= kth else 0
+            if thresholds[g] is not None and sum(score >= thresholds[g] for score in scored) >= limit:
+                continue
+            if RERANK_EARLY_STOP_PATIENCE > 0 and stable[g] >= RERANK_EARLY_STOP_PATIENCE:
+                continue
+            still_active.append(g)
+        active = still_active
+    return group_scores
+
+async def score_candidates(collection_name: str, query_text: str, candidates: list[str], point_ids: list) -> list[float]:
+    return (await score_candidate_groups([(collection_name, query_text, candidates, point_ids)]))[0]
+
+class VectorStripper:
+    # Tees a point write as it streams through, minus the contents of long numeric arrays under a
+    # "vector" or "vectors" key. Ids and payloads survive, so the buffered copy stays payload-sized and
+    # parses fast. String and nesting state is tracked across chunks, so numbers inside payload text and
+    # numeric arrays anywhere else (point id lists) are never touched.
+    LONG_ARRAY = re.compile(rb"\[[-0-9.eE+,\s]{64,}")
+    NUMERIC_RUN = re.compile(rb"[-0-9.eE+,\s]*")
+    STRING_REST = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+    STRUCTURAL = re.compile(rb'["\[\]{},]')
+    VECTOR_KEY = re.compile(rb'"vectors?"\s*:')
+    PARTIAL_VECTOR_KEY = re.compile(rb'"(?:v(?:e(?:c(?:t(?:o(?:r(?:s?"\s*|s)?)?)?)?)?)?)?\Z')
+
+    def __init__(self):
+        self.parts: list[bytes] = []
+        self._carry = b""
+        self._in_string = False
+        self._skipping = False
+        self._depth = 0
+        self._vector_depth: int | None = None # Depth of the object holding the vector key we're under
+
+    def feed(self, chunk: bytes) -> None:
+        data = self._carry + chunk
+        self._carry = b""
+        pos = start = 0
+        end = len(data)
+        while pos < end:
+            if self._skipping:
+                pos = start = self.NUMERIC_RUN.match(data, pos).end()
+                self._skipping = pos == end
+                continue
+            if self._in_string:
+                pos = self.STRING_REST.match(data, pos).end()
+                if pos < end and data[pos] == 0x5C:
+                    # Chunk ends on a backslash; what it escapes arrives with the next chunk
+                    self._carry = data[pos:]
+                    end = pos
+                elif pos < end:
+                    pos += 1
+                    self._in_string = False
+                continue
+            match = self.STRUCTURAL.search(data, pos)
+            if match is None:
+                break
+            pos = match.end()
+            token = match.group()
+            if token == b'"':
+                key = self.VECTOR_KEY.match(data, match.start())
+                if key and self._vector_depth is None:
+                    self._vector_depth = self._depth
+                    pos = key.end()
+                elif self._vector_depth is None and self.PARTIAL_VECTOR_KEY.match(data, match.start()):
+                    # May be a vector key cut by the chunk boundary, decide once the rest arrives
+                    self._carry = data[match.start():]
+                    end = match.start()
+                else:
+                    self._in_string = True
+                continue
+            if token in (b"]", b"}", b","):
+                if token != b",":
+                    self._depth -= 1
+                if self._vector_depth is not None and self._depth <= self._vector_depth:
+                    self._vector_depth = None # The vector value ended
+                continue
+            if token == b"[" and self._vector_depth is not None:
+                array = self.LONG_ARRAY.match(data, match.start())
+                if array:
+                    self.parts.append(data[start:pos])
+                    pos = start = array.end()
+                    # Still inside the array if it runs to the end; the rest of it comes with the next chunk
+                    self._skipping = pos == end
+                elif self.NUMERIC_RUN.match(data, pos).end() == end:
+                    # Too short to call yet, it may still grow past the threshold
+                    self._carry = data[match.start():]
+                    end = match.start()
+                    continue
+            self._depth += 1
+        self.parts.append(data[start:end])
+
+    def body(self) -> bytes:
+        return b"".join(self.parts) + self._carry
+
+POINT_MUTATION_PATH = re.compile(r"^collections/([^/]+)/points(?:/(payload(?:/delete|/clear)?|delete|batch))?/?$")
+
+def parse_point_mutation(method: str, path_name: str, raw: bytes) -> tuple[str, list | None] | None:
+    # (collection, touched point ids) for requests that change point payloads. ids None = can't tell
+    # which (filter selectors, batch ops, dropped collection), so treat the whole collection as touched.
+    if method == "DELETE":
+        match = re.match(r"^collections/([^/]+)/?$", path_name)
+        return (match.group(1), None) if match else None
+    match = POINT_MUTATION_PATH.match(path_name)
+    if not match or method not in ("POST", "PUT"):
+        return None
+    collection_name, operation = match.groups()
+    if operation is None and method != "PUT":
+        return None
+    if operation == "batch":
+        return collection_name, None
+
+    body = json_loads(raw)
+    if operation is None:
+        if "batch" in body:
+            return collection_name, list(body["batch"].get("ids", []))
+        return collection_name, [point.get("id") for point in body.get("points", [])]
+    points = body.get("points")
+    return collection_name, list(points) if isinstance(points, list) else None
+
+CANDIDATE_TEXT_KEYS = {"text", "content", "snippet", "code", "file_path", "path", "filename"}
+
+def parse_lexical_update(method: str, path_name: str, raw: bytes) -> tuple[str, list, list | None] | None:
+    # (collection, [(id, text)] to index, ids to drop). Dropped ids None = the collection is gone.
+    if method == "DELETE":
+        match = re.match(r"^collections/([^/]+)/?$", path_name)
+        return (match.group(1), [], None) if match else None
+    match = POINT_MUTATION_PATH.match(path_name)
+    if not match:
+        return None
+    collection_name, operation = match.groups()
+    body = json_loads(raw)
+    upserts = []
+    deletes = []
+
+    def upsert_points(points_body: dict) -> None:
+        if "batch" in points_body:
+            ids = points_body["batch"].get("ids", [])
+            payloads = points_body["batch"].get("payloads") or [None] * len(ids)
+            points = [{"id": point_id, "payload": payload} for point_id, payload in zip(ids, payloads)]
+        else:
+            points = points_body.get("points", [])
+        for point in points:
+            text = candidate_text(point)
+            if text:
+                upserts.append((point.get("id"), text))
+            else:
+                deletes.append(point.get("id"))
+
+    def delete_points(selector: dict) -> None:
+        # Filter selectors are left alone; fused hits Qdrant no longer has are dropped at fetch time
+        if isinstance(selector.get("points"), list):
+            deletes.extend(selector["points"])
+
+    if operation is None and method == "PUT":
+        upsert_points(body)
+    elif operation == "delete":
+        delete_points(body)
+    elif operation == "batch":
+        for op in body.get("operations", []):
+            if "upsert" in op:
+                upsert_points(op["upsert"])
+            elif "delete" in op:
+                delete_points(op["delete"])
+    elif operation == "payload" and method == "PUT":
+        # Overwrite replaces the whole payload, so it can be indexed as is
+        if isinstance(body.get("points"), list):
+            text = candidate_text(body)
+            upserts.extend((point_id, text) for point_id in body["points"] if text)
+            deletes.extend(point_id for point_id in body["points"] if not text)
+    elif operation is not None and operation.startswith("payload"):
+        # Partial edits can't be merged without the rest of the payload, so unindex points whose text
+        # changed. The vector side still finds them.
+        keys = set(body.get("payload") or {}) | set(body.get("keys") or [])
+        if operation == "payload/clear" or keys & CANDIDATE_TEXT_KEYS:
+            delete_points(body)
+    return (collection_name, upserts, deletes) if upserts or deletes else None
+
+def apply_lexical_update(method: str, path_name: str, raw: bytes) -> None:
     try:
-        body = await request.json()
-        original_limit = body.get("limit", 20)
-        original_score_threshold = body.pop("score_threshold", None)
-        logger.info(f"Request received. Limit {original_limit}, Score Threshold: {original_score_threshold}")
-        body["limit"] = 100 
-        body["with_payload"] = True 
-    except:
-        raise HTTPException(status_code=400, detail="Invalid JSON")
+        update = parse_lexical_update(method, path_name, raw)
+        if update is not None:
+            lexical_index.update(*update)
+    except Exception as e:
+        logger.warning("Could not index point mutation on /%s: %s", path_name, e)
 
-    search_vector = body.get("vector")
-    query_text = None
-    
-    if search_vector:
-        if isinstance(search_vector, list) and len(search_vector) > 0 and isinstance(search_vector[0], (int, float)):
-            query_text = await query_cache.get(search_vector)
-        elif isinstance(search_vector, dict) and "vector" in search_vector:
-            query_text = await query_cache.get(search_vector["vector"])
-    
-    if query_text:
-        logger.info(f"Correlated query: {query_text[:50]}...")
+def parse_point_writes(method: str, path_name: str, raw: bytes) -> tuple[str, list | None] | None:
+    # Runs on lexical_writer, which keeps JSON parsing off the event loop and index updates in request order
+    if HYBRID_SEARCH:
+        apply_lexical_update(method, path_name, raw)
+    try:
+        return parse_point_mutation(method, path_name, raw)
+    except Exception as e:
+        logger.warning("Could not parse point mutation on /%s: %s", path_name, e)
+        return None
+
+def invalidate_point_writes(future: asyncio.Future) -> None:
+    # Done callback, so the score cache is only ever touched from the event loop
+    mutation = future.result()
+    if mutation is not None:
+        rerank_score_cache.invalidate_points(*mutation)
+
+def apply_point_mutation(method: str, path_name: str, raw: bytes) -> None:
+    future = asyncio.get_running_loop().run_in_executor(lexical_writer, parse_point_writes, method, path_name, raw)
+    future.add_done_callback(invalidate_point_writes)
+
+async def correlate_search_vector(body: dict, vector_key: str = "vector") -> str | None:
+    # Accepts a plain float list, a named {"name", "vector"} dict, a query API {"nearest": ...}, or any
+    # of those as a base64 float32 string. Base64 is decoded in place for Qdrant and keyed from its raw
+    # bytes, with no float parsing.
+    search_vector = body.get(vector_key)
+    if isinstance(search_vector, dict) and "vector" in search_vector:
+        body, vector_key, search_vector = search_vector, "vector", search_vector["vector"]
+    elif isinstance(search_vector, dict) and "nearest" in search_vector:
+        body, vector_key, search_vector = search_vector, "nearest", search_vector["nearest"]
+
+    if isinstance(search_vector, str) and vector_key != "vector":
+        try:
+            uuid.UUID(search_vector)
+            return None # query by point id
+        except ValueError:
+            pass
+    if isinstance(search_vector, str):
+        try:
+            body[vector_key], raw = unpack_vector(search_vector)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid base64 vector")
+        query_text = await query_cache.get(raw)
+    elif isinstance(search_vector, list) and len(search_vector) > 0 and isinstance(search_vector[0], (int, float)):
+        query_text = await query_cache.get(search_vector)
     else:
+        return None # Point ids, fusion over prefetches, recommend/discover: nothing to correlate
+    if query_text is None:
         logger.warning("No query text found in cache - reranking will be skipped")
+    return query_text
+
+def candidate_text(hit: dict) -> str | None:
+    payload = hit.get("payload") or {}
+    text = payload.get("text") or payload.get("content") or payload.get("snippet") or payload.get("code")
+
+    file_path = payload.get("file_path") or payload.get("path") or payload.get("filename")
+    if text and file_path:
+        text = f"File: {file_path}\n{text}"
+    return text
 
+def rerank_candidates(hits: list) -> tuple[list[str], list[int]]:
+    # (texts, hit indices) for the hits that have something to rerank. Runs once per candidate; the
+    # texts are what both the score cache keys and the model see.
+    texts = []
+    indices = []
+    for i, hit in enumerate(hits):
+        text = candidate_text(hit)
+        if text:
+            texts.append(text)
+            indices.append(i)
+    return texts, indices
+
+async def prepare_search(body: dict, vector_key: str, default_limit: int) -> dict:
+    # Strips what the proxy applies itself (threshold, final limit) and widens the Qdrant request for rerank
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    limit = body.get("limit")
+    if limit is None: # Absent or null both mean Qdrant's default
+        limit = default_limit
+    elif isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be a positive integer")
+    search = {"limit": limit, "score_threshold": body.pop("score_threshold", None)}
+    body["with_payload"] = True
+    log_sampler.info("search_request", "Request received. Limit %s, Score Threshold: %s", search['limit'], search['score_threshold'])
+
+    search["query_text"] = await correlate_search_vector(body, vector_key)
+    if search["query_text"]:
+        log_sampler.info("correlated", "Correlated query: %s...", search['query_text'][:50])
+
+    if model is None and RERANK_WARMUP == "lazy":
+        ensure_reranker()
+
+    # Only over-fetch when there is something to rerank with
+    search["requested"] = rerank_depth(search["limit"]) if search["query_text"] and model else search["limit"]
+    body["limit"] = search["requested"]
+    # Lexical hits ignore Qdrant filters and prefetch stages, so only plain vector searches are fused
+    search["hybrid"] = (
+        HYBRID_SEARCH and lexical_index.ready and bool(search["query_text"]) and model is not None
+        and not body.get("filter") and "prefetch" not in body
+    )
+    return search
+
+async def fetch_points(collection_name: str, point_ids: list) -> dict:
     try:
-        q_res = await http_client.post(f"{VECTOR_DB_BASE_URL}/collections/{collection_name}/points/search", json=body)
+        started = time.perf_counter()
+        q_res = await http_client.post(
+            f"{VECTOR_DB_BASE_URL}/collections/{collection_name}/points",
+            content=json_dumps({"ids": point_ids, "with_payload": True, "with_vector": False}),
+            headers={"Content-Type": "application/json"}
+        )
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, "qdrant_search")
         q_res.raise_for_status()
-        data = q_res.json()
-        results = data.get("result", [])
+        return {point["id"]: point for point in json_loads(q_res.content).get("result", [])}
     except Exception as e:
-        logger.error(f"Qdrant Search Failed: {e}")
+        logger.error("Fetching lexical hits failed: %s", e)
+        return {}
+
+def lexical_search_many(collection_name: str, searches: list[dict]) -> list[list]:
+    return [
+        lexical_index.search(collection_name, search["query_text"], search["requested"]) if search.get("hybrid") else []
+        for search in searches
+    ]
+
+async def fuse_lexical_hits(collection_name: str, searches: list[dict], hit_lists: list[list]) -> list[list]:
+    # Reciprocal-rank fusion of the vector hits with BM25 hits, cut back to the rerank depth. Points only
+    # the lexical side found are fetched from Qdrant in one call for all searches.
+    if not any(search.get("hybrid") for search in searches):
+        return hit_lists
+    lexical_lists = await run_in_threadpool_timed("lexical", lexical_search_many, collection_name, searches)
+
+    missing = set()
+    for hits, ranked in zip(hit_lists, lexical_lists):
+        seen = {hit.get("id") for hit in hits}
+        missing.update(point_id for point_id in ranked if point_id not in seen)
+    fetched = await fetch_points(collection_name, list(missing)) if missing else {}
+
+    fused_lists = []
+    for search, hits, ranked in zip(searches, hit_lists, lexical_lists):
+        if not ranked:
+            fused_lists.append(hits)
+            continue
+        by_id = {hit.get("id"): hit for hit in hits}
+        fused = {}
+        for rank, point_id in enumerate([hit.get("id") for hit in hits]):
+            fused[point_id] = fused.get(point_id, 0.0) + 1 / (LEXICAL_RRF_K + rank + 1)
+        for rank, point_id in enumerate(ranked):
+            fused[point_id] = fused.get(point_id, 0.0) + 1 / (LEXICAL_RRF_K + rank + 1)
+
+        merged = []
+        for point_id in sorted(fused, key=fused.get, reverse=True):
+            hit = by_id.get(point_id) or fetched.get(point_id)
+            if hit is not None:
+                merged.append({**hit, "score": fused[point_id]})
+            if len(merged) >= search["requested"]:
+                break
+        lexical_index.record_fused(sum(1 for hit in merged if hit["id"] not in by_id))
+        # Vector order stays around as the fallback if reranking fails
+        search["vector_hits"] = hits
+        fused_lists.append(merged)
+    return fused_lists
+
+async def rerank_searches(collection_name: str, searches: list[dict], hit_lists: list[list]) -> list[tuple[list, int]]:
+    # (final hits, reranked count) per search. Scoring for all searches runs as one batch; any search
+    # without query text, candidates or a model keeps its vector order.
+    hit_lists = await fuse_lexical_hits(collection_name, searches, hit_lists)
+    groups = []
+    plans = []
+    for search, hits in zip(searches, hit_lists):
+        plan = None
+        if search["query_text"] and hits and model:
+            candidates, valid_indices = rerank_candidates(hits)
+            # Fused scores are rank-based, a gap in them says nothing about relevance
+            vector_scores = None if "vector_hits" in search else [hits[i].get("score", 0) for i in valid_indices]
+            keep = trim_rerank_candidates(candidates, vector_scores, search["limit"])
+            if keep:
+                plan = (len(groups), valid_indices[:keep])
+                groups.append((collection_name, search["query_text"], candidates[:keep], [hits[i].get("id") for i in valid_indices[:keep]]))
+        plans.append(plan)
+
+    group_scores = None
+    if groups:
+        try:
+            if RERANK_INCREMENTAL:
+                scored = [search for search, plan in zip(searches, plans) if plan is not None]
+                group_scores = await score_candidate_groups_incremental(
+                    groups, [search["limit"] for search in scored], [search["score_threshold"] for search in scored]
+                )
+            else:
+                group_scores = await score_candidate_groups(groups)
+        except Exception as e:
+            if isinstance(e, RerankQueueFull):
+                logger.warning("Reranker saturated, returning vector order: %s", e)
+            else:
+                logger.error("Reranking Failed: %s", e)
+
+    results = []
+    for search, hits, plan in zip(searches, hit_lists, plans):
+        threshold = search["score_threshold"]
+        if plan is not None and group_scores is not None:
+            group, valid_indices = plan
+            reranked_hits = []
+            for idx, score in enumerate(group_scores[group]):
+                hit = hits[valid_indices[idx]]
+                hit["score"] = score
+                reranked_hits.append(hit)
+            reranked_hits.sort(key=lambda x: x["score"], reverse=True)
+            reranked = len(reranked_hits)
+        else:
+            reranked_hits = search.get("vector_hits", hits)
+            reranked = 0
+
+        if threshold is not None:
+            reranked_hits = [hit for hit in reranked_hits if hit.get("score", 0) >= threshold]
+            log_sampler.info("threshold", "After threshold filter (%s): %s results", threshold, len(reranked_hits))
+        results.append((reranked_hits[:search["limit"]], reranked))
+    return results
+
+async def post_qdrant_search(collection_name: str, endpoint: str, body: dict) -> dict:
+    try:
+        started = time.perf_counter()
+        q_res = await http_client.post(
+            f"{VECTOR_DB_BASE_URL}/collections/{collection_name}/{endpoint}",
+            content=json_dumps(body),
+            headers={"Content-Type": "application/json"}
+        )
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, "qdrant_search")
+        UPSTREAM_BYTES.observe(len(q_res.content), "qdrant_search")
+        q_res.raise_for_status()
+        return json_loads(q_res.content)
+    except Exception as e:
+        logger.error("Qdrant Search Failed: %s", e)
         raise HTTPException(status_code=502, detail="Qdrant Failed")
 
-    if query_text and results and model:
-        candidates = []
-        valid_indices = []
-        for i, hit in enumerate(results):
-            payload = hit.get("payload", {})
-            text = payload.get("text") or payload.get("content") or payload.get("snippet") or payload.get("code")
-            
-            file_path = payload.get("file_path") or payload.get("path") or payload.get("filename")
-            if text and file_path:
-                text = f"File: {file_path}\n{text}"
-            
-            if text:
-                candidates.append(text)
-                valid_indices.append(i)
-        
-        if candidates:
-            logger.info(f"Reranking {len(candidates)} candidates")
-            try:
-                all_scores = []
-                for batch_start in range(0, len(candidates), RERANK_BATCH_SIZE):
-                    batch = candidates[batch_start : batch_start + RERANK_BATCH_SIZE]
-                    batch_scores = await run_in_threadpool(run_rerank_sync, query_text, batch)
-                    for item in batch_scores:
-                        item["index"] = item["index"] + batch_start
-                    all_scores.extend(batch_scores)
-
-                reranked_hits = []
-                for item in all_scores:
-                    idx = item["index"]
-                    original_idx = valid_indices[idx]
-                    hit = results[original_idx]
-                    hit["score"] = float(item["relevance_score"])
-                    reranked_hits.append(hit)
-                
-                reranked_hits.sort(key=lambda x: x["score"], reverse=True)
-                
-                if original_score_threshold is not None:
-                    reranked_hits = [hit for hit in reranked_hits if hit["score"] >= original_score_threshold]
-                    logger.info(f"After threshold filter ({original_score_threshold}): {len(reranked_hits)} results")
-                
-                data["result"] = reranked_hits[:original_limit]
-                return data
+def parse_search_body(raw: bytes) -> dict:
+    try:
+        body = json_loads(raw)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    return body
 
-            except Exception as e:
-                logger.error(f"Reranking Failed: {e}")
-                if original_score_threshold is not None:
-                    results = [hit for hit in results if hit.get("score", 0) >= original_score_threshold]
-                data["result"] = results[:original_limit]
-                return data
-
-    if original_score_threshold is not None:
-        results = [hit for hit in results if hit.get("score", 0) >= original_score_threshold]
-        logger.info(f"After threshold filter ({original_score_threshold}): {len(results)} results")
-    
-    data["result"] = results[:original_limit]
-    return data
+def parse_batch_searches(raw: bytes) -> tuple[dict, list]:
+    body = parse_search_body(raw)
+    sub_bodies = body.get("searches")
+    if not isinstance(sub_bodies, list):
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    return body, sub_bodies
+
+def record_batch_depth(searches: list[dict], results: list[tuple[list, int]]) -> dict[str, str]:
+    return record_rerank_depth(
+        sum(search["requested"] for search in searches),
+        sum(reranked for _, reranked in results),
+        sum(len(hits) for hits, _ in results)
+    )
+
+async def coalesce_search(endpoint: str, collection_name: str, request: Request, response: Response, run) -> Response:
+    # Byte-identical searches in flight share one Qdrant call and rerank pass; each caller serializes
+    # the shared result itself
+    raw = await request.body()
+    key = hashlib.blake2b(f"{endpoint}\0{collection_name}\0".encode() + raw, digest_size=16).digest()
+    data, headers = await search_flight.do(key, run, collection_name, raw)
+    response.headers.update(headers)
+    return json_response(data, response)
+
+async def search_points(collection_name: str, raw: bytes) -> tuple[dict, dict]:
+    body = parse_search_body(raw)
+    search = await prepare_search(body, "vector", 20)
+    data = await post_qdrant_search(collection_name, "points/search", body)
+
+    [(hits, reranked)] = await rerank_searches(collection_name, [search], [data.get("result", [])])
+    data["result"] = hits
+    return data, record_rerank_depth(search["requested"], reranked, len(hits))
+
+async def search_points_batch(collection_name: str, raw: bytes) -> tuple[dict, dict]:
+    body, sub_bodies = parse_batch_searches(raw)
+    log_sampler.info("search", "Batch search: %s (%s searches)", collection_name, len(sub_bodies))
+    # Correlation lookups resolve together, one round-trip's wait for the whole batch on a remote store
+    searches = await asyncio.gather(*(prepare_search(sub_body, "vector", 20) for sub_body in sub_bodies))
+    data = await post_qdrant_search(collection_name, "points/search/batch", body)
+
+    hit_lists = data.get("result") or [[] for _ in searches]
+    results = await rerank_searches(collection_name, searches, hit_lists)
+    data["result"] = [hits for hits, _ in results]
+    return data, record_batch_depth(searches, results)
+
+async def query_points(collection_name: str, raw: bytes) -> tuple[dict, dict]:
+    body = parse_search_body(raw)
+    search = await prepare_search(body, "query", 10)
+    data = await post_qdrant_search(collection_name, "points/query", body)
+
+    result = data.get("result") or {}
+    [(hits, reranked)] = await rerank_searches(collection_name, [search], [result.get("points", [])])
+    data["result"] = {**result, "points": hits}
+    return data, record_rerank_depth(search["requested"], reranked, len(hits))
+
+async def query_points_batch(collection_name: str, raw: bytes) -> tuple[dict, dict]:
+    body, sub_bodies = parse_batch_searches(raw)
+    log_sampler.info("search", "Batch query: %s (%s queries)", collection_name, len(sub_bodies))
+    searches = await asyncio.gather(*(prepare_search(sub_body, "query", 10) for sub_body in sub_bodies))
+    data = await post_qdrant_search(collection_name, "points/query/batch", body)
+
+    results_in = data.get("result") or [{} for _ in searches]
+    results = await rerank_searches(collection_name, searches, [result.get("points", []) for result in results_in])
+    data["result"] = [{**result, "points": hits} for result, (hits, _) in zip(results_in, results)]
+    return data, record_batch_depth(searches, results)
+
+@app.post("/collections/{collection_name}/points/search")
+async def proxy_qdrant_search(collection_name: str, request: Request, response: Response):
+    log_sampler.info("search", "Search: %s", collection_name)
+    return await coalesce_search("points/search", collection_name, request, response, search_points)
+
+@app.post("/collections/{collection_name}/points/search/batch")
+async def proxy_qdrant_search_batch(collection_name: str, request: Request, response: Response):
+    return await coalesce_search("points/search/batch", collection_name, request, response, search_points_batch)
+
+@app.post("/collections/{collection_name}/points/query")
+async def proxy_qdrant_query(collection_name: str, request: Request, response: Response):
+    log_sampler.info("search", "Query: %s", collection_name)
+    return await coalesce_search("points/query", collection_name, request, response, query_points)
+
+@app.post("/collections/{collection_name}/points/query/batch")
+async def proxy_qdrant_query_batch(collection_name: str, request: Request, response: Response):
+    return await coalesce_search("points/query/batch", collection_name, request, response, query_points_batch)
+
+class RelayResponse(StreamingResponse):
+    # Starlette leaves the body iterator suspended at a yield when the client hangs up mid-body and the
+    # server reports it through send() (ASGI 2.4), so the upstream would stay open until GC. Closing the
+    # iterator here runs relay()'s cleanup on every exit path.
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
 
 @app.api_route("/{path_name:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD"])
 async def catch_all_proxy(request: Request, path_name: str):
     req_id = str(int(time.time() * 1000))[-6:]
     target_url = f"{VECTOR_DB_BASE_URL}/{path_name}"
     
-    logger.info(f"[{req_id}] {request.method} /{path_name}")
+    log_sampler.info("proxy", "[%s] %s /%s", req_id, request.method, path_name)
 
     excluded = {"host", "content-length", "transfer-encoding", "connection", "keep-alive", "accept-encoding"}
     clean_headers = {k: v for k, v in request.headers.items() if k.lower() not in excluded}
     clean_headers["Accept-Encoding"] = "identity"
 
+    # Point writes are teed so caches can see which points changed, everything else streams untouched
+    observe = (HYBRID_SEARCH or rerank_score_cache.max_size > 0) and (
+        request.method == "DELETE" or (request.method in ("POST", "PUT") and POINT_MUTATION_PATH.match(path_name))
+    )
+    observed = VectorStripper()
+
     content = None
     if request.method in ["POST", "PUT", "PATCH"]:
         async def body_stream():
             async for chunk in request.stream():
+                if observe:
+                    observed.feed(chunk)
                 yield chunk
         content = body_stream()
 
     try:
-        resp = await http_client.request(
+        upstream = http_client.build_request(
             method=request.method,
             url=target_url,
             content=content,
             params=request.query_params,
             headers=clean_headers
         )
-        
-        logger.info(f"[{req_id}] -> Status: {resp.status_code}")
-
-        if resp.status_code == 409 and request.method == "PUT" and path_name.startswith("collections/"):
-            logger.info(f"[{req_id}] Converting 409 Conflict to 200 OK (collection already exists)")
-            return Response(
-                content=b'{"result":true,"status":"ok"}',
-                status_code=200,
-                headers={"Content-Type": "application/json", "Connection": "close"}
-            )
-
-        resp_headers = {k: v for k, v in resp.headers.items() 
-                        if k.lower() not in {"content-length", "transfer-encoding", "connection", "content-encoding"}}
-        
-        resp_headers["Connection"] = "close"
+        started = time.perf_counter()
+        resp = await http_client.send(upstream, stream=True)
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, "qdrant_proxy")
+    except Exception as e:
+        logger.error("[%s] V2 PROXY FAIL: %s", req_id, e)
+        raise HTTPException(status_code=502, detail=f"Proxy Failed: {e}")
+
+    log_sampler.info("proxy_status", "[%s] -> Status: %s", req_id, resp.status_code)
 
+    if observe and 200 <= resp.status_code < 300:
+        apply_point_mutation(request.method, path_name, observed.body())
+
+    if resp.status_code == 409 and request.method == "PUT" and path_name.startswith("collections/"):
+        await resp.aclose()
+        logger.info("[%s] Converting 409 Conflict to 200 OK (collection already exists)", req_id)
         return Response(
-            content=resp.content,
-            status_code=resp.status_code,
-            headers=resp_headers
+            content=b'{"result":true,"status":"ok"}',
+            status_code=200,
+            headers={"Content-Type": "application/json"}
         )
 
-    except Exception as e:
-        logger.error(f"[{req_id}] V2 PROXY FAIL: {e}")
-        raise HTTPException(status_code=502, detail=f"Proxy Failed: {e}")
+    # Raw bytes straight through, so content-length/content-encoding stay valid and nothing gets re-parsed
+    resp_headers = {k: v for k, v in resp.headers.items() 
+                    if k.lower() not in {"transfer-encoding", "connection", "keep-alive"}}
+
+    async def relay():
+        try:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+        except Exception as e:
+            logger.error("[%s] Upstream stream broke: %s", req_id, e)
+            raise
+        finally:
+            await resp.aclose()
+
+    return RelayResponse(relay(), status_code=resp.status_code, headers=resp_headers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+#!/bin/sh
+# HTTP_WORKERS=1 runs a single process like before. With more, one process owns the GPU reranker on a
+# unix socket and the HTTP workers call it, sharing query correlation through shared memory.
+set -e
+
+PORT="${PORT:-8000}"
+HTTP_WORKERS="${HTTP_WORKERS:-1}"
+
+if [ "$HTTP_WORKERS" -le 1 ]; then
+    exec uvicorn manager:app --host 0.0.0.0 --port "$PORT"
+fi
+
+# Each worker would index only the upserts routed to it, and compactions of a shared LEXICAL_INDEX_PATH
+# would overwrite each other's records
+if [ "${HYBRID_SEARCH:-0}" = "1" ]; then
+    echo "HYBRID_SEARCH=1 needs HTTP_WORKERS=1, the lexical index is per process" >&2
+    exit 1
+fi
+
+SOCKET="${RERANK_WORKER_SOCKET:-/tmp/smartproxy-rerank.sock}"
+rm -f "$SOCKET"
+SMARTPROXY_ROLE=rerank-worker uvicorn manager:app --uds "$SOCKET" &
+RERANK_PID=$!
+
+export RERANK_BACKEND=remote
+export RERANK_WORKER_URL="unix:$SOCKET"
+export CORRELATION_BACKEND="${CORRELATION_BACKEND:-shm}"
+uvicorn manager:app --host 0.0.0.0 --port "$PORT" --workers "$HTTP_WORKERS" &
+HTTP_PID=$!
+
+STOPPING=0
+trap 'STOPPING=1; kill -TERM "$RERANK_PID" "$HTTP_PID" 2>/dev/null || true' TERM INT
+
+# sh has no wait -n, so poll. If either side dies the container goes down with it, rather than serving
+# searches without reranking or a rerank worker nobody can reach.
+while kill -0 "$RERANK_PID" 2>/dev/null && kill -0 "$HTTP_PID" 2>/dev/null; do
+    sleep 1
+done
+if [ "$STOPPING" = "0" ]; then
+    echo "A smartproxy process exited, stopping the container" >&2
+    kill -TERM "$RERANK_PID" "$HTTP_PID" 2>/dev/null || true
+fi
+wait || true
+[ "$STOPPING" = "1" ]
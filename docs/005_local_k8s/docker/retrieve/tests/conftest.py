@@ -0,0 +1,21 @@
+import os
+import sys
+
+os.environ.setdefault("TEI_BASE_URL", "http://tei")
+os.environ.setdefault("VECTOR_DB_BASE_URL", "http://qdrant")
+RETRIEVE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RETRIEVE_DIR)
+sys.path.insert(0, os.path.join(RETRIEVE_DIR, "bench"))
+
+import pytest
+import manager
+from fakes import FakeReranker
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    # The batcher isn't started, so scoring runs straight through run_rerank_batch_sync on the fake
+    fake = FakeReranker(overhead_ms=0, per_token_us=0)
+    monkeypatch.setattr(manager, "model", fake)
+    monkeypatch.setattr(manager, "rerank_score_cache", manager.RerankScoreCache(max_size=1000, ttl_seconds=3600))
+    return fake
@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+import manager
+
+
+def key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+@pytest.fixture
+def shm_store():
+    store = manager.SharedMemoryCorrelationStore(f"test-correlation-{os.getpid()}-{time.monotonic_ns()}", 500, 3600, 64)
+    yield store
+    asyncio.run(store.close())
+    store.unlink()
+
+
+def test_shm_store_keeps_every_entry_up_to_capacity(shm_store):
+    keys = [key(str(i)) for i in range(500)]
+
+    async def fill_and_read():
+        for i, k in enumerate(keys):
+            await shm_store.set(k, f"query {i}")
+        return [await shm_store.get(k) for k in keys]
+
+    assert asyncio.run(fill_and_read()) == [f"query {i}" for i in range(500)]
+    assert shm_store.evicted == 0
+
+
+def test_shm_store_reader_misses_while_a_write_is_in_progress(shm_store):
+    k = key("busy")
+    asyncio.run(shm_store.set(k, "query"))
+    offset = next(offset for offset in shm_store._offsets(k) if shm_store._read(offset)[0] == k)
+    seq = int.from_bytes(shm_store.buf[offset : offset + 4], "little")
+
+    shm_store.buf[offset : offset + 4] = (seq + 1).to_bytes(4, "little")
+    assert asyncio.run(shm_store.get(k)) is None
+    shm_store.buf[offset : offset + 4] = seq.to_bytes(4, "little")
+    assert asyncio.run(shm_store.get(k)) == "query"
+
+
+def test_shm_store_expires_entries():
+    store = manager.SharedMemoryCorrelationStore(f"test-correlation-ttl-{os.getpid()}", 10, 0.05, 64)
+    try:
+        asyncio.run(store.set(key("q"), "query"))
+        time.sleep(0.1)
+        assert asyncio.run(store.get(key("q"))) is None
+    finally:
+        asyncio.run(store.close())
+        store.unlink()
+
+
+def test_redis_failures_log_once_then_rate_limit(caplog):
+    class DownRedis:
+        async def get(self, key):
+            raise ConnectionError("connection refused")
+
+        async def set(self, key, value, ex=None):
+            raise ConnectionError("connection refused")
+
+    store = manager.RedisCorrelationStore(DownRedis(), 60)
+
+    async def searches():
+        for i in range(50):
+            assert await store.get(key(str(i))) is None
+            await store.set(key(str(i)), "query")
+
+    with caplog.at_level("WARNING", logger="SmartProxy"):
+        asyncio.run(searches())
+        store._logged_at -= store.LOG_INTERVAL
+        asyncio.run(store.get(key("later")))
+
+    assert store.errors == 101
+    assert [record.getMessage() for record in caplog.records] == [
+        "Correlation lookup failed: connection refused",
+        "Correlation lookup failed: connection refused (99 more failures since the last report)"
+    ]
+
+
+def test_rerank_ipc_endpoint_only_on_the_rerank_worker():
+    # conftest imports manager without SMARTPROXY_ROLE, like a public HTTP worker
+    assert "/v1/rerank" not in {route.path for route in manager.app.routes}
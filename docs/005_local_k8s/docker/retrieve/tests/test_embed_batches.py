@@ -0,0 +1,146 @@
+import asyncio
+
+import httpx
+import pytest
+
+import manager
+
+
+def test_plan_respects_count_and_padded_token_budget(monkeypatch):
+    monkeypatch.setattr(manager, "EMBED_BATCH_SIZE", 4)
+    monkeypatch.setattr(manager, "EMBED_BATCH_MAX_TOKENS", 100)
+    monkeypatch.setattr(manager, "EMBED_SORT_BY_LENGTH", True)
+    token_counts = [90, 5, 10, 5, 20, 5, 10, 5]
+    batches = manager.plan_embed_batches(token_counts)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(token_counts)))
+    for batch in batches:
+        assert len(batch) <= 4
+        assert len(batch) == 1 or max(token_counts[i] for i in batch) * len(batch) <= 100
+    # The long input rides alone instead of padding a batch of short ones
+    assert [0] in batches
+
+
+def test_embed_batches_restores_input_order(monkeypatch):
+    monkeypatch.setattr(manager, "EMBED_BATCH_SIZE", 2)
+    monkeypatch.setattr(manager, "EMBED_SORT_BY_LENGTH", True)
+    sent = []
+
+    async def post_embed_batch(batch_inputs, batch_no):
+        sent.append(batch_inputs)
+        await asyncio.sleep(0.01 * (3 - batch_no))  # Later batches finish first
+        return [[float(len(text))] for text in batch_inputs]
+
+    monkeypatch.setattr(manager, "post_embed_batch", post_embed_batch)
+    inputs = ["a" * n for n in (7, 1, 5, 3, 9, 2)]
+    vectors = asyncio.run(manager.embed_batches(inputs, [len(text) for text in inputs]))
+
+    assert vectors == [[7.0], [1.0], [5.0], [3.0], [9.0], [2.0]]
+    assert sent[0] == ["a", "aa"]
+
+
+def test_cache_hits_keep_usage_without_tokenizing(monkeypatch):
+    monkeypatch.setattr(manager, "embedding_cache", manager.EmbeddingCache(max_size=10))
+    tokenized = []
+
+    def count_tokens(texts):
+        tokenized.append(list(texts))
+        return [len(text) for text in texts]
+
+    async def embed_batches(inputs, token_counts):
+        return [[1.0] for _ in inputs]
+
+    monkeypatch.setattr(manager, "count_tokens", count_tokens)
+    monkeypatch.setattr(manager, "embed_batches", embed_batches)
+    _, first_tokens = asyncio.run(manager.embed_texts(["one", "two", "one"], False))
+    _, cached_tokens = asyncio.run(manager.embed_texts(["one", "two", "one"], False))
+
+    assert tokenized == [[manager.PASSAGE_PREFIX + "one", manager.PASSAGE_PREFIX + "two"]]
+    assert cached_tokens == first_tokens == 3 * len(manager.PASSAGE_PREFIX) + 9
+
+
+@pytest.fixture
+def tei(monkeypatch):
+    # Replies to every /embed with [len(text)] per input, unless the test swaps the reply
+    def reply(inputs):
+        return [[float(len(text))] for text in inputs]
+
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        inputs = manager.json_loads(request.content)["inputs"]
+        calls.append(inputs)
+        return httpx.Response(200, json=state["reply"](inputs))
+
+    state = {"reply": reply, "calls": calls}
+    monkeypatch.setattr(manager, "EMBED_BATCH_SIZE", 2)
+    monkeypatch.setattr(manager, "embed_in_flight", asyncio.Semaphore(4))
+    monkeypatch.setattr(manager, "embed_bytes_budget", manager.ByteBudget(1 << 20))
+    monkeypatch.setattr(manager, "embed_reply_state", {"dim": None})
+    monkeypatch.setattr(manager, "embedding_cache", manager.EmbeddingCache(max_size=0))
+    monkeypatch.setattr(manager, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return state
+
+
+def post_embeddings(texts: list[str]) -> httpx.Response:
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://proxy") as client:
+            return await client.post("/v1/embeddings", json={"input": texts})
+
+    return asyncio.run(main())
+
+
+def test_split_request_comes_back_in_input_order(tei):
+    texts = ["a" * n for n in (7, 1, 5, 3, 9, 2)]
+    resp = post_embeddings(texts)
+
+    assert resp.status_code == 200
+    assert len(tei["calls"]) == 3
+    data = resp.json()["data"]
+    assert [item["index"] for item in data] == list(range(len(texts)))
+    assert [item["embedding"] for item in data] == [[float(len(manager.PASSAGE_PREFIX) + len(text))] for text in texts]
+
+
+def test_indexed_reply_is_put_back_in_order(tei):
+    tei["reply"] = lambda inputs: {"data": [{"index": i, "embedding": [float(len(inputs[i]))]} for i in reversed(range(len(inputs)))]}
+    texts = ["a" * n for n in (4, 8, 6)]
+    resp = post_embeddings(texts)
+
+    assert [item["embedding"] for item in resp.json()["data"]] == [[float(len(manager.PASSAGE_PREFIX) + len(text))] for text in texts]
+
+
+@pytest.mark.parametrize("reply", [
+    lambda inputs: [[1.0]] * (len(inputs) - 1),
+    lambda inputs: {"data": [{"index": 0, "embedding": [1.0]} for _ in inputs]},
+    lambda inputs: {"data": [{"index": len(inputs), "embedding": [1.0]}]},
+])
+def test_malformed_reply_is_a_bad_gateway(tei, reply):
+    tei["reply"] = reply
+    resp = post_embeddings(["a" * 3, "b" * 5, "c" * 7])
+
+    assert resp.status_code == 502
+    # Not retried, the same request would get the same reply
+    assert len(tei["calls"]) == len({tuple(inputs) for inputs in tei["calls"]})
+
+
+def test_large_inputs_are_tokenized_off_the_loop(monkeypatch):
+    monkeypatch.setattr(manager, "embedding_cache", manager.EmbeddingCache(max_size=0))
+    monkeypatch.setattr(manager, "query_memo", manager.QueryEmbeddingMemo(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(manager, "query_cache", manager.QueryCache(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(manager, "EMBED_INLINE_TOKENIZE_CHARS", 1000)
+    stages = []
+
+    async def run_in_threadpool_timed(stage, func, *args):
+        stages.append(stage)
+        return func(*args)
+
+    async def embed_batches(inputs, token_counts):
+        return [[1.0] for _ in inputs]
+
+    monkeypatch.setattr(manager, "run_in_threadpool_timed", run_in_threadpool_timed)
+    monkeypatch.setattr(manager, "embed_batches", embed_batches)
+    asyncio.run(manager.embed_texts(["short query"], True))
+    assert stages == []
+    # Two texts, but one is a whole file
+    asyncio.run(manager.embed_texts(["x" * 5000, "y"], False))
+    assert stages == ["tokenize"]
@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+
+import manager
+
+
+@pytest.fixture
+def tei(monkeypatch):
+    # Each test queues replies: an int status, an exception to raise, or a list of vectors to return
+    replies = []
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        if isinstance(reply, int):
+            return httpx.Response(reply, json={"error": "tei"})
+        return httpx.Response(200, json=reply)
+
+    monkeypatch.setattr(manager, "EMBED_BATCH_RETRIES", 2)
+    monkeypatch.setattr(manager.random, "uniform", lambda low, high: 0)
+    monkeypatch.setattr(manager, "embed_in_flight", asyncio.Semaphore(4))
+    monkeypatch.setattr(manager, "embed_bytes_budget", manager.ByteBudget(1024))
+    monkeypatch.setattr(manager, "embed_reply_state", {"dim": None})
+    monkeypatch.setattr(manager, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return replies, requests
+
+
+def post(inputs):
+    return asyncio.run(manager.post_embed_batch(inputs, 0))
+
+
+def test_retries_server_errors_and_connect_failures(tei):
+    replies, requests = tei
+    replies.extend([503, httpx.ConnectError("refused"), [[1.0], [2.0]]])
+    assert post(["a", "b"]) == [[1.0], [2.0]]
+    assert len(requests) == 3
+    assert manager.embed_bytes_budget.used == 0
+
+
+def test_retries_rate_limits(tei):
+    replies, requests = tei
+    replies.extend([429, [[1.0]]])
+    assert post(["a"]) == [[1.0]]
+    assert len(requests) == 2
+
+
+def test_gives_up_after_the_retry_limit(tei):
+    replies, requests = tei
+    replies.extend([502, 502, 502, [[1.0]]])
+    with pytest.raises(httpx.HTTPStatusError):
+        post(["a"])
+    assert len(requests) == manager.EMBED_BATCH_RETRIES + 1
+    assert manager.embed_bytes_budget.used == 0
+
+
+def test_client_errors_are_not_retried(tei):
+    replies, requests = tei
+    replies.extend([413, [[1.0]]])
+    with pytest.raises(httpx.HTTPStatusError):
+        post(["a"])
+    assert len(requests) == 1
+    assert manager.embed_bytes_budget.used == 0
+
+
+def test_budget_admits_oversized_batches_alone():
+    async def main():
+        budget = manager.ByteBudget(100)
+        held = await budget.acquire(500)
+        waiter = asyncio.create_task(budget.acquire(10))
+        await asyncio.sleep(0.01)
+        blocked = not waiter.done()
+        await budget.release(held)
+        return held, blocked, await waiter, budget.used
+
+    assert asyncio.run(main()) == (100, True, 10, 10)
+
+
+def test_budget_is_released_when_a_batch_is_cancelled(tei, monkeypatch):
+    async def main():
+        entered = asyncio.Event()
+
+        async def slow_post(*args, **kwargs):
+            entered.set()
+            await asyncio.sleep(10)
+
+        monkeypatch.setattr(manager.http_client, "post", slow_post)
+        task = asyncio.create_task(manager.post_embed_batch(["a" * 40], 0))
+        await entered.wait()
+        used_while_running = manager.embed_bytes_budget.used
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return used_while_running, manager.embed_bytes_budget.used
+
+    assert asyncio.run(main()) == (40, 0)
+
+
+def test_budget_counts_utf8_bytes_and_the_expected_reply(tei):
+    replies, _ = tei
+    assert manager.embed_batch_bytes(["é" * 10, "ab"]) == 22
+    replies.append([[0.5] * 8, [0.5] * 8])
+    post(["a", "b"])
+    # Dim 8 learned from the reply, so each input now also holds room for 8 JSON floats
+    assert manager.embed_batch_bytes(["é" * 10, "ab"]) == 22 + 2 * 8 * manager.EMBED_REPLY_BYTES_PER_FLOAT
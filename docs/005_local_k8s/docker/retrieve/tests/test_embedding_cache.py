@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+import manager
+
+
+def put(cache, texts):
+    keys = [cache.key(text) for text in texts]
+    asyncio.run(cache.put_many(keys, [[float(len(text))] for text in texts], [len(text) for text in texts]))
+
+
+def get_disk(cache, texts):
+    # Memory is off in these caches, so every hit comes from sqlite
+    found, _ = asyncio.run(cache.get_many(texts))
+    return [entry[0].tolist() if entry is not None else None for entry in found]
+
+
+def test_rewriting_rows_does_not_count_toward_disk_max(tmp_path):
+    cache = manager.EmbeddingCache(max_size=0, path=os.path.join(tmp_path, "cache.db"), disk_max=3)
+    cache.open()
+    put(cache, ["a", "bb", "ccc"])
+    put(cache, ["a", "bb", "ccc"])
+    put(cache, ["a", "a"])
+
+    assert cache._db_rows == 3
+    assert get_disk(cache, ["a", "bb", "ccc"]) == [[1.0], [2.0], [3.0]]
+    cache.close()
+
+
+def test_disk_evicts_least_recently_written_rows(tmp_path):
+    cache = manager.EmbeddingCache(max_size=0, path=os.path.join(tmp_path, "cache.db"), disk_max=3)
+    cache.open()
+    put(cache, ["a", "bb", "ccc"])
+    put(cache, ["a"]) # Rewritten, now the newest row
+    put(cache, ["dddd"])
+
+    assert cache._db_rows == 3
+    assert get_disk(cache, ["a", "bb", "ccc", "dddd"]) == [[1.0], None, [3.0], [4.0]]
+    cache.close()
+
+
+def test_row_count_survives_reopen(tmp_path):
+    path = os.path.join(tmp_path, "cache.db")
+    cache = manager.EmbeddingCache(max_size=0, path=path, disk_max=10)
+    cache.open()
+    put(cache, ["a", "bb"])
+    cache.close()
+
+    reopened = manager.EmbeddingCache(max_size=0, path=path, disk_max=10)
+    reopened.open()
+    assert reopened._db_rows == 2
+    assert get_disk(reopened, ["a", "bb"]) == [[1.0], [2.0]]
+    reopened.close()
+
+
+def test_other_model_misses_on_a_reused_file(tmp_path):
+    path = os.path.join(tmp_path, "cache.db")
+    old = manager.EmbeddingCache(max_size=0, path=path, model_id="model@rev1")
+    old.open()
+    put(old, ["a"])
+    old.close()
+
+    new = manager.EmbeddingCache(max_size=0, path=path, model_id="model@rev2")
+    new.open()
+    assert get_disk(new, ["a"]) == [None]
+    new.close()
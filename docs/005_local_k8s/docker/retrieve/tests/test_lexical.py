@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import manager
+
+
+def test_rrf_fusion_merges_lexical_hits(monkeypatch):
+    index = manager.LexicalIndex()
+    index.update("code", [(1, "def parse_config(): pass"), (2, "def other(): pass"), (3, "parse config loader")], [])
+    monkeypatch.setattr(manager, "lexical_index", index)
+
+    async def fetch_points(collection_name, point_ids):
+        return {point_id: {"id": point_id, "payload": {"text": "fetched"}} for point_id in point_ids}
+
+    monkeypatch.setattr(manager, "fetch_points", fetch_points)
+    vector_hits = [{"id": 2, "score": 0.9}, {"id": 1, "score": 0.8}]
+    search = {"hybrid": True, "query_text": "parse config", "requested": 3}
+
+    [fused] = asyncio.run(manager.fuse_lexical_hits("code", [search], [vector_hits]))
+    # 1 is on both lists; 2 (vector only) and 3 (lexical only, fetched) tie and keep vector-first order
+    assert [hit["id"] for hit in fused] == [1, 2, 3]
+    assert fused[0]["score"] == pytest.approx(2 / (manager.LEXICAL_RRF_K + 2))
+    assert fused[2]["payload"] == {"text": "fetched"}
+    assert search["vector_hits"] is vector_hits
+    assert index.stats()["fused_hits"] == 1
+
+
+def test_failed_load_is_reported_in_stats(monkeypatch, tmp_path):
+    not_a_dir = tmp_path / "lexical"
+    not_a_dir.write_text("")
+    index = manager.LexicalIndex(path=str(not_a_dir))
+    monkeypatch.setattr(manager, "lexical_index", index)
+
+    async def load():
+        future = asyncio.get_running_loop().run_in_executor(None, index.load)
+        future.add_done_callback(manager.report_lexical_load)
+        with pytest.raises(OSError):
+            await future
+
+    asyncio.run(load())
+    assert index.stats()["ready"] is False
+    assert index.stats()["error"]
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import queue
+import time
+
+import manager
+
+
+def record(level: int, msg: str) -> logging.LogRecord:
+    return logging.LogRecord("SmartProxy", level, __file__, 0, msg, None, None)
+
+
+def test_full_queue_drops_info_but_keeps_warnings(monkeypatch):
+    monkeypatch.setattr(manager, "LOG_WARNING_WAIT", 0.01)
+    handler = manager.DroppingQueueHandler(queue.Queue(maxsize=10))
+    for i in range(20):
+        handler.enqueue(record(logging.INFO, f"info {i}"))
+
+    # Info stops at the headroom, so warnings and errors still fit
+    assert handler.queue.qsize() == 9
+    handler.enqueue(record(logging.ERROR, "upstream down"))
+    assert handler.queue.qsize() == 10
+    assert handler.dropped == 11
+
+    # Once the queue is completely full a warning waits briefly, then counts as dropped
+    handler.enqueue(record(logging.WARNING, "still down"))
+    assert handler.dropped == 12
+
+    messages = [handler.queue.get_nowait().msg for _ in range(10)]
+    assert messages[-1] == "upstream down (11 log lines dropped, stdout is behind)"
+
+
+def test_warnings_on_the_event_loop_never_wait_for_room(monkeypatch):
+    monkeypatch.setattr(manager, "LOG_WARNING_WAIT", 1.0)
+    handler = manager.DroppingQueueHandler(queue.Queue(maxsize=10))
+    for i in range(10):
+        handler.enqueue(record(logging.WARNING, f"warning {i}"))
+
+    async def warn_from_the_loop():
+        started = time.perf_counter()
+        for i in range(10):
+            handler.enqueue(record(logging.WARNING, f"late {i}"))
+        return time.perf_counter() - started
+
+    assert asyncio.run(warn_from_the_loop()) < 0.1
+    assert handler.dropped == 10
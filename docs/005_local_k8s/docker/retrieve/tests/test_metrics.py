@@ -0,0 +1,65 @@
+import asyncio
+
+import httpx
+
+import manager
+
+
+def scrape() -> str:
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://proxy") as client:
+            resp = await client.get("/proxy/metrics")
+            resp.raise_for_status()
+            return resp.text
+
+    return asyncio.run(main())
+
+
+def test_bucket_bounds_render_exactly():
+    histogram = manager.Histogram("test_bytes", "Sizes", manager.BYTES_BUCKETS, ("route",))
+    histogram.observe(300000, "search")
+    lines = histogram.render()
+
+    assert 'test_bytes_bucket{route="search",le="262144"} 0' in lines
+    assert 'test_bytes_bucket{route="search",le="1048576"} 1' in lines
+    assert 'test_bytes_bucket{route="search",le="268435456"} 1' in lines
+    assert 'test_bytes_bucket{route="search",le="+Inf"} 1' in lines
+    assert "test_bytes_sum{route=\"search\"} 300000" in lines
+    assert not any("e+" in line for line in lines)
+
+
+def test_fractional_bounds_keep_their_digits():
+    histogram = manager.Histogram("test_seconds", "Latency", manager.LATENCY_BUCKETS)
+    histogram.observe(0.003)
+    lines = histogram.render()
+
+    assert 'test_seconds_bucket{le="0.0025"} 0' in lines
+    assert 'test_seconds_bucket{le="0.005"} 1' in lines
+    assert 'test_seconds_bucket{le="1"} 1' in lines
+    assert 'test_seconds_bucket{le="2.5"} 1' in lines
+    assert "test_seconds_count 1" in lines
+
+
+def test_metrics_endpoint_renders_byte_histograms():
+    manager.HTTP_RESPONSE_BYTES.observe(2000000, "proxy")
+    text = scrape()
+
+    assert "# TYPE proxy_http_response_bytes histogram" in text
+    assert 'proxy_http_response_bytes_bucket{route="proxy",le="4194304"}' in text
+    assert 'proxy_http_response_bytes_bucket{route="proxy",le="268435456"}' in text
+    assert "e+" not in text
+    # The scrape itself is counted once it has been sent
+    assert 'proxy_http_request_seconds_bucket{route="admin",le="+Inf"}' in scrape()
+
+
+def test_qdrant_metrics_still_reach_qdrant(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=httpx.ByteStream(f"qdrant {request.url.path}\n".encode()))
+
+    monkeypatch.setattr(manager, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://proxy") as client:
+            return (await client.get("/metrics")).text
+
+    assert asyncio.run(main()) == "qdrant /metrics\n"
@@ -0,0 +1,54 @@
+import json
+
+import manager
+
+
+def strip(raw: bytes, chunk_size: int) -> bytes:
+    stripper = manager.VectorStripper()
+    for start in range(0, len(raw), chunk_size):
+        stripper.feed(raw[start : start + chunk_size])
+    return stripper.body()
+
+
+def test_vectors_stripped_and_payload_text_kept_across_chunk_boundaries():
+    digits = ", ".join(str(n) for n in range(40))
+    payload = {"text": f"table = [{digits}]\\nquote \" and \\\\ [0.5, 1e-3]", "nums": [1, 2]}
+    raw = json.dumps({"points": [{"id": 7, "vector": [0.125] * 96, "payload": payload}]}).encode()
+
+    # Every split, including ones inside escapes, inside the text's numeric run and inside the vector
+    for chunk_size in (1, 2, 3, 5, 64, 65, len(raw)):
+        body = json.loads(strip(raw, chunk_size))
+        assert body["points"][0]["vector"] == []
+        assert body["points"][0]["payload"] == payload
+        assert body["points"][0]["id"] == 7
+
+
+def test_long_id_lists_survive_and_still_drive_invalidation():
+    ids = list(range(1000, 1030))
+    delete = json.dumps({"points": ids}).encode()
+    upsert = json.dumps({
+        "batch": {
+            "ids": ids,
+            "vectors": [[0.25] * 32 for _ in ids],
+            "payloads": [{"text": f"def f{i}(): pass"} for i in ids]
+        }
+    }).encode()
+    named = json.dumps({"points": [{"id": 1, "vector": {"dense": [0.5] * 64, "sparse": {"indices": list(range(40)), "values": [0.5] * 40}}, "payload": {"text": "x", "ids": ids}}]}).encode()
+
+    for chunk_size in (1, 3, 7, 64, 4096):
+        stripped = strip(delete, chunk_size)
+        assert json.loads(stripped) == {"points": ids}
+        assert manager.parse_point_mutation("POST", "collections/code/points/delete", stripped) == ("code", ids)
+        assert manager.parse_lexical_update("POST", "collections/code/points/delete", stripped) == ("code", [], ids)
+
+        stripped = strip(upsert, chunk_size)
+        batch = json.loads(stripped)["batch"]
+        assert batch["ids"] == ids
+        assert batch["vectors"] == [[] for _ in ids]
+        assert manager.parse_point_mutation("PUT", "collections/code/points", stripped) == ("code", ids)
+        _, upserts, _ = manager.parse_lexical_update("PUT", "collections/code/points", stripped)
+        assert [point_id for point_id, _ in upserts] == ids
+
+        point = json.loads(strip(named, chunk_size))["points"][0]
+        assert point["vector"] == {"dense": [], "sparse": {"indices": [], "values": []}}
+        assert point["payload"]["ids"] == ids
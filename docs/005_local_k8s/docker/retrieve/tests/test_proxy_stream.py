@@ -0,0 +1,110 @@
+import asyncio
+
+import httpx
+import pytest
+
+import manager
+
+
+class UpstreamBody(httpx.AsyncByteStream):
+    # Yields its chunks, or with `endless` keeps trickling them like a large download the client gives up on
+    def __init__(self, chunks: list[bytes], endless: bool = False):
+        self.chunks = chunks
+        self.endless = endless
+        self.sent = asyncio.Event()
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        self.sent.set()
+        while self.endless:
+            await asyncio.sleep(0.001)
+            yield self.chunks[-1]
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+def upstream(monkeypatch, headers: dict, body: UpstreamBody) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers=headers, stream=body)
+
+    monkeypatch.setattr(manager, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def get(path: str) -> httpx.Response:
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://proxy") as client:
+            return await client.get(path)
+
+    return asyncio.run(main())
+
+
+def test_content_length_passes_through(monkeypatch):
+    body = UpstreamBody([b'{"result":', b'"ok"}'])
+    upstream(monkeypatch, {"Content-Type": "application/json", "Content-Length": "16"}, body)
+    resp = get("/collections/code")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-length"] == "16"
+    assert "transfer-encoding" not in resp.headers
+    assert resp.content == b'{"result":"ok"}'
+    assert body.closed
+
+
+def test_chunked_upstream_is_relayed_without_its_framing(monkeypatch):
+    body = UpstreamBody([b"a" * 10, b"b" * 10])
+    upstream(monkeypatch, {"Transfer-Encoding": "chunked", "Connection": "keep-alive"}, body)
+    resp = get("/snapshots/large")
+
+    # The server frames the relayed body itself, the upstream's hop-by-hop headers must not leak
+    assert "transfer-encoding" not in resp.headers
+    assert "connection" not in resp.headers
+    assert "content-length" not in resp.headers
+    assert resp.content == b"a" * 10 + b"b" * 10
+
+
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+def test_upstream_is_closed_when_the_client_disconnects(monkeypatch, spec_version):
+    body = UpstreamBody([b"x" * 1024], endless=True)
+    upstream(monkeypatch, {"Content-Type": "application/octet-stream"}, body)
+
+    async def main():
+        hang_up = asyncio.Event()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": spec_version},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/snapshots/large",
+            "raw_path": b"/snapshots/large",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [],
+            "client": ("127.0.0.1", 1234),
+            "server": ("proxy", 80)
+        }
+        received = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if received:
+                return received.pop(0)
+            await hang_up.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and hang_up.is_set():
+                raise OSError("client went away") # How 2.4 servers report a disconnect
+
+        app_task = asyncio.create_task(manager.app(scope, receive, send))
+        await asyncio.wait_for(body.sent.wait(), 1)
+        hang_up.set()
+        # 2.3 servers get a normal return, 2.4 servers see ClientDisconnect raised back at them
+        await asyncio.wait([app_task], timeout=1)
+        closed = body.closed
+        app_task.cancel()
+        return closed
+
+    assert asyncio.run(main())
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import httpx
+
+import manager
+
+
+def test_hit_ignores_whitespace_differences():
+    memo = manager.QueryEmbeddingMemo(max_size=10, ttl_seconds=60)
+    memo.put(memo.key("parse  config\n token"), [0.5, 0.25], 7)
+
+    vector, tokens = memo.get(memo.key(" parse config token "))
+    assert (vector.tolist(), tokens) == ([0.5, 0.25], 7)
+    assert memo.get(memo.key("parse config tokens")) is None
+    stats = asyncio.run(memo.stats())
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_entries_expire_after_ttl():
+    memo = manager.QueryEmbeddingMemo(max_size=10, ttl_seconds=0.05)
+    key = memo.key("query")
+    memo.put(key, [1.0], 1)
+    assert memo.get(key) is not None
+    time.sleep(0.06)
+    assert memo.get(key) is None
+    assert asyncio.run(memo.stats())["expired"] == 1
+
+
+def test_size_is_bounded_by_evicting_least_recently_used():
+    memo = manager.QueryEmbeddingMemo(max_size=2, ttl_seconds=60)
+    for text in ("a", "b"):
+        memo.put(memo.key(text), [1.0], 1)
+    memo.get(memo.key("a"))
+    memo.put(memo.key("c"), [1.0], 1)
+
+    assert memo.get(memo.key("b")) is None
+    assert memo.get(memo.key("a")) is not None
+    stats = asyncio.run(memo.stats())
+    assert (stats["size"], stats["evicted"]) == (2, 1)
+
+
+def test_zero_size_turns_the_memo_off():
+    memo = manager.QueryEmbeddingMemo(max_size=0, ttl_seconds=60)
+    memo.put(memo.key("query"), [1.0], 1)
+    assert memo.get(memo.key("query")) is None
+    assert asyncio.run(memo.stats())["size"] == 0
+
+
+def test_repeated_query_skips_tei(monkeypatch):
+    monkeypatch.setattr(manager, "query_memo", manager.QueryEmbeddingMemo(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(manager, "query_cache", manager.QueryCache(max_size=10, ttl_seconds=60))
+    embedded = []
+
+    async def embed_texts(texts, is_query):
+        embedded.append(texts)
+        manager.query_memo.put(manager.QueryEmbeddingMemo.key(texts[0]), [0.5], 3)
+        return [[0.5]], 3
+
+    monkeypatch.setattr(manager, "embed_texts", embed_texts)
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://proxy") as client:
+            first = await client.post("/v1/embeddings", json={"input": "find the parser"})
+            second = await client.post("/v1/embeddings", json={"input": "find  the parser"})
+        return first.json(), second.json(), await manager.query_cache.get([0.5])
+
+    first, second, correlated = asyncio.run(main())
+    assert embedded == [["find the parser"]]
+    assert first == second
+    # The hit still refreshes the correlation with the exact text of the repeated query
+    assert correlated == "find  the parser"
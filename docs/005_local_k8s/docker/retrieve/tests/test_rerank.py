@@ -0,0 +1,141 @@
+import asyncio
+
+import httpx
+
+import manager
+
+QUERY = "parse config token"
+RELEVANT = "def parse_config(token): parse config token"  # FakeReranker scores 0.75
+UNRELATED = "def unrelated(): return other"  # 0.0
+
+
+def group(texts: list[str]) -> tuple[str, str, list[str], list]:
+    return ("code", QUERY, texts, list(range(len(texts))))
+
+
+def incremental(groups, limits, thresholds) -> list[list[float]]:
+    return asyncio.run(manager.score_candidate_groups_incremental(groups, limits, thresholds))
+
+
+def test_threshold_stops_once_limit_hits_clear_it(reranker, monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_INCREMENTAL_BATCH", 4)
+    [scores] = incremental([group([f"{RELEVANT} {i}" for i in range(40)])], [3], [0.5])
+    # First round is max(limit, batch) and already has 3 scores above 0.5
+    assert len(scores) == 4
+    assert all(score >= 0.5 for score in scores)
+
+
+def test_patience_stops_when_nothing_breaks_into_the_top(reranker, monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_INCREMENTAL_BATCH", 4)
+    monkeypatch.setattr(manager, "RERANK_EARLY_STOP_PATIENCE", 2)
+    texts = [f"{RELEVANT} {i}" for i in range(4)] + [f"{UNRELATED} {i}" for i in range(36)]
+    [scores] = incremental([group(texts)], [3], [None])
+    assert len(scores) == 4 + 2 * 4
+
+
+def test_patience_off_scores_everything(reranker, monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_INCREMENTAL_BATCH", 4)
+    monkeypatch.setattr(manager, "RERANK_EARLY_STOP_PATIENCE", 0)
+    texts = [f"{RELEVANT} {i}" for i in range(4)] + [f"{UNRELATED} {i}" for i in range(10)]
+    [scores] = incremental([group(texts)], [3], [None])
+    assert len(scores) == len(texts)
+
+
+def test_groups_stop_independently_and_share_rounds(reranker, monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_INCREMENTAL_BATCH", 4)
+    monkeypatch.setattr(manager, "RERANK_EARLY_STOP_PATIENCE", 0)
+    fast = group([f"{RELEVANT} {i}" for i in range(20)])
+    slow = group([f"{UNRELATED} {i}" for i in range(10)])
+    scores = incremental([fast, slow], [2, 2], [0.5, 0.5])
+    assert [len(s) for s in scores] == [4, 10]
+    # Round one covers both groups, rounds two and three only the one still short of its threshold
+    assert reranker.calls == 3
+
+
+def test_rerank_searches_returns_only_the_scored_prefix(reranker, monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_INCREMENTAL", True)
+    monkeypatch.setattr(manager, "RERANK_INCREMENTAL_BATCH", 4)
+    hits = [{"id": i, "score": 1 - i / 100, "payload": {"text": f"{UNRELATED} {i}"}} for i in range(30)]
+    hits[2]["payload"]["text"] = RELEVANT
+    search = {"limit": 3, "score_threshold": None, "query_text": QUERY, "requested": 30}
+
+    [(result, reranked)] = asyncio.run(manager.rerank_searches("code", [search], [hits]))
+    assert reranked == 4 + manager.RERANK_EARLY_STOP_PATIENCE * 4
+    assert [hit["id"] for hit in result][0] == 2
+    assert len(result) == 3
+    assert all(hit["id"] < reranked for hit in result)
+
+
+def test_threshold_filters_after_rerank(reranker, monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_INCREMENTAL", True)
+    hits = [{"id": i, "score": 0.9, "payload": {"text": RELEVANT if i < 2 else f"{UNRELATED} {i}"}} for i in range(10)]
+    search = {"limit": 5, "score_threshold": 0.5, "query_text": QUERY, "requested": 10}
+
+    [(result, _)] = asyncio.run(manager.rerank_searches("code", [search], [hits]))
+    assert [hit["id"] for hit in result] == [0, 1]
+
+
+def test_query_batch_regroups_split_rerank_jobs_per_query(reranker, monkeypatch):
+    # Two chunks per query reach the model, and each query must get back only its own hits, best first
+    monkeypatch.setattr(manager, "RERANK_BATCH_SIZE", 2)
+    monkeypatch.setattr(manager, "RERANK_INCREMENTAL", False)
+    monkeypatch.setattr(manager, "query_cache", manager.QueryCache(max_size=10, ttl_seconds=60))
+    queries = {"q1": ([0.1, 0.2], "parse config token"), "q2": ([0.3, 0.4], "load user session")}
+    texts = {
+        "q1": ["def unrelated(): return other", "def f(): pass", "def parse_config(token): parse config token"],
+        "q2": ["def load_user_session(): load user session", "def g(): pass", "def h(): return 1"]
+    }
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = manager.json_loads(request.content)
+        sent.append(body)
+        results = [
+            {"points": [{"id": f"{name}-{i}", "score": 1 - i / 10, "payload": {"text": text}} for i, text in enumerate(texts[name])]}
+            for name in ("q1", "q2")
+        ]
+        return httpx.Response(200, json={"result": results, "status": "ok"})
+
+    monkeypatch.setattr(manager, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def main():
+        for vector, text in queries.values():
+            await manager.query_cache.store(vector, text)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://proxy") as client:
+            return await client.post(
+                "/collections/code/points/query/batch",
+                json={"searches": [{"query": queries[name][0], "limit": 2} for name in ("q1", "q2")]}
+            )
+
+    resp = asyncio.run(main())
+    assert resp.status_code == 200
+    result = resp.json()["result"]
+    assert [point["id"] for point in result[0]["points"]] == ["q1-2", "q1-0"]
+    assert [point["id"] for point in result[1]["points"]] == ["q2-0", "q2-1"]
+    assert reranker.calls == 1
+    assert [search["limit"] for search in sent[0]["searches"]] == [manager.rerank_depth(2)] * 2
+
+
+def test_only_a_missed_vector_warns_about_correlation(reranker, monkeypatch, caplog):
+    monkeypatch.setattr(manager, "query_cache", manager.QueryCache(max_size=10, ttl_seconds=60))
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"result": {"points": []}, "status": "ok"})
+
+    monkeypatch.setattr(manager, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    bodies = [
+        {"query": 42},
+        {"query": "0a9c2b5e-2f6e-4c7b-9a53-8d3f2b1c4e5f"},
+        {"prefetch": [{"query": [0.1, 0.2], "limit": 20}], "query": {"fusion": "rrf"}},
+        {"query": {"recommend": {"positive": [1, 2]}}},
+        {"query": [0.9, 0.8]}
+    ]
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://proxy") as client:
+            return [(await client.post("/collections/code/points/query", json=body)).status_code for body in bodies]
+
+    with caplog.at_level("WARNING", logger="SmartProxy"):
+        assert asyncio.run(main()) == [200] * len(bodies)
+    warnings = [r for r in caplog.records if "No query text found" in r.getMessage()]
+    assert len(warnings) == 1
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+import pytest
+
+import manager
+from fakes import FakeReranker
+
+
+class RecordingBatch:
+    def __init__(self, gate: threading.Event | None = None):
+        self.calls = []
+        self.gate = gate
+
+    def __call__(self, jobs):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls.append(jobs)
+        return [[{"index": 0, "relevance_score": float(len(query))}] for query, _ in jobs]
+
+
+def test_concurrent_submits_share_one_batch():
+    run_batch = RecordingBatch()
+
+    async def main():
+        batcher = manager.RerankBatcher(run_batch, window_ms=20)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit("q" * n, ["doc"]) for n in range(1, 5)))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(main())
+    assert len(run_batch.calls) == 1
+    # Each caller gets its own job's result back
+    assert [r[0]["relevance_score"] for r in results] == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_token_cap_splits_batches():
+    run_batch = RecordingBatch()
+
+    async def main():
+        # Each job is ~26 estimated tokens, so only one fits under the cap
+        batcher = manager.RerankBatcher(run_batch, window_ms=20, max_tokens=30)
+        batcher.start()
+        await asyncio.gather(*(batcher.submit("query", ["x" * 100]) for _ in range(3)))
+        await batcher.stop()
+
+    asyncio.run(main())
+    assert [len(jobs) for jobs in run_batch.calls] == [1, 1, 1]
+
+
+def test_no_window_for_backends_that_cannot_fuse():
+    run_batch = RecordingBatch()
+
+    async def main():
+        batcher = manager.RerankBatcher(run_batch, window_ms=1000, fused=lambda: False)
+        batcher.start()
+        started = asyncio.get_running_loop().time()
+        await batcher.submit("q", ["doc"])
+        elapsed = asyncio.get_running_loop().time() - started
+        await batcher.stop()
+        return elapsed
+
+    assert asyncio.run(main()) < 0.5
+
+
+def test_full_queue_rejects_instead_of_waiting():
+    gate = threading.Event()
+
+    async def main():
+        batcher = manager.RerankBatcher(RecordingBatch(gate), window_ms=0, max_queue=1)
+        batcher.start()
+        first = asyncio.create_task(batcher.submit("q", ["doc"]))
+        await asyncio.sleep(0.01)
+        with pytest.raises(manager.RerankQueueFull):
+            await batcher.submit("q", ["doc"])
+        gate.set()
+        await first
+        await batcher.stop()
+        return (await batcher.stats())["rejected"]
+
+    assert asyncio.run(main()) == 1
+
+
+def test_stop_fails_pending_jobs_and_later_submits_run_directly(monkeypatch):
+    monkeypatch.setattr(manager, "model", FakeReranker(overhead_ms=0, per_token_us=0))
+    gate = threading.Event()
+
+    async def main():
+        batcher = manager.RerankBatcher(RecordingBatch(gate), window_ms=50)
+        batcher.start()
+        pending = asyncio.create_task(batcher.submit("q", ["doc"]))
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        gate.set()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(pending, 1)
+        return await asyncio.wait_for(batcher.submit("parse", ["parse config"]), 1)
+
+    assert asyncio.run(main())[0]["index"] == 0
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import manager
+
+
+@pytest.fixture
+def depth(monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_DEPTH_MULTIPLIER", 2.0)
+    monkeypatch.setattr(manager, "RERANK_MIN_CANDIDATES", 20)
+    monkeypatch.setattr(manager, "RERANK_MAX_CANDIDATES", 100)
+
+
+def test_depth_scales_with_limit_between_the_bounds(depth):
+    assert manager.rerank_depth(1) == 20
+    assert manager.rerank_depth(30) == 60
+    assert manager.rerank_depth(80) == 100
+    # Never fewer candidates than hits asked for
+    assert manager.rerank_depth(150) == 150
+
+
+def test_trim_cuts_at_a_vector_score_cliff(monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_SCORE_GAP", 0.2)
+    monkeypatch.setattr(manager, "RERANK_TOKEN_BUDGET", 0)
+    candidates = ["x"] * 6
+    assert manager.trim_rerank_candidates(candidates, [0.9, 0.88, 0.85, 0.5, 0.49, 0.1], 2) == 3
+    # A cliff inside the hits the caller asked for is ignored
+    assert manager.trim_rerank_candidates(candidates, [0.9, 0.5, 0.49, 0.48, 0.47, 0.46], 3) == 6
+
+
+def test_trim_stops_at_the_token_budget_but_keeps_one(monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_SCORE_GAP", 0)
+    monkeypatch.setattr(manager, "RERANK_TOKEN_BUDGET", 30)
+    candidates = ["a" * 36] * 5  # 10 estimated tokens each
+    assert manager.trim_rerank_candidates(candidates, None, 1) == 3
+    assert manager.trim_rerank_candidates(["a" * 400] + candidates, None, 1) == 1
+
+
+def prepare(body, monkeypatch, query_text="query"):
+    async def correlate_search_vector(body, vector_key="vector"):
+        return query_text
+
+    monkeypatch.setattr(manager, "correlate_search_vector", correlate_search_vector)
+    return asyncio.run(manager.prepare_search(body, "vector", 20))
+
+
+def test_prepare_widens_the_qdrant_limit(reranker, depth, monkeypatch):
+    body = {"vector": [0.1], "limit": 5, "score_threshold": 0.3}
+    search = prepare(body, monkeypatch)
+    assert (search["limit"], search["requested"], search["score_threshold"]) == (5, 20, 0.3)
+    assert body["limit"] == 20
+    assert "score_threshold" not in body
+
+
+def test_prepare_treats_null_limit_as_the_default(reranker, depth, monkeypatch):
+    body = {"vector": [0.1], "limit": None}
+    search = prepare(body, monkeypatch)
+    assert (search["limit"], search["requested"], body["limit"]) == (20, 40, 40)
+
+
+def test_prepare_forwards_the_limit_when_nothing_reranks(reranker, depth, monkeypatch):
+    body = {"vector": [0.1], "limit": 5}
+    search = prepare(body, monkeypatch, query_text=None)
+    assert (search["requested"], body["limit"]) == (5, 5)
+
+
+@pytest.mark.parametrize("limit", [0, -3, 2.5, "10", True])
+def test_prepare_rejects_invalid_limits(reranker, depth, monkeypatch, limit):
+    with pytest.raises(HTTPException) as raised:
+        prepare({"vector": [0.1], "limit": limit}, monkeypatch)
+    assert raised.value.status_code == 400
@@ -0,0 +1,116 @@
+import asyncio
+import sys
+import types
+
+import httpx
+import pytest
+
+import manager
+
+
+class LoadedBackend(manager.RerankerBackend):
+    name = "loaded"
+
+    def rerank(self, query, documents):
+        return [{"index": i, "relevance_score": 0.0} for i in range(len(documents))]
+
+
+class BrokenBackend(LoadedBackend):
+    name = "broken"
+
+    def load(self):
+        raise RuntimeError("no weights")
+
+
+def create_backend():
+    return LoadedBackend()
+
+
+def fake_torch(monkeypatch, has_cuda: bool) -> None:
+    torch = types.SimpleNamespace(cuda=types.SimpleNamespace(is_available=lambda: has_cuda))
+    monkeypatch.setitem(sys.modules, "torch", torch)
+
+
+@pytest.fixture
+def status(monkeypatch):
+    monkeypatch.setattr(manager, "model", None)
+    monkeypatch.setattr(manager, "reranker_task", None)
+    monkeypatch.setattr(manager, "reranker_status", {"state": "pending", "backend": None, "error": None})
+    monkeypatch.setattr(manager, "RERANK_WARMUP", "background")
+    return manager.reranker_status
+
+
+def warm_up(monkeypatch, spec: str, backends: list | None = None) -> None:
+    monkeypatch.setattr(manager, "RERANK_BACKEND", spec)
+    if backends is not None:
+        monkeypatch.setattr(manager, "reranker_candidates", lambda spec: backends)
+    asyncio.run(manager.warm_up_reranker())
+
+
+def ready() -> httpx.Response:
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=manager.app), base_url="http://proxy") as client:
+            return await client.get("/ready")
+
+    return asyncio.run(main())
+
+
+def test_auto_prefers_cuda_and_keeps_cpu_as_fallback(monkeypatch):
+    fake_torch(monkeypatch, has_cuda=True)
+    assert [backend.name for backend in manager.reranker_candidates("auto")] == ["cuda", "cpu"]
+    fake_torch(monkeypatch, has_cuda=False)
+    assert [backend.name for backend in manager.reranker_candidates("auto")] == ["cpu"]
+
+
+def test_auto_without_torch_falls_back_to_cpu(monkeypatch):
+    monkeypatch.setitem(sys.modules, "torch", None)  # import torch raises ImportError
+    assert [backend.name for backend in manager.reranker_candidates("auto")] == ["cpu"]
+
+
+def test_named_backends(monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_CPU_MODEL_PATH", "/data/hub/cross-encoder")
+    [cpu] = manager.reranker_candidates("cpu")
+    assert isinstance(cpu, manager.CpuRerankerBackend)
+    assert cpu.model_path == "/data/hub/cross-encoder"
+    assert isinstance(manager.reranker_candidates("cuda")[0], manager.CudaRerankerBackend)
+    assert manager.reranker_candidates("none") == []
+    assert isinstance(manager.reranker_candidates("test_reranker_backends:create_backend")[0], LoadedBackend)
+
+
+def test_warm_up_falls_back_past_a_backend_that_fails_to_load(status, monkeypatch):
+    warm_up(monkeypatch, "auto", [BrokenBackend(), LoadedBackend()])
+    assert status == {"state": "ready", "backend": "loaded", "error": None}
+    assert isinstance(manager.model, LoadedBackend)
+
+
+def test_warm_up_reports_failure_when_nothing_loads(status, monkeypatch):
+    warm_up(monkeypatch, "auto", [BrokenBackend()])
+    assert status["state"] == "failed"
+    assert status["error"] == "broken: no weights"
+    assert manager.model is None
+
+
+def test_warm_up_reports_a_bad_spec(status, monkeypatch):
+    warm_up(monkeypatch, "no_such_module:factory")
+    assert status["state"] == "failed"
+    assert "no_such_module" in status["error"]
+
+
+def test_ready_waits_for_warm_up_to_settle(status, monkeypatch):
+    for state in ("pending", "loading"):
+        status["state"] = state
+        resp = ready()
+        assert (resp.status_code, resp.json()["ready"]) == (503, False)
+
+    warm_up(monkeypatch, "none")
+    assert status["state"] == "disabled"
+    assert ready().status_code == 200
+    # A failed backend still serves, just without reranking
+    warm_up(monkeypatch, "auto", [BrokenBackend()])
+    resp = ready()
+    assert (resp.status_code, resp.json()["reranker"]["state"]) == (200, "failed")
+
+
+def test_lazy_warm_up_is_ready_before_the_first_search(status, monkeypatch):
+    monkeypatch.setattr(manager, "RERANK_WARMUP", "lazy")
+    assert ready().status_code == 200
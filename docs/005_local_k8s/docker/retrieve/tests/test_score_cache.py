@@ -0,0 +1,30 @@
+import manager
+
+
+def test_score_cache_invalidates_tracked_points():
+    cache = manager.RerankScoreCache(max_size=100, ttl_seconds=3600)
+    query_key = cache.key("query")
+    texts = ["a", "b", "c"]
+    scores, text_keys = cache.get_many(query_key, texts)
+    cache.track("code", [1, 2, 3], text_keys)
+    for text_key in text_keys:
+        cache.put(query_key, text_key, 0.5)
+
+    cache.invalidate_points("code", [2])
+    assert cache.get_many(query_key, texts)[0] == [0.5, None, 0.5]
+    cache.invalidate_points("code", None)
+    assert cache.get_many(query_key, texts)[0] == [None, None, None]
+
+
+def test_score_cache_reverse_index_shrinks_with_the_cache():
+    # Few snippets, many distinct queries: the case where counting texts never triggered compaction
+    cache = manager.RerankScoreCache(max_size=100, ttl_seconds=3600)
+    text_keys = [cache.key(f"text {i}") for i in range(20)]
+    for q in range(2000):
+        query_key = cache.key(f"query {q}")
+        for text_key in text_keys[q % 4 * 5 : q % 4 * 5 + 5]:
+            cache.put(query_key, text_key, 0.5)
+
+    pairs = sum(len(queries) for queries in cache._text_queries.values())
+    assert len(cache.cache) == 100
+    assert pairs == cache._pairs <= 2 * cache.max_size
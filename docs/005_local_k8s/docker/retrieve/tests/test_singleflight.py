@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+import manager
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = 0
+
+    async def work(value):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        flight = manager.SingleFlight("test")
+        results = await asyncio.gather(*(flight.do(b"k", work, 42) for _ in range(5)))
+        return results, await flight.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [42] * 5
+    assert calls == 1
+    assert (stats["leaders"], stats["suppressed"], stats["in_flight"]) == (1, 4, 0)
+
+
+def test_followers_get_the_leaders_exception():
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def main():
+        flight = manager.SingleFlight("test")
+        return await asyncio.gather(flight.do(b"k", work), flight.do(b"k", work), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        flight = manager.SingleFlight("test")
+        leader = asyncio.create_task(flight.do(b"k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do(b"k", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "done"
@@ -0,0 +1,42 @@
+import time
+
+import manager
+
+
+def test_entries_expire_after_ttl():
+    cache = manager.TTLCache(max_size=10, ttl_seconds=0.05)
+    cache.set(b"a", 1)
+    assert cache.get(b"a") == 1
+    time.sleep(0.06)
+    assert cache.get(b"a") is None
+    assert cache.expired == 1
+
+
+def test_set_evicts_least_recently_used():
+    cache = manager.TTLCache(max_size=2, ttl_seconds=60)
+    cache.set(b"a", 1)
+    cache.set(b"b", 2)
+    cache.get(b"a")
+    cache.set(b"c", 3)
+    assert cache.get(b"b") is None
+    assert (cache.get(b"a"), cache.get(b"c")) == (1, 3)
+    assert cache.evicted == 1
+
+
+def test_refreshing_one_key_keeps_the_deadline_queue_bounded():
+    cache = manager.TTLCache(max_size=10, ttl_seconds=60)
+    for i in range(10000):
+        cache.set(b"hot", i)
+    assert cache.get(b"hot") == 9999
+    assert len(cache._deadlines) <= 4 * len(cache) + 1024 + 1
+
+
+def test_refreshed_key_outlives_its_stale_deadline():
+    cache = manager.TTLCache(max_size=10, ttl_seconds=0.05)
+    cache.set(b"a", 1)
+    time.sleep(0.03)
+    cache.set(b"a", 2)
+    time.sleep(0.03)
+    # The first deadline has passed; expiring it must not drop the refreshed entry
+    cache.set(b"b", 3)
+    assert cache.get(b"a") == 2
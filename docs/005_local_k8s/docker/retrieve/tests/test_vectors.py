@@ -0,0 +1,39 @@
+import asyncio
+import base64
+import struct
+from array import array
+
+import pytest
+
+import manager
+
+
+def test_pack_unpack_round_trip():
+    vector = [0.5, -1.25, 3.0, 1e-3]
+    packed = manager.pack_vector(vector)
+    assert packed == manager.pack_vector(array("f", vector)) == struct.pack("<4f", *vector)
+
+    unpacked, raw = manager.unpack_vector(base64.b64encode(packed))
+    assert raw == packed
+    assert unpacked == pytest.approx(vector)
+
+
+def test_unpack_rejects_partial_floats():
+    with pytest.raises(ValueError):
+        manager.unpack_vector(base64.b64encode(b"\0" * 6))
+
+
+def test_base64_search_vector_correlates_with_json_embedding(monkeypatch):
+    monkeypatch.setattr(manager, "query_cache", manager.QueryCache(max_size=10, ttl_seconds=60))
+    vector = [0.1, 0.2, 0.3]
+    encoded = base64.b64encode(manager.pack_vector(vector)).decode()
+
+    async def main():
+        await manager.query_cache.store(vector, "parse config")
+        body = {"vector": {"name": "code", "vector": encoded}}
+        return body, await manager.correlate_search_vector(body)
+
+    body, query_text = asyncio.run(main())
+    assert query_text == "parse config"
+    # Decoded in place so Qdrant gets a plain float list
+    assert body["vector"]["vector"] == pytest.approx(vector)